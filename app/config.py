@@ -3,7 +3,8 @@ from configparser import ConfigParser
 from urllib.parse import quote_plus as url_quote
 import os
 from misc.t_dcs import ControlMapper
-from misc.gdrive import GDrive
+from misc.gdrive import GDrive, PilotCache, DEFAULT_PILOTS_REFRESH
+from app.mission_index import MissionIndex, DEFAULT_REFRESH_INTERVAL
 
 DEBUG = True
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -88,6 +89,10 @@ DCS_DB_META = MetaData(bind=dcs_engine)
 DCS_MISSION_TABLE = Table('missions', DCS_DB_META, autoload_with=dcs_engine)
 DCS_MODULE_TABLE = Table('modules', DCS_DB_META, autoload_with=dcs_engine)
 DCS_M_M_TABLE = Table('mission_module_count', DCS_DB_META, autoload_with=dcs_engine)
+DCS_MISSION_INDEX = MissionIndex(
+    DCS_DB_META,
+    config.getint('dcs', 'index_refresh', fallback=DEFAULT_REFRESH_INTERVAL),
+)
 
 
 #ARMADA_DB_META = MetaData(bind=armada_engine, reflect=True)
@@ -111,3 +116,7 @@ GDRIVE = GDrive(
     conf['gdrive']['refresh_token'],
     conf['gdrive']['access_token'],
 )
+GDRIVE_PILOTS = PilotCache(
+    GDRIVE,
+    config.getint('gdrive', 'pilots_refresh', fallback=DEFAULT_PILOTS_REFRESH),
+)
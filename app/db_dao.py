@@ -1,5 +1,5 @@
 from configparser import ConfigParser
-from sqlalchemy import select, and_, delete
+from sqlalchemy import select, and_, or_, delete, func
 from sqlalchemy.orm.exc import NoResultFound
 from datetime import datetime
 
@@ -348,3 +348,139 @@ class GameDao:
 class FleetDao:
     def __init__(self):
         pass
+
+
+class MissionDao:
+    def __init__(self, dcs_db_meta):
+        self.tables = {
+            'missions': dcs_db_meta.tables['missions'],
+            'modules': dcs_db_meta.tables['modules'],
+            'map': dcs_db_meta.tables['mission_module_count'],
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def matching_missions(self, pilot_mapping):
+        """
+        Subquery of the missions which have every requested module, each with at least the requested number of slots
+        :param pilot_mapping:
+            DICT of module ID -> INT slots needed
+        :return:
+            subquery of (mission_id, total_slots), total_slots being the mission's slots of every module
+        """
+        module_map = self.tables['map']
+        # the index on module_id narrows this down to the missions with any of the modules
+        candidates = select([
+            module_map.c.mission_id,
+        ]).where(
+            or_(*[
+                and_(module_map.c.module_id == module, module_map.c.module_count >= count)
+                for module, count in pilot_mapping.items()
+            ])
+        ).group_by(
+            module_map.c.mission_id,
+        ).having(
+            func.count(module_map.c.module_id.distinct()) == len(pilot_mapping)
+        )
+        return select([
+            module_map.c.mission_id,
+            func.sum(module_map.c.module_count).label('total_slots'),
+        ]).where(
+            module_map.c.mission_id.in_(candidates)
+        ).group_by(
+            module_map.c.mission_id,
+        ).subquery('matches')
+
+    def search_missions(self, pilot_mapping, max_slots):
+        """
+        Find the missions which fit a group of pilots, in two queries however many missions there are
+        :param pilot_mapping:
+            DICT of module ID -> INT slots needed
+        :param max_slots:
+            INT most slots a mission may have in total
+        :return:
+            DICT of
+                mission_count: INT missions in total
+                match_count: INT missions with the requested modules
+                missions: LIST of DICTs of the matches within max_slots, fewest slots first
+        """
+        missions = self.tables['missions']
+        modules = self.tables['modules']
+        module_map = self.tables['map']
+        mission_count = select([func.count()]).select_from(missions).scalar_subquery()
+        if not pilot_mapping:
+            # nothing to match on
+            return {
+                'mission_count': select([mission_count]).execute().scalar(),
+                'match_count': 0,
+                'missions': [],
+            }
+        matches = self.matching_missions(pilot_mapping)
+
+        counts = select([
+            mission_count.label('mission_count'),
+            func.count().label('match_count'),
+        ]).select_from(matches).execute().fetchone()
+
+        # one row per module of each match
+        results = select([
+            missions.c.id,
+            missions.c.name.label('mission_name'),
+            missions.c.map,
+            missions.c.start_time,
+            missions.c.ed_id,
+            missions.c.ed_upload_date,
+            matches.c.total_slots,
+            modules.c.name.label('module_name'),
+            module_map.c.module_count,
+        ]).select_from(
+            matches.join(
+                missions,
+                missions.c.id == matches.c.mission_id,
+            ).join(
+                module_map,
+                module_map.c.mission_id == matches.c.mission_id,
+            ).join(
+                modules,
+                modules.c.id == module_map.c.module_id,
+            )
+        ).where(
+            matches.c.total_slots <= max_slots
+        ).order_by(
+            matches.c.total_slots,
+            missions.c.id,
+        ).execute().fetchall()
+
+        matched_details = []
+        details = None
+        for result in results:
+            if details is None or details['id'] != result.id:
+                details = {
+                    'terrain': result.map,
+                    'time': result.start_time,
+                    'factions': {
+                        'blue': {
+                            'aircraft': {},
+                        },
+                        'red': {
+                            'aircraft': {},
+                        },
+                    },
+                    'total_slots': int(result.total_slots),
+                    'id': result.id,
+                    'name': result.mission_name,
+                    'ed_id': result.ed_id,
+                    'ed_date': result.ed_upload_date,
+                }
+                matched_details.append(details)
+            details['factions']['blue']['aircraft'][result.module_name] = result.module_count
+
+        return {
+            'mission_count': counts.mission_count,
+            'match_count': counts.match_count,
+            'missions': matched_details,
+        }
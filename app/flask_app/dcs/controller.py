@@ -7,10 +7,13 @@ from sqlalchemy import select, and_
 import arrow
 import os
 from misc.t_dcs import MissionSearcher
+from misc.gdrive import owned_modules
 import zipfile
 import io
+import itertools
 from pathlib import Path
 from app import config
+from app.mission_index import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 dcs = Blueprint(
     'dcs',
@@ -86,102 +89,106 @@ def list_missions():
             pilot_mapping[int(module)] = desired_count[x]
         print(pilot_mapping)
 
-        # ok, now build a list of slots available in the mission
-        results = select([
-            config.DCS_MISSION_TABLE.c.id,
-        ]).execute().fetchall()
-
-        missions = [x.id for x in results]
-        # how many missions have the _slots_ we desire
-        match_count = 0
-
-        matched_details = []
-        # select details for matched missions
-        for mission in missions:
-            results = select([
-                config.DCS_MISSION_TABLE.c.id,
-                config.DCS_MISSION_TABLE.c.name.label('mission_name'),
-                config.DCS_MISSION_TABLE.c.map,
-                config.DCS_MISSION_TABLE.c.start_time,
-                config.DCS_MISSION_TABLE.c.ed_id,
-                config.DCS_MISSION_TABLE.c.ed_upload_date,
-            ]).where(
-                config.DCS_MISSION_TABLE.c.id == mission
-            ).execute().fetchall()
-            for result in results:
-                details = {
-                    'terrain': result.map,
-                    'time': result.start_time,
-                    'factions': {
-                        'blue': {
-                            'aircraft': {},
-                        },
-                        'red': {
-                            'aircraft': {},
-                        },
-                    },
-                    'total_slots': 0,
-                    'id': result.id,
-                    'name': result.mission_name,
-                    'ed_id': result.ed_id,
-                    'ed_date': result.ed_upload_date,
-                }
-                # get aircraft in the mission
-                raw_planes = select([
-                    config.DCS_MODULE_TABLE.c.id,
-                    config.DCS_MODULE_TABLE.c.name,
-                    config.DCS_M_M_TABLE.c.module_count,
-                ]).select_from(
-                    config.DCS_MODULE_TABLE.join(
-                        config.DCS_M_M_TABLE,
-                        config.DCS_MODULE_TABLE.c.id == config.DCS_M_M_TABLE.c.module_id,
-                    )
-                ).where(
-                    config.DCS_M_M_TABLE.c.mission_id == mission
-                ).execute().fetchall()
-
-                met_criteria = None
-
-                parsed_planes = {}
-                for plane in raw_planes:
-                    parsed_planes[plane.id] = {
-                        'name': plane.name,
-                        'count': plane.module_count,
-                    }
-
-                for module, desired_module_count in pilot_mapping.items():
-                    # check if it's in the mission, if it has the count, AND if we haven't already failed to meet these criteria
-                    if module in parsed_planes.keys() and parsed_planes[module]['count'] >= desired_module_count:
-                        if met_criteria is None:
-                            # avoid setting it to true if we've already set it to false
-                            met_criteria = True
-                    else:
-                        met_criteria = False
-                if met_criteria:
-                    match_count += 1
-                for plane in raw_planes:
-                    details['factions']['blue']['aircraft'][plane.name] = plane.module_count
-                    details['total_slots'] += plane.module_count
-                if details['total_slots'] > desired_cap or not met_criteria:
-                    continue
-                matched_details.append(details)
-        matched_details = sorted(matched_details, key=lambda k: k['total_slots'])
-        mission_count = len(select([config.DCS_MISSION_TABLE.c.id]).execute().fetchall())
-        print("found a total of {} missions".format(len(matched_details)))
+        return search_response(pilot_mapping, desired_cap)
 
+
+@dcs.route('/missions/roster', methods=['GET', 'POST'])
+def roster_missions():
+    """
+    Who can fly what: the missions which can seat every selected pilot in a module they own, per the ownership sheets
+    """
+    pilots, _ = config.GDRIVE_PILOTS.get_pilots()
+    if request.method == 'GET':
+        return render_template(
+            'dcs/mission_filter.html',
+            pilots=pilots,
+        )
+    context = request.json['context']
+    if context not in pilots:
+        return "Unknown pilot grouping {}".format(context), 400
+    roster = {}
+    for pilot in request.json['pilot'] or []:
+        if pilot not in pilots[context]:
+            return "Unknown pilot {}".format(pilot), 400
+        roster[pilot] = owned_modules(pilots[context][pilot])
+    desired_cap = len(roster) + int(request.json['cap'])
+
+    return search_response({}, desired_cap, roster)
+
+
+def search_response(pilot_mapping, desired_cap, roster=None):
+    """
+    Search the in-memory index of every mission's slots rather than querying the DB, paged as the request asks
+    :param pilot_mapping:
+        DICT of module ID -> INT slots needed
+    :param desired_cap:
+        INT most slots a mission may have in total
+    :param roster:
+        DICT of pilot -> LIST of module names they own; searches for the missions which seat them instead
+    :return:
+        Response
+    """
+    # paging: the sort order, the cursor of the previous page (if any) and the page size
+    sort = request.json.get('sort', 'slots')
+    cursor = request.json.get('cursor')
+    limit = request.json.get('limit', DEFAULT_PAGE_SIZE)
+    # bool is an int too, but not a page size
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= MAX_PAGE_SIZE:
+        return "Invalid page size {!r}, expected a whole number from 1 to {}".format(limit, MAX_PAGE_SIZE), 400
+
+    if request.json.get('stream'):
+        # one JSON object per line: the counts, then every matching mission from the cursor on
+        try:
+            results = config.DCS_MISSION_INDEX.iter_missions(pilot_mapping, desired_cap, sort, cursor, roster)
+            first = next(results)
+        except ValueError as e:
+            return str(e), 400
         return Response(
-            json.dumps({
-                'status': render_template(
-                    'dcs/mission_filter_results.html',
-                    missions=matched_details,
-                    mission_count=mission_count,
-                    match_count=match_count,
-                    match_count_filtered=len(matched_details),
-                )
-            }),
-            mimetype='application/json'
+            stream_ndjson(itertools.chain([first], results)),
+            mimetype='application/x-ndjson',
         )
 
+    try:
+        results = config.DCS_MISSION_INDEX.search_page(pilot_mapping, desired_cap, sort, cursor, limit, roster)
+    except ValueError as e:
+        return str(e), 400
+    matched_details = results['missions']
+    print("found a total of {} missions, returning {}".format(results['filtered_count'], len(matched_details)))
+
+    if cursor:
+        # a further page: only its rows, to add to the table the first page rendered
+        status = render_template(
+            'dcs/mission_filter_rows.html',
+            missions=matched_details,
+        )
+    else:
+        status = render_template(
+            'dcs/mission_filter_results.html',
+            missions=matched_details,
+            mission_count=results['mission_count'],
+            match_count=results['match_count'],
+            match_count_filtered=results['filtered_count'],
+            next_cursor=results['next_cursor'],
+        )
+    return Response(
+        json.dumps({
+            'status': status,
+            'next_cursor': results['next_cursor'],
+        }),
+        mimetype='application/json'
+    )
+
+
+def stream_ndjson(rows):
+    """
+    :param rows:
+        iterable of DICTs
+    :return:
+        generator of lines of JSON, one per DICT
+    """
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
+
 
 @dcs.route('/stats', methods=['GET'])
 def mission_stats():
@@ -0,0 +1,500 @@
+import base64
+import json
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import select, func
+
+from misc.dcs.missions import get_unit
+from misc.t_dcs import MissionSearcher
+
+# seconds between checks for newly ingested missions
+DEFAULT_REFRESH_INTERVAL = 60
+# columns of the missions table which the search results show
+DETAIL_COLUMNS = ['name', 'map', 'start_time', 'ed_id', 'ed_upload_date']
+# orders search results can be put in: fewest slots, newest on the ED site, or by map name
+SORTS = ['slots', 'date', 'map']
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class MissionMatrix:
+    """
+    Snapshot of every mission's slots: a dense missions x modules matrix of slot counts, plus per-mission arrays of the
+    total slots and of the columns the search results show. Row n of every array is the mission ids[n]; ids are
+    ascending. A snapshot is never modified, so searches can use one while a newer one is being built.
+    """
+    def __init__(self, ids, counts, totals, details, columns):
+        """
+        :param ids:
+            int64 array of mission IDs
+        :param counts:
+            uint16 matrix of slots, one row per mission and one column per module
+        :param totals:
+            int32 array of each mission's slots over every module
+        :param details:
+            DICT of column name (name, map, start_time, ed_id, ed_upload_date) -> object array
+        :param columns:
+            LIST of the module IDs of the matrix's columns
+        """
+        self.ids = ids
+        self.counts = counts
+        self.totals = totals
+        self.details = details
+        self.columns = columns
+        self.column_of = {module: n for n, module in enumerate(columns)}
+        # ascending sort key per mission for each of SORTS; ties go by ID. Missions without an upload date come last
+        uploaded = [-int(x.timestamp()) if x else 1 for x in details['ed_upload_date']]
+        self.keys = {
+            'slots': totals,
+            'date': np.array(uploaded, dtype=np.int64),
+            'map': details['map'].astype(str),
+        }
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.zeros(0, dtype=np.int64),
+            np.zeros((0, 0), dtype=np.uint16),
+            np.zeros(0, dtype=np.int32),
+            {name: np.zeros(0, dtype=object) for name in DETAIL_COLUMNS},
+            [],
+        )
+
+    def extend(self, missions, module_counts):
+        """
+        A snapshot with more missions added
+        :param missions:
+            LIST of rows of the missions table (id + DETAIL_COLUMNS), none of them in this snapshot yet
+        :param module_counts:
+            LIST of rows of the mission_module_count table (mission_id, module_id, module_count) of those missions
+        :return:
+            MissionMatrix
+        """
+        missions = sorted(missions, key=lambda x: x.id)
+        new_ids = np.array([x.id for x in missions], dtype=np.int64)
+        columns = list(self.columns)
+        column_of = dict(self.column_of)
+        for row in module_counts:
+            if row.module_id not in column_of:
+                column_of[row.module_id] = len(columns)
+                columns.append(row.module_id)
+
+        new_counts = np.zeros((len(missions), len(columns)), dtype=np.uint16)
+        new_totals = np.zeros(len(missions), dtype=np.int32)
+        if module_counts:
+            mission_ids = np.array([x.mission_id for x in module_counts], dtype=np.int64)
+            rows = np.minimum(np.searchsorted(new_ids, mission_ids), len(new_ids) - 1)
+            cols = np.array([column_of[x.module_id] for x in module_counts], dtype=np.intp)
+            slots = np.array([x.module_count for x in module_counts], dtype=np.int64)
+            # leave out rows whose mission isn't among the new ones
+            known = new_ids[rows] == mission_ids
+            rows, cols, slots = rows[known], cols[known], slots[known]
+            # a module listed twice for a mission keeps its larger count, as the SQL search does; the total has both
+            np.maximum.at(new_counts, (rows, cols), np.minimum(slots, np.iinfo(np.uint16).max).astype(np.uint16))
+            np.add.at(new_totals, rows, slots.astype(np.int32))
+
+        # the old rows get zero columns for modules first seen in the new missions
+        counts = np.zeros((len(self.ids) + len(missions), len(columns)), dtype=np.uint16, order='F')
+        counts[:len(self.ids), :len(self.columns)] = self.counts
+        counts[len(self.ids):] = new_counts
+        details = {}
+        for name in DETAIL_COLUMNS:
+            values = np.empty(len(missions), dtype=object)
+            values[:] = [getattr(x, name) for x in missions]
+            details[name] = np.concatenate([self.details[name], values])
+        return MissionMatrix(
+            np.concatenate([self.ids, new_ids]),
+            counts,
+            np.concatenate([self.totals, new_totals]),
+            details,
+            columns,
+        )
+
+    def match(self, pilot_mapping):
+        """
+        :param pilot_mapping:
+            DICT of module ID -> INT slots needed
+        :return:
+            BOOL array, True for the missions with every requested module, each with at least the requested slots
+        """
+        if not pilot_mapping:
+            # nothing to match on
+            return np.zeros(len(self.ids), dtype=bool)
+        mask = np.ones(len(self.ids), dtype=bool)
+        for module, count in pilot_mapping.items():
+            if module not in self.column_of:
+                # no mission has the module at all
+                return np.zeros(len(self.ids), dtype=bool)
+            mask &= self.counts[:, self.column_of[module]] >= count
+        return mask
+
+
+class MissionIndex:
+    """
+    In-memory index of the missions' slots for the mission search (see MissionMatrix).
+
+    The index is loaded on the first search. After that, a search which finds the index older than refresh_interval
+    first loads the missions added since: missions are only ever added (a re-upload with new content gets a new row,
+    one with the same content keeps its slots), so only rows with a higher ID than the newest one loaded are read. If
+    the missions up to the newest one then don't add up to what's loaded (their number, the sum of their IDs or the
+    sum of their slots differ), e.g. missions were deleted and others took their place, the whole index is loaded
+    again.
+    """
+    def __init__(self, dcs_db_meta, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        """
+        :param dcs_db_meta:
+            MetaData of the DCS database
+        :param refresh_interval:
+            INT seconds a loaded index is used before checking for new missions
+        """
+        self.tables = {
+            'missions': dcs_db_meta.tables['missions'],
+            'modules': dcs_db_meta.tables['modules'],
+            'map': dcs_db_meta.tables['mission_module_count'],
+        }
+        self.refresh_interval = refresh_interval
+        self.matrix = None
+        self.module_names = {}
+        self.refreshed = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Read every mission into a new index
+        """
+        with self.lock:
+            self.matrix = self.read(MissionMatrix.empty())
+            self.refreshed = time.monotonic()
+
+    def refresh(self, wait=True):
+        """
+        Add the missions ingested since the index was loaded
+        :param wait:
+            BOOL wait for a refresh which is already running; otherwise return at once
+        :return:
+            INT missions added
+        """
+        if not self.lock.acquire(blocking=wait):
+            return 0
+        try:
+            matrix = self.matrix or MissionMatrix.empty()
+            updated = self.read(matrix)
+            if self.summary(updated) != self.db_summary(updated):
+                updated = self.read(MissionMatrix.empty())
+            self.matrix = updated
+            self.refreshed = time.monotonic()
+            return len(updated.ids) - len(matrix.ids)
+        finally:
+            self.lock.release()
+
+    @staticmethod
+    def summary(matrix):
+        """
+        :return:
+            TUPLE of the number of missions in the matrix, the sum of their IDs and the sum of their slots
+        """
+        return len(matrix.ids), int(matrix.ids.sum()), int(matrix.totals.sum())
+
+    def db_summary(self, matrix):
+        """
+        The same as summary, from the DB, for the missions up to the newest one in the matrix (newer ones are left for
+        the next refresh)
+        """
+        missions = self.tables['missions']
+        module_map = self.tables['map']
+        newest = int(matrix.ids[-1]) if len(matrix.ids) else 0
+        count, id_sum = select([
+            func.count(),
+            func.coalesce(func.sum(missions.c.id), 0),
+        ]).select_from(
+            missions
+        ).where(
+            missions.c.id <= newest
+        ).execute().fetchone()
+        slot_sum = select([
+            func.coalesce(func.sum(module_map.c.module_count), 0),
+        ]).select_from(
+            module_map
+        ).where(
+            module_map.c.mission_id <= newest
+        ).execute().scalar()
+        return count, int(id_sum), int(slot_sum)
+
+    def read(self, matrix):
+        """
+        :return:
+            the matrix extended with the missions newer than its newest one
+        """
+        missions = self.tables['missions']
+        module_map = self.tables['map']
+        newest = int(matrix.ids[-1]) if len(matrix.ids) else 0
+        self.module_names = {
+            x.id: x.name for x in select([self.tables['modules'].c.id, self.tables['modules'].c.name]).execute()
+        }
+        rows = select(
+            [missions.c.id] + [missions.c[name] for name in DETAIL_COLUMNS]
+        ).where(
+            missions.c.id > newest
+        ).order_by(
+            missions.c.id,
+        ).execute().fetchall()
+        if not rows:
+            return matrix
+        counts = select([
+            module_map.c.mission_id,
+            module_map.c.module_id,
+            module_map.c.module_count,
+        ]).where(
+            module_map.c.mission_id > newest
+        ).where(
+            # missions stored after the first query are left for the next refresh
+            module_map.c.mission_id <= rows[-1].id
+        ).execute().fetchall()
+        return matrix.extend(rows, counts)
+
+    def current(self):
+        """
+        :return:
+            MissionMatrix, loaded or refreshed first if need be
+        """
+        if self.matrix is None:
+            self.load()
+        elif time.monotonic() - self.refreshed > self.refresh_interval:
+            # searches made while another one refreshes the index use it as it is
+            self.refresh(wait=False)
+        return self.matrix
+
+    def search_missions(self, pilot_mapping, max_slots):
+        """
+        Find the missions which fit a group of pilots; same results as MissionDao.search_missions
+        :param pilot_mapping:
+            DICT of module ID -> INT slots needed
+        :param max_slots:
+            INT most slots a mission may have in total
+        :return:
+            DICT of
+                mission_count: INT missions in total
+                match_count: INT missions with the requested modules
+                missions: LIST of DICTs of the matches within max_slots, fewest slots first
+        """
+        matrix, match_count, rows = self.find(pilot_mapping, max_slots)
+        return {
+            'mission_count': len(matrix.ids),
+            'match_count': match_count,
+            'missions': [self.mission_details(matrix, row) for row in rows],
+        }
+
+    def search_page(self, pilot_mapping, max_slots, sort='slots', cursor=None, limit=DEFAULT_PAGE_SIZE, roster=None):
+        """
+        One page of the missions which fit a group of pilots. Only the page's missions are built, so the cost of a
+        page doesn't grow with the number of matches
+        :param pilot_mapping:
+            DICT of module ID -> INT slots needed
+        :param max_slots:
+            INT most slots a mission may have in total
+        :param sort:
+            STR one of SORTS
+        :param cursor:
+            STR next_cursor of the previous page, None for the first page
+        :param limit:
+            INT missions per page, 1 to MAX_PAGE_SIZE
+        :param roster:
+            DICT of pilot -> LIST of the names of the modules they own. If given, the missions are the ones which can
+            seat every pilot (see match_roster) rather than the ones with the slots of pilot_mapping
+        :return:
+            DICT of
+                mission_count: INT missions in total
+                match_count: INT missions with the requested modules (or which seat the roster)
+                filtered_count: INT of those within max_slots
+                missions: LIST of DICTs of the page's missions
+                next_cursor: STR to pass for the next page, None on the last page
+        """
+        if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError("Invalid page size {!r}, expected a whole number from 1 to {}".format(limit, MAX_PAGE_SIZE))
+        matrix, match_count, rows = self.find(pilot_mapping, max_slots, sort, roster)
+        remaining = rows[after_cursor(matrix, rows, sort, cursor)]
+        page = remaining[:limit]
+        next_cursor = None
+        if len(remaining) > limit:
+            next_cursor = encode_cursor(sort, matrix.keys[sort][page[-1]], matrix.ids[page[-1]])
+        return {
+            'mission_count': len(matrix.ids),
+            'match_count': match_count,
+            'filtered_count': len(rows),
+            'missions': [self.mission_details(matrix, row) for row in page],
+            'next_cursor': next_cursor,
+        }
+
+    def iter_missions(self, pilot_mapping, max_slots, sort='slots', cursor=None, roster=None):
+        """
+        Like search_page, but yields every mission from the cursor on as it is built
+        :return:
+            generator of DICTs: first the counts (mission_count, match_count, filtered_count), then one per mission
+        """
+        matrix, match_count, rows = self.find(pilot_mapping, max_slots, sort, roster)
+        yield {
+            'mission_count': len(matrix.ids),
+            'match_count': match_count,
+            'filtered_count': len(rows),
+        }
+        for row in rows[after_cursor(matrix, rows, sort, cursor)]:
+            yield self.mission_details(matrix, row)
+
+    def find(self, pilot_mapping, max_slots, sort='slots', roster=None):
+        """
+        :return:
+            (MissionMatrix searched, INT missions with the requested modules, int array of the rows of those within
+            max_slots, in the order of sort)
+        """
+        if sort not in SORTS:
+            raise ValueError("Unknown sort {}, expected one of {}".format(sort, ', '.join(SORTS)))
+        matrix = self.current()
+        if roster is not None:
+            mask = self.match_roster(matrix, roster)
+        else:
+            mask = matrix.match(pilot_mapping)
+        match_count = int(np.count_nonzero(mask))
+        rows = np.flatnonzero(mask & (matrix.totals <= max_slots))
+        rows = rows[np.lexsort((matrix.ids[rows], matrix.keys[sort][rows]))]
+        return matrix, match_count, rows
+
+    def match_roster(self, matrix, roster):
+        """
+        Find the missions which can seat every pilot of a roster in a module they own, for all missions at once:
+            * only the columns of modules someone owns matter, and a column's slots only up to the number of pilots
+              who own the module
+            * vectorised necessary conditions drop most missions (see roster_candidates)
+            * the missions left often have the same slots in those columns, so each distinct set of slots is solved
+              once, with MissionSearcher.fits
+        :param roster:
+            DICT of pilot -> LIST of the names of the modules they own
+        :return:
+            BOOL array, True for the missions which seat the roster
+        """
+        mask = np.zeros(len(matrix.ids), dtype=bool)
+        candidates, slots, pilot_mapping = self.roster_candidates(matrix, roster)
+        if not len(candidates):
+            return mask
+        distinct, which = np.unique(slots[candidates], axis=0, return_inverse=True)
+        fits = np.array([
+            MissionSearcher(pilot_mapping, dict(enumerate(row.tolist()))).fits() for row in distinct
+        ], dtype=bool)
+        mask[candidates[fits[which.ravel()]]] = True
+        return mask
+
+    def roster_candidates(self, matrix, roster):
+        """
+        The missions which pass the necessary conditions for seating a roster: enough slots in all, and for each set
+        of modules some pilot owns, at least as many slots in it as there are pilots who own nothing outside it (Hall)
+        :param roster:
+            DICT of pilot -> LIST of the names of the modules they own, as the ownership sheets call them
+        :return:
+            INT array of the rows of the missions left,
+            INT array of every mission's slots in the columns of the roster's modules, capped at the pilots who own
+            each module,
+            DICT of pilot -> LIST of the positions of their modules in those columns
+        """
+        nothing = np.zeros(0, dtype=np.intp), np.zeros((len(matrix.ids), 0), dtype=np.int32), {}
+        if not roster:
+            return nothing
+        column_of_name = {}
+        for column, module in enumerate(matrix.columns):
+            column_of_name[self.module_names.get(module)] = column
+        # pilot -> the matrix columns of their modules
+        owned = {}
+        for pilot, modules in roster.items():
+            names = (sheet_to_db_name(x) for x in modules)
+            owned[pilot] = {column_of_name[x] for x in names if x in column_of_name}
+        if not all(owned.values()):
+            # someone owns nothing any mission has
+            return nothing
+
+        columns = sorted(set().union(*owned.values()))
+        position = {column: n for n, column in enumerate(columns)}
+        owners = np.zeros(len(columns), dtype=np.int32)
+        for modules in owned.values():
+            owners[[position[x] for x in modules]] += 1
+        slots = np.minimum(matrix.counts[:, columns], owners).astype(np.int32)
+
+        mask = slots.sum(axis=1) >= len(roster)
+        for modules in set(frozenset(x) for x in owned.values()):
+            pilots = sum(1 for x in owned.values() if x <= modules)
+            mask &= slots[:, [position[x] for x in modules]].sum(axis=1) >= pilots
+        pilot_mapping = {pilot: [position[x] for x in modules] for pilot, modules in owned.items()}
+        return np.flatnonzero(mask), slots, pilot_mapping
+
+    def mission_details(self, matrix, row):
+        """
+        :return:
+            DICT of a mission as the results template shows it
+        """
+        details = matrix.details
+        aircraft = {}
+        for column in np.flatnonzero(matrix.counts[row]):
+            aircraft[self.module_names.get(matrix.columns[column])] = int(matrix.counts[row, column])
+        return {
+            'terrain': details['map'][row],
+            'time': details['start_time'][row],
+            'factions': {
+                'blue': {
+                    'aircraft': aircraft,
+                },
+                'red': {
+                    'aircraft': {},
+                },
+            },
+            'total_slots': int(matrix.totals[row]),
+            'id': int(matrix.ids[row]),
+            'name': details['name'][row],
+            'ed_id': details['ed_id'][row],
+            'ed_date': details['ed_upload_date'][row],
+        }
+
+
+def sheet_to_db_name(module):
+    """
+    :param module:
+        name of a module as the ownership sheets call it, e.g. A-10C_2
+    :return:
+        the name the modules table gives it (see get_unit), e.g. A-10C II; names the two agree on are kept
+    """
+    try:
+        return get_unit(module, False)
+    except KeyError:
+        return module
+
+
+def encode_cursor(sort, key, mission_id):
+    """
+    :return:
+        STR token for the page after the mission with the given sort key and ID
+    """
+    key = key.item() if isinstance(key, np.generic) else key
+    token = json.dumps([sort, key, int(mission_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+
+
+def after_cursor(matrix, rows, sort, cursor):
+    """
+    The cursor holds the last mission's sort key and ID rather than a position, so missions added in between don't
+    shift the following pages
+    :param rows:
+        int array of rows in the order of sort
+    :return:
+        bool array, True for the rows after the cursor's mission
+    """
+    if not cursor:
+        return np.ones(len(rows), dtype=bool)
+    try:
+        cursor_sort, key, mission_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError("The cursor is for results sorted by {}, not {}".format(cursor_sort, sort))
+    keys = matrix.keys[sort][rows]
+    try:
+        return (keys > key) | ((keys == key) & (matrix.ids[rows] > mission_id))
+    except TypeError:
+        raise ValueError("Invalid cursor")
@@ -0,0 +1 @@
+# benchmarks for the mission ingestion and search code
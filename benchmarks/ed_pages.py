@@ -0,0 +1,227 @@
+"""
+Compare the CPU time of extracting mission data from ED pages with BeautifulSoup trees and with misc/dcs/ed_pages
+
+    python -m benchmarks.ed_pages [--listing page.html ...] [--details page.html ...] [--repeat N]
+
+Without saved pages, synthetic ones laid out like the ED file pages are used. Both extractions must agree on every
+page, otherwise the run fails (exit status 1).
+"""
+import argparse
+import random
+import sys
+import time
+
+from bs4 import BeautifulSoup as bs
+
+from misc.dcs import ed_pages
+
+HEADER = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<title>DCS World - User Files</title>
+<link rel="stylesheet" href="/local/templates/dcs/css/main.css">
+<script src="/local/templates/dcs/js/main.js"></script>
+</head>
+<body>
+<nav class="navbar navbar-expand-lg">
+{menu}
+</nav>
+<div class="container">
+'''
+FOOTER = '''</div>
+<footer class="footer">
+<p>&copy; 2009-2024 Eagle Dynamics SA &mdash; All rights reserved</p>
+{menu}
+</footer>
+</body>
+</html>
+'''
+MENU = ''.join('<li class="nav-item"><a class="nav-link" href="/en/{0}/">{0}</a></li>\n'.format(item) for item in (
+    'news', 'products', 'files', 'community', 'support', 'shop', 'forum', 'downloads', 'about',
+))
+ENTRY = '''<div class="row file-item">
+  <div class="col-md-2"><img src="/upload/iblock/{m_id}/preview.jpg" alt="{name}" width="140"></div>
+  <div class="col-md-8">
+    <h5><a href="/en/files/{m_id}/">{name}</a></h5>
+    <p class="author">Author: <a href="/en/files/?author={author}">{author}</a></p>
+    <p class="description">{description}</p>
+    <ul class="list-inline tags"><li>Multiplayer</li><li>English</li><li>{theatre}</li></ul>
+  </div>
+  <div class="col-md-2 text-right">
+    <span class="date">Date - {date}</span><br>
+    <span class="rating">&#9733; {rating}</span><br>
+    <a class="btn btn-primary download" data-id="{m_id}" href="/upload/iblock/{m_id}/{name}.zip">Download</a>
+  </div>
+</div>
+'''
+PAGER = '''<ul class="pagination">
+{links}
+</ul>
+'''
+DETAILS = '''<div class="row file-details">
+  <div class="col-md-8">
+    <h1>{name}</h1>
+    <div class="description">{description}</div>
+    <div class="gallery">{gallery}</div>
+    <ul class="list-unstyled">
+      <li>Type - Multiplayer</li>
+      <li>Language - English</li>
+      <li>Theatre - {theatre}</li>
+    </ul>
+  </div>
+  <div class="col-md-4">
+    <p class="author">Author - <a href="/en/files/?author={author}">{author}</a></p>
+    <p><span class="date">Date - {date}</span></p>
+    <p>Size - 1.2 Mb</p>
+    <a class="btn btn-primary download" data-id="{m_id}" href="/upload/iblock/{m_id}/{name}.zip">Download</a>
+    <a class="btn btn-secondary" href="/en/files/?author={author}">More from the author</a>
+  </div>
+</div>
+<div class="comments">{comments}</div>
+'''
+WORDS = ['strike', 'package', 'escort', 'CAP', 'SEAD', 'convoy', 'airfield', 'carrier', 'night', 'training', 'the',
+         'and', 'with', 'enemy', 'flight', 'of', 'four', 'Hornets', 'Vipers', 'Tomcats', 'over', 'Caucasus', 'Syria']
+
+
+def text(rand, words):
+    return ' '.join(rand.choice(WORDS) for _ in range(words))
+
+
+def entry_fields(rand, m_id):
+    return {
+        'm_id': m_id,
+        'name': text(rand, 4).replace(' ', '_'),
+        'author': 'pilot{}'.format(rand.randint(1, 5000)),
+        'description': text(rand, 60),
+        'theatre': rand.choice(['Caucasus', 'Syria', 'Persian Gulf', 'Nevada', 'Marianas']),
+        'date': '{:02d}/{:02d}/2023 {:02d}:{:02d}:{:02d}'.format(
+            rand.randint(1, 12), rand.randint(1, 28), rand.randint(0, 23), rand.randint(0, 59), rand.randint(0, 59)),
+        'rating': rand.randint(1, 5),
+    }
+
+
+def listing_page(first_id=3400000, per_page=100, page=1, num_pages=120, seed=1):
+    """
+    A page of the ED file listing, newest first
+    :return:
+        STR of HTML
+    """
+    rand = random.Random(seed)
+    entries = ''.join(ENTRY.format(**entry_fields(rand, first_id - i)) for i in range(per_page))
+    links = ['<li class="page-item"><a class="page-link" href="?PAGEN_1={0}">{0}</a></li>'.format(n)
+             for n in sorted({1, max(1, page - 1), page, min(num_pages, page + 1), num_pages})]
+    links.append('<li class="page-item"><a class="page-link" href="?PAGEN_1={}">&raquo;</a></li>'.format(
+        min(num_pages, page + 1)))
+    return HEADER.format(menu=MENU) + entries + PAGER.format(links='\n'.join(links)) + FOOTER.format(menu=MENU)
+
+
+def details_page(m_id=3400000, seed=1):
+    """
+    The details page of a mission
+    :return:
+        STR of HTML
+    """
+    rand = random.Random(seed)
+    fields = entry_fields(rand, m_id)
+    fields['description'] = ''.join('<p>{}</p>'.format(text(rand, 80)) for _ in range(6))
+    fields['gallery'] = ''.join('<img src="/upload/iblock/{}/{}.jpg" width="200">'.format(m_id, n) for n in range(8))
+    fields['comments'] = ''.join(
+        '<div class="comment"><span class="author">pilot{}</span><p>{}</p></div>'.format(n, text(rand, 30))
+        for n in range(40)
+    )
+    return HEADER.format(menu=MENU) + DETAILS.format(**fields) + FOOTER.format(menu=MENU)
+
+
+def soup_listing(page, last_downloaded):
+    """
+    What find_missions / extract_missions did before misc/dcs/ed_pages
+    """
+    soup = bs(page, 'html.parser')
+    num_pages = int(bs.find_all(soup, attrs={'class': 'page-link'})[-2].text)
+    missions = []
+    hit_limit = False
+    for entry in bs.find_all(soup, attrs={'class': 'download'}):
+        m_id = int(entry.attrs['data-id'])
+        if m_id > last_downloaded:
+            missions.append(m_id)
+        else:
+            hit_limit = True
+            break
+    return num_pages, missions, hit_limit
+
+
+def fast_listing(page, last_downloaded):
+    extractor = ed_pages.ListingExtractor(last_downloaded).extract(page)
+    return int(extractor.page_links[-2]), extractor.missions, extractor.hit_limit
+
+
+def soup_details(page):
+    """
+    What get_mission_metadata did before misc/dcs/ed_pages
+    """
+    soup = bs(page, 'html.parser')
+    date = bs.find_all(soup, attrs={'class': 'date'})[0].text
+    url = bs.find_all(soup, attrs={'class': ['btn', 'download']}, string='Download')[0].attrs['href']
+    return date, url
+
+
+def fast_details(page):
+    return ed_pages.mission_details(page)
+
+
+def best_of(repeat, func, *args):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = func(*args)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def compare(name, repeat, slow, fast, *args):
+    slow_time, slow_result = best_of(repeat, slow, *args)
+    fast_time, fast_result = best_of(repeat, fast, *args)
+    print("{:<40} soup {:8.2f} ms   ed_pages {:8.2f} ms   {:5.1f}x".format(
+        name, slow_time * 1000, fast_time * 1000, slow_time / fast_time))
+    if slow_result != fast_result:
+        print("  results differ: {!r} != {!r}".format(slow_result, fast_result))
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--listing', nargs='*', default=[], help='saved listing pages')
+    arg_parser.add_argument('--details', nargs='*', default=[], help='saved mission details pages')
+    arg_parser.add_argument('--last-downloaded', type=int, default=0,
+                            help='last_downloaded ID to extract saved listing pages with')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, the best is reported')
+    args = arg_parser.parse_args()
+
+    listings = []
+    details = []
+    for path in args.listing:
+        with open(path, encoding='utf-8') as f:
+            listings.append((path, f.read(), args.last_downloaded))
+    for path in args.details:
+        with open(path, encoding='utf-8') as f:
+            details.append((path, f.read()))
+    if not listings and not details:
+        page = listing_page()
+        listings = [
+            ('synthetic listing ({:.0f} KB)'.format(len(page) / 1024), page, 0),
+            ('synthetic listing, limit on entry 20', page, 3400000 - 20),
+        ]
+        page = details_page()
+        details = [('synthetic details ({:.0f} KB)'.format(len(page) / 1024), page)]
+
+    ok = True
+    for name, page, last_downloaded in listings:
+        ok &= compare(name, args.repeat, soup_listing, fast_listing, page, last_downloaded)
+    for name, page in details:
+        ok &= compare(name, args.repeat, soup_details, fast_details, page)
+    if not ok:
+        sys.exit(1)
@@ -0,0 +1,212 @@
+"""
+Run the ED ingestion pipeline (fetch -> download -> parse -> persist) against a stand-in for the ED website
+
+    python -m benchmarks.ed_pipeline [url] [--missions N] [--missing N] [--flaky N] [--parse-workers N]
+
+An http.server on localhost serves synthetic listing pages, details pages and .miz files laid out like the ED site's:
+    * --missing missions have no details page (404), so they fail
+    * --flaky missions' downloads answer 503 the first time, so they're retried and stored
+    * every tenth mission has a red coalition without units
+The pipeline stores the missions in the given database (by default a SQLite file in a temporary directory, where the
+batched upsert, which is MySQL only, falls back to storing one at a time), then runs a second time, when every
+download is conditional and comes back "not modified". The run fails (exit status 1) unless the stored, failed and
+unchanged counts and the rows in the database are what the stand-in should produce.
+"""
+import argparse
+import importlib
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import create_engine, func, select
+
+from benchmarks.ed_pages import details_page, listing_page
+from benchmarks.mission_search import create_tables
+from benchmarks.synthetic import AIRCRAFT, generate_mission, write_miz
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+NEWEST_ID = 3400000
+# missions per listing page, as find_missions asks for them
+PAGE_SIZE = 100
+
+
+def load_ingest():
+    """
+    misc/dcs modules import their siblings directly
+    :return:
+        DICT of module name -> module
+    """
+    sys.path.insert(0, os.path.join(ROOT, 'misc', 'dcs'))
+    names = ['ed_client', 'mission_cache', 'missions', 'pipeline', 'sources']
+    return {name: importlib.import_module(name) for name in names}
+
+
+class StandIn:
+    """
+    What the stand-in serves: missions NEWEST_ID down to NEWEST_ID - count + 1
+    """
+    def __init__(self, count, missing, flaky):
+        self.ids = [NEWEST_ID - n for n in range(count)]
+        # spread the missing and flaky missions over the listing
+        self.missing = set(self.ids[1::max(1, count // max(1, missing))][:missing])
+        self.flaky = set(m_id for m_id in self.ids[2::max(1, count // max(1, flaky))] if m_id not in self.missing)
+        self.flaky = set(sorted(self.flaky)[:flaky])
+        self.files = {}
+        self.failed_once = set()
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def listing(self, page):
+        num_pages = (len(self.ids) + PAGE_SIZE - 1) // PAGE_SIZE
+        first = (page - 1) * PAGE_SIZE
+        per_page = max(0, min(PAGE_SIZE, len(self.ids) - first))
+        return listing_page(NEWEST_ID - first, per_page, page, num_pages)
+
+    def mission_file(self, m_id):
+        with self.lock:
+            if m_id not in self.files:
+                unitless = ('red',) if m_id % 10 == 0 else ()
+                miz = io.BytesIO()
+                write_miz(miz, generate_mission(40, seed=m_id, categories=('plane', 'helicopter'),
+                                                units_per_group=2, waypoints=1, unitless=unitless))
+                self.files[m_id] = miz.getvalue()
+            return self.files[m_id]
+
+    def first_failure(self, m_id):
+        """
+        :return:
+            BOOL whether this is a flaky mission's first download
+        """
+        with self.lock:
+            if m_id in self.flaky and m_id not in self.failed_once:
+                self.failed_once.add(m_id)
+                return True
+            return False
+
+
+def make_handler(stand_in):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with stand_in.lock:
+                stand_in.requests += 1
+            # get_mission_metadata joins the base URL and the download link with a slash of its own
+            path = re.sub('^/+', '/', self.path)
+            if path.startswith('/en/files/filter/'):
+                page = int(re.search(r'PAGEN_1=(\d+)', path).group(1))
+                return self.reply(200, stand_in.listing(page).encode('utf-8'), 'text/html; charset=utf-8')
+            match = re.match(r'/en/files/(\d+)/$', path)
+            if match:
+                m_id = int(match.group(1))
+                if m_id in stand_in.missing or m_id not in stand_in.ids:
+                    return self.reply(404, b'Not found', 'text/plain')
+                return self.reply(200, details_page(m_id, seed=m_id).encode('utf-8'), 'text/html; charset=utf-8')
+            match = re.match(r'/upload/iblock/(\d+)/', path)
+            if match:
+                m_id = int(match.group(1))
+                if stand_in.first_failure(m_id):
+                    return self.reply(503, b'Try again', 'text/plain')
+                etag = '"{}"'.format(m_id)
+                if self.headers.get('If-None-Match') == etag:
+                    return self.reply(304, b'', None, etag)
+                return self.reply(200, stand_in.mission_file(m_id), 'application/zip', etag)
+            self.reply(404, b'Not found', 'text/plain')
+
+        def reply(self, status, body, content_type, etag=None):
+            self.send_response(status)
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            if etag:
+                self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+def ingest(modules, db_obj, known_modules, cache, base_url, parse_workers):
+    """
+    What misc/ingest.py does for --source ed, against the stand-in and without the journal
+    :return:
+        MissionPipeline after its run, LIST of the IDs of the missions it stored
+    """
+    with modules['ed_client'].EDClient(rate=0, retries=2, backoff=0.05) as client:
+        source = modules['sources'].EDSource(client, cache, base_url=base_url)
+        pipeline = modules['pipeline'].MissionPipeline(db_obj, known_modules, source, cache,
+                                                       parse_workers=parse_workers)
+        stored = pipeline.run(source.discover(0))
+    return pipeline, stored
+
+
+def check(name, got, expected):
+    if got != expected:
+        print("FAIL: {}: {!r}, expected {!r}".format(name, got, expected))
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('url', nargs='?', help='SQLAlchemy URL of a scratch database')
+    arg_parser.add_argument('--missions', type=int, default=250, help='missions on the stand-in')
+    arg_parser.add_argument('--missing', type=int, default=5, help='missions without a details page')
+    arg_parser.add_argument('--flaky', type=int, default=5, help='missions whose first download fails')
+    arg_parser.add_argument('--parse-workers', type=int, default=2, help='processes parsing missions, 0 for threads')
+    args = arg_parser.parse_args()
+
+    modules = load_ingest()
+    stand_in = StandIn(args.missions, args.missing, args.flaky)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(stand_in))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    scratch = tempfile.mkdtemp(prefix='ed-pipeline-')
+    url = args.url or 'sqlite:///{}'.format(os.path.join(scratch, 'dcs.sqlite3'))
+    ok = True
+    try:
+        meta = create_tables(create_engine(url))
+        db_obj = {
+            'missions': meta.tables['missions'],
+            'modules': meta.tables['modules'],
+            'map': meta.tables['mission_module_count'],
+        }
+        module_names = sorted({modules['missions'].get_unit(unit, False)
+                               for category in ('plane', 'helicopter') for unit in AIRCRAFT[category]})
+        db_obj['modules'].insert().execute([{'name': name} for name in module_names])
+        known_modules = modules['missions'].get_known_modules(db_obj)
+        cache = modules['mission_cache'].MissionCache(os.path.join(scratch, 'cache'))
+
+        expected = sorted(set(stand_in.ids) - stand_in.missing)
+        first, stored = ingest(modules, db_obj, known_modules, cache, base_url, args.parse_workers)
+        print(first.report())
+        ok &= check('stored', sorted(stored), expected)
+        ok &= check('failed', sorted(first.failed), sorted(stand_in.missing))
+        ok &= check('flaky downloads retried', stand_in.failed_once, stand_in.flaky)
+        rows = select([db_obj['missions'].c.ed_id]).execute().fetchall()
+        ok &= check('missions in the DB', sorted(x.ed_id for x in rows), expected)
+        unknown = select([func.count()]).select_from(db_obj['missions']).where(
+            db_obj['missions'].c.start_time == 'unkwn'
+        ).execute().scalar()
+        ok &= check('missions which failed to parse', unknown, 0)
+
+        requests = stand_in.requests
+        second, stored = ingest(modules, db_obj, known_modules, cache, base_url, args.parse_workers)
+        print(second.report())
+        ok &= check('stored again', stored, [])
+        ok &= check('unchanged', sorted(second.unchanged), expected)
+        ok &= check('failed again', sorted(second.failed), sorted(stand_in.missing))
+        print("{} requests on the first run, {} on the second".format(requests, stand_in.requests - requests))
+        cache.close()
+        meta.drop_all()
+    finally:
+        server.shutdown()
+        shutil.rmtree(scratch)
+    if not ok:
+        sys.exit(1)
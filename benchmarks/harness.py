@@ -0,0 +1,223 @@
+"""
+Benchmark both copies of the lua parser (misc/lua and misc/dcs/lua) on a corpus of missions
+
+    python -m benchmarks.harness [--corpus small medium large unitless] [--repeat N] [--profile]
+                                 [--save-baseline FILE] [--baseline FILE] [--tolerance 0.25] [mission.miz ...]
+
+For every copy and mission this reports loads and dumps throughput (MB/s) and the peak memory of loads (tracemalloc);
+--profile adds the hottest functions of loads (cProfile). Every mission is also run through
+MissionParser.get_file_metadata, the way ingestion reads it.
+
+The run fails (exit status 1) when
+  * the copies' sources differ, or they parse a mission differently
+  * MissionParser can't read a mission's metadata
+  * with --baseline, a copy's throughput drops or its peak memory grows by more than --tolerance compared to the
+    numbers recorded with --save-baseline
+"""
+import argparse
+import cProfile
+import filecmp
+import importlib
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+from benchmarks.lua_parse import load_mission
+from benchmarks.synthetic import generate_mission, write_miz
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+COPIES = {
+    'misc.lua': os.path.join(ROOT, 'misc', 'lua'),
+    'misc.dcs.lua': os.path.join(ROOT, 'misc', 'dcs', 'lua'),
+}
+# synthetic missions, as generate_mission arguments
+CORPUS = {
+    'small': dict(units=500),
+    'medium': dict(units=5000, countries=2, triggers=200),
+    'large': dict(units=20000, countries=3, categories=('plane', 'helicopter', 'vehicle'), waypoints=8,
+                  triggers=1000),
+    # a single-sided mission: red has a country but no units, so the metadata paths select nothing below it
+    'unitless': dict(units=500, categories=('plane', 'helicopter'), unitless=('red',)),
+}
+
+
+def drift():
+    """
+    :return:
+        LIST of the modules which differ between the copies
+    """
+    first, second = COPIES.values()
+    names = sorted(name for name in set(os.listdir(first)) | set(os.listdir(second)) if name.endswith('.py'))
+    _, mismatch, errors = filecmp.cmpfiles(first, second, names, shallow=False)
+    return mismatch + errors
+
+
+def read_metadata(data):
+    """
+    :param data:
+        STR of lua source
+    :return:
+        DICT of the metadata MissionParser reads from the mission packed as a .miz, None if it couldn't read it
+    """
+    dcs = os.path.join(ROOT, 'misc', 'dcs')
+    if dcs not in sys.path:
+        # misc/dcs/missions.py imports lua as a sibling
+        sys.path.insert(0, dcs)
+    missions = importlib.import_module('missions')
+    miz = io.BytesIO()
+    write_miz(miz, data)
+    miz.seek(0)
+    return missions.MissionParser().get_file_metadata(miz)
+
+
+def best_of(repeat, func, *args):
+    """
+    :return:
+        best run time in seconds, result of the last run
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_memory(func, *args):
+    """
+    :return:
+        peak bytes allocated while running func
+    """
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def profile(func, *args, top=15):
+    profiler = cProfile.Profile()
+    profiler.runcall(func, *args)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('tottime').print_stats(top)
+    # skip the header pstats prints before the table
+    lines = out.getvalue().splitlines()
+    start = next((i for i, line in enumerate(lines) if line.lstrip().startswith('ncalls')), 0)
+    for line in lines[start:]:
+        if line.strip():
+            print('      ' + line)
+
+
+def measure(copy, data, repeat, show_profile):
+    """
+    Benchmark one copy of the parser on one mission
+    :return:
+        DICT of results, the parsed mission
+    """
+    parse = importlib.import_module(copy + '.parse')
+    serialize = importlib.import_module(copy + '.serialize')
+    size = len(data) / (1024 * 1024)
+
+    elapsed, result = best_of(repeat, parse.loads, data)
+    results = {'loads_mbs': size / elapsed}
+    results['loads_peak_mb'] = peak_memory(parse.loads, data) / (1024 * 1024)
+
+    mission = result['mission']
+    elapsed, out = best_of(repeat, serialize.dumps, mission, 'mission', 1)
+    results['dumps_mbs'] = len(out) / (1024 * 1024) / elapsed
+
+    print("  {:<14} loads {:7.2f} MB/s {:8.2f} MB peak   dumps {:7.2f} MB/s".format(
+        copy, results['loads_mbs'], results['loads_peak_mb'], results['dumps_mbs']))
+    if show_profile:
+        profile(parse.loads, data)
+    return results, result
+
+
+def compare(name, results, baseline, tolerance):
+    """
+    :return:
+        LIST of regression messages
+    """
+    problems = []
+    for copy, current in results.items():
+        before = baseline.get(name, {}).get(copy)
+        if not before:
+            continue
+        for metric in ('loads_mbs', 'dumps_mbs'):
+            if current[metric] < before[metric] * (1 - tolerance):
+                problems.append("{} {} {}: {:.2f} MB/s, baseline {:.2f}".format(
+                    name, copy, metric, current[metric], before[metric]))
+        if current['loads_peak_mb'] > before['loads_peak_mb'] * (1 + tolerance):
+            problems.append("{} {} loads_peak_mb: {:.2f} MB, baseline {:.2f}".format(
+                name, copy, current['loads_peak_mb'], before['loads_peak_mb']))
+    return problems
+
+
+def run(missions, repeat, show_profile, baseline, tolerance):
+    """
+    :param missions:
+        LIST of (name, lua source)
+    :return:
+        DICT of name -> copy -> results, LIST of problems
+    """
+    problems = ["{} differs between {}".format(module, ' and '.join(COPIES)) for module in drift()]
+    all_results = {}
+    for name, data in missions:
+        print("{} ({:.2f} MB)".format(name, len(data) / (1024 * 1024)))
+        results = {}
+        parsed = []
+        for copy in COPIES:
+            results[copy], result = measure(copy, data, repeat, show_profile)
+            parsed.append(result)
+        if any(result != parsed[0] for result in parsed[1:]):
+            problems.append("{}: the parser copies disagree".format(name))
+        try:
+            metadata = read_metadata(data)
+        except Exception as e:
+            metadata = None
+            print("  metadata: {!r}".format(e))
+        if not metadata:
+            problems.append("{}: MissionParser couldn't read the metadata".format(name))
+        all_results[name] = results
+        if baseline:
+            problems.extend(compare(name, results, baseline, tolerance))
+    return all_results, problems
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('missions', nargs='*', help='.miz or mission files to add to the corpus')
+    arg_parser.add_argument('--corpus', nargs='*', default=['small', 'medium', 'large', 'unitless'], choices=list(CORPUS),
+                            help='synthetic missions to include')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the best is reported')
+    arg_parser.add_argument('--profile', action='store_true', help='show the hottest functions of loads')
+    arg_parser.add_argument('--baseline', help='JSON file of earlier results to compare against')
+    arg_parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='allowed slowdown / memory growth against the baseline, as a fraction')
+    args = arg_parser.parse_args()
+
+    corpus = [('synthetic {}'.format(name), generate_mission(**CORPUS[name])) for name in args.corpus]
+    corpus += [(path, load_mission(path)) for path in args.missions]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results, problems = run(corpus, args.repeat, args.profile, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    for problem in problems:
+        print("FAIL:", problem)
+    if problems:
+        sys.exit(1)
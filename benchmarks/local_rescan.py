@@ -0,0 +1,115 @@
+"""
+Compare rescanning a local mission library by hashing every file (what misc/async.py did) with LocalSource's
+manifest, which only hashes files whose size or mtime changed
+
+    python -m benchmarks.local_rescan [--files N] [--size BYTES] [--touch N] [--workers N] [--dir DIR]
+
+The run writes --files missions of random bytes (hashing doesn't care what's in them) to a temporary directory, or
+uses the .miz files already in --dir, and times:
+    * glob + read + MD5 of every file
+    * a first LocalSource scan, with an empty manifest
+    * a rescan with nothing changed
+    * a rescan after --touch files were modified
+Freshly written files sit in the page cache, so the full hash is faster than it would be off a cold disk.
+"""
+import argparse
+import hashlib
+import importlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+
+def load_sources():
+    """
+    misc/dcs/sources.py imports its siblings directly
+    """
+    sys.path.insert(0, os.path.join(ROOT, 'misc', 'dcs'))
+    return importlib.import_module('sources'), importlib.import_module('mission_cache')
+
+
+def write_library(path, files, size, seed=1):
+    rand = random.Random(seed)
+    for n in range(files):
+        folder = os.path.join(path, 'folder_{}'.format(n % 50))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, 'mission_{}.miz'.format(n)), 'wb') as f:
+            f.write(rand.getrandbits(size * 8).to_bytes(size, 'little'))
+
+
+def hash_everything(path):
+    """
+    What misc/async.py did on every run
+    """
+    digests = {}
+    for mission in Path(path).glob('**/*.miz'):
+        m = hashlib.md5()
+        with open(mission, 'rb') as mission_file:
+            m.update(mission_file.read())
+        digests[str(mission)] = m.hexdigest()
+    return len(digests)
+
+
+def rescan(sources, path, cache, workers, executor):
+    source = sources.LocalSource(path, workers, cache)
+    missions = source.discover()
+    source.stages(set(), executor)
+    with ThreadPoolExecutor(workers) as threads:
+        list(threads.map(lambda mission: source.hash({'id': mission}), missions))
+    source.save_manifest()
+    return source.hashed
+
+
+def touch(path, count, seed=2):
+    missions = sorted(str(mission) for mission in Path(path).glob('**/*.miz'))
+    for mission in random.Random(seed).sample(missions, min(count, len(missions))):
+        with open(mission, 'ab') as f:
+            f.write(b'\0')
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--files', type=int, default=10000, help='missions to write')
+    arg_parser.add_argument('--size', type=int, default=64 * 1024, help='bytes per mission')
+    arg_parser.add_argument('--touch', type=int, default=100, help='missions modified before the last rescan')
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='hashing threads / processes')
+    arg_parser.add_argument('--dir', help='existing mission library to scan (it is not modified, --touch is skipped)')
+    args = arg_parser.parse_args()
+
+    sources, mission_cache = load_sources()
+    scratch = tempfile.mkdtemp(prefix='rescan-')
+    try:
+        path = args.dir
+        if not path:
+            path = os.path.join(scratch, 'missions')
+            write_library(path, args.files, args.size)
+        cache = mission_cache.MissionCache(os.path.join(scratch, 'cache'))
+        with ProcessPoolExecutor(args.workers) as executor:
+            runs = [
+                ('hash every file', hash_everything, (path,)),
+                ('manifest, first scan', rescan, (sources, path, cache, args.workers, executor)),
+                ('manifest, unchanged', rescan, (sources, path, cache, args.workers, executor)),
+            ]
+            for name, func, func_args in runs:
+                elapsed, hashed = timed(func, *func_args)
+                print("{:<28} {:8.2f}s   {} hashed".format(name, elapsed, hashed))
+            if not args.dir and args.touch:
+                touch(path, args.touch)
+                elapsed, hashed = timed(rescan, sources, path, cache, args.workers, executor)
+                print("{:<28} {:8.2f}s   {} hashed".format('manifest, {} touched'.format(args.touch), elapsed, hashed))
+        cache.close()
+    finally:
+        shutil.rmtree(scratch)
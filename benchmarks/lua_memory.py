@@ -0,0 +1,65 @@
+"""
+Compare the memory held by misc.lua.parse.loads output in its dict and compact forms
+
+    python -m benchmarks.lua_memory [--units N] [mission.miz ...]
+
+Without any files a synthetic mission is generated.
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from misc.lua.parse import loads
+from benchmarks.lua_parse import load_mission
+from benchmarks.synthetic import generate_mission
+
+# the tables which share a shape across a mission
+RECORDS = ['units.*', 'points.*']
+
+MODES = [
+    ('dict', {}),
+    ('compact', {'compact': True}),
+    ('records', {'records': RECORDS}),
+]
+
+
+def measure(data, options):
+    """
+    :return:
+        bytes held by the parsed result, peak bytes while parsing, parse time in seconds
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = loads(data, **options)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, peak, elapsed
+
+
+def run(name, data):
+    print("{} ({:.2f} MB)".format(name, len(data) / (1024 * 1024)))
+    baseline = None
+    for mode, options in MODES:
+        retained, peak, elapsed = measure(data, options)
+        if baseline is None:
+            baseline = retained
+        print("  {:<8} {:8.2f} MB retained ({:5.1%}) {:8.2f} MB peak {:8.3f}s".format(
+            mode, retained / (1024 * 1024), retained / baseline, peak / (1024 * 1024), elapsed,
+        ))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('missions', nargs='*', help='.miz or mission files to parse')
+    arg_parser.add_argument('--units', type=int, default=10000, help='units in the synthetic mission')
+    args = arg_parser.parse_args()
+
+    if args.missions:
+        for mission in args.missions:
+            run(mission, load_mission(mission))
+    else:
+        run('synthetic mission, {} units'.format(args.units), generate_mission(args.units))
@@ -0,0 +1,86 @@
+"""
+Compare the misc.lua.parse.loads engines on mission files
+
+    python -m benchmarks.lua_parse [--units N] [--repeat N] [--skip PATH ...] [mission.miz ...]
+
+Without any files a synthetic mission is generated.
+With --skip the tokenizer is also timed leaving out the given key paths (e.g. --skip route.points triggers).
+"""
+import argparse
+import time
+import zipfile
+
+from misc.lua.parse import loads, ENGINES
+from benchmarks.synthetic import generate_mission
+
+
+def load_mission(path):
+    """
+    Read the mission file out of a .miz (or a bare mission file)
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as miz:
+            return miz.read('mission').decode()
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def time_engine(data, engine, repeat):
+    """
+    :return:
+        best run time in seconds, parsed result
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = loads(data, engine=engine)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def time_skip(data, skip, repeat):
+    """
+    :return:
+        best run time in seconds of the tokenizer engine skipping the given paths
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        loads(data, skip=skip)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(name, data, repeat, skip=None):
+    size = len(data) / (1024 * 1024)
+    print("{} ({:.2f} MB)".format(name, size))
+    timings = {}
+    results = {}
+    for engine in ENGINES:
+        timings[engine], results[engine] = time_engine(data, engine, repeat)
+        print("  {:<10} {:8.3f}s {:8.2f} MB/s".format(engine, timings[engine], size / timings[engine]))
+    print("  speedup    {:8.1f}x".format(timings['legacy'] / timings['tokenizer']))
+    if results['legacy'] != results['tokenizer']:
+        raise SystemExit("  engines disagree on {}".format(name))
+    if skip:
+        elapsed = time_skip(data, skip, repeat)
+        print("  {:<10} {:8.3f}s {:8.2f} MB/s".format('skip', elapsed, size / elapsed))
+        print("  speedup    {:8.1f}x".format(timings['tokenizer'] / elapsed))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('missions', nargs='*', help='.miz or mission files to parse')
+    arg_parser.add_argument('--units', type=int, default=10000, help='units in the synthetic mission')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='runs per engine, the best is reported')
+    arg_parser.add_argument('--skip', nargs='+', help='key paths to skip, timed against a full tokenizer parse')
+    args = arg_parser.parse_args()
+
+    if args.missions:
+        for mission in args.missions:
+            run(mission, load_mission(mission), args.repeat, args.skip)
+    else:
+        run('synthetic mission, {} units'.format(args.units), generate_mission(args.units), args.repeat, args.skip)
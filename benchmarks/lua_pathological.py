@@ -0,0 +1,123 @@
+"""
+Regression cases for misc.lua.parse.loads: tables nested or spread far beyond anything the mission editor writes
+
+    python -m benchmarks.lua_pathological [--scale N] [--legacy]
+
+Each case is parsed with the tokenizer engine and checked against the structure it was generated from; with --legacy
+the recursive engine is timed too (it runs out of stack on the deep cases). Exits non-zero if any check fails.
+"""
+import argparse
+import sys
+import time
+
+from misc.lua.parse import loads
+
+
+def expected_chain(depth, key):
+    """
+    Build {key: {key: ... {}}} without recursion
+    """
+    inner = {}
+    for _ in range(depth - 1):
+        inner = {key: inner}
+    return inner
+
+
+def deep_positional(depth):
+    return 'a = ' + '{' * depth + '}' * depth, expected_chain(depth, 1)
+
+
+def deep_keyed(depth):
+    return 'a = ' + '{["k"] = ' * (depth - 1) + '{' + '}' * depth, expected_chain(depth, 'k')
+
+
+def deep_named(depth):
+    return 'a = ' + '{ k = ' * (depth - 1) + '{' + ' }' * depth, expected_chain(depth, 'k')
+
+
+def deep_commented(depth):
+    source = 'a = ' + '{ -- }\n["k"] = \n' * (depth - 1) + '{' + '}, -- end of {\n' * (depth - 1) + '}'
+    return source, expected_chain(depth, 'k')
+
+
+def wide_positional(width):
+    return 'a = {' + ', '.join(str(i) for i in range(width)) + '}', {i + 1: i for i in range(width)}
+
+
+def wide_keyed(width):
+    source = 'a = {\n' + ''.join('\t["k{i}"] = "v{i}",\n'.format(i=i) for i in range(width)) + '}'
+    return source, {'k{}'.format(i): 'v{}'.format(i) for i in range(width)}
+
+
+def wide_tables(width):
+    source = 'a = {' + ''.join('[{i}] = {{}}, '.format(i=i) for i in range(1, width + 1)) + '}'
+    return source, {i: {} for i in range(1, width + 1)}
+
+
+def long_string(length):
+    text = 'x\\"{}\\\\' * (length // 8)
+    return 'a = {"' + text + '"}', {1: 'x"{}\\' * (length // 8)}
+
+
+CASES = [
+    ('deep positional', deep_positional, 100000),
+    ('deep keyed', deep_keyed, 100000),
+    ('deep named', deep_named, 100000),
+    ('deep commented', deep_commented, 50000),
+    ('wide positional', wide_positional, 1000000),
+    ('wide keyed', wide_keyed, 500000),
+    ('wide tables', wide_tables, 500000),
+    ('long string', long_string, 8000000),
+]
+
+
+def same(left, right):
+    """
+    Compare nested dicts without recursing, == would hit the recursion limit on the deep cases
+    """
+    pending = [(left, right)]
+    while pending:
+        a, b = pending.pop()
+        if isinstance(a, dict) and isinstance(b, dict):
+            if a.keys() != b.keys():
+                return False
+            pending.extend((a[key], b[key]) for key in a)
+        elif a != b:
+            return False
+    return True
+
+
+def timed(source, engine):
+    start = time.perf_counter()
+    try:
+        result = loads(source, engine=engine)
+    except RecursionError:
+        return None, time.perf_counter() - start
+    return result, time.perf_counter() - start
+
+
+def run(scale, legacy):
+    failed = []
+    for name, make, size in CASES:
+        size = max(1, int(size * scale))
+        source, expected = make(size)
+        result, elapsed = timed(source, 'tokenizer')
+        ok = result is not None and same(result['a'], expected)
+        line = "{:<16} {:>9} {:8.3f}s {}".format(name, size, elapsed, 'ok' if ok else 'FAILED')
+        if legacy:
+            result, elapsed = timed(source, 'legacy')
+            line += "   legacy {}".format('RecursionError' if result is None else '{:8.3f}s'.format(elapsed))
+        print(line)
+        if not ok:
+            failed.append(name)
+    return failed
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--scale', type=float, default=1.0, help='multiplier for the size of every case')
+    arg_parser.add_argument('--legacy', action='store_true', help='time the recursive legacy engine as well')
+    args = arg_parser.parse_args()
+
+    if run(args.scale, args.legacy):
+        sys.exit(1)
@@ -0,0 +1,92 @@
+"""
+Round-trip mission files through misc.lua.serialize.dump and misc.lua.parse.loads
+
+    python -m benchmarks.lua_serialize [--units N] [--repeat N] [mission.miz ...]
+
+Without any files a synthetic mission is generated. Each variant is checked to parse back to the original.
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from misc.lua.parse import loads
+from misc.lua.serialize import dump, dumps
+from benchmarks.lua_parse import load_mission
+from benchmarks.synthetic import generate_mission
+
+
+def to_string(value, fp, sort_keys):
+    fp.write(dumps(value, 'mission', 1, sort_keys))
+
+
+def to_file(value, fp, sort_keys):
+    dump(value, fp, 'mission', 1, sort_keys)
+
+
+VARIANTS = [
+    ('dumps', to_string, True),
+    ('dumps unsorted', to_string, False),
+    ('dump', to_file, True),
+    ('dump unsorted', to_file, False),
+]
+
+
+def serialize(variant, value, sort_keys, trace=False):
+    """
+    :param trace:
+        True to measure the allocations with tracemalloc (which slows everything down)
+    :return:
+        seconds taken, peak bytes allocated (None unless traced), serialized text
+    """
+    peak = None
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as fp:
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        variant(value, fp, sort_keys)
+        elapsed = time.perf_counter() - start
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        fp.seek(0)
+        return elapsed, peak, fp.read()
+
+
+def run(name, data, repeat):
+    size = len(data) / (1024 * 1024)
+    print("{} ({:.2f} MB)".format(name, size))
+    start = time.perf_counter()
+    mission = loads(data)['mission']
+    elapsed = time.perf_counter() - start
+    print("  {:<16} {:8.3f}s {:8.2f} MB/s".format('loads', elapsed, size / elapsed))
+
+    for label, variant, sort_keys in VARIANTS:
+        best = None
+        for _ in range(repeat):
+            elapsed = serialize(variant, mission, sort_keys)[0]
+            best = elapsed if best is None else min(best, elapsed)
+        _, peak, out = serialize(variant, mission, sort_keys, trace=True)
+
+        start = time.perf_counter()
+        round_trip = loads(out)['mission']
+        reparse = time.perf_counter() - start
+        print("  {:<16} {:8.3f}s {:8.2f} MB/s {:8.2f} MB peak, loads back in {:.3f}s".format(
+            label, best, len(out) / (1024 * 1024) / best, peak / (1024 * 1024), reparse,
+        ))
+        if round_trip != mission:
+            raise SystemExit("  {} does not round-trip {}".format(label, name))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('missions', nargs='*', help='.miz or mission files to serialize')
+    arg_parser.add_argument('--units', type=int, default=10000, help='units in the synthetic mission')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='runs per variant, the best is reported')
+    args = arg_parser.parse_args()
+
+    if args.missions:
+        for mission in args.missions:
+            run(mission, load_mission(mission), args.repeat)
+    else:
+        run('synthetic mission, {} units'.format(args.units), generate_mission(args.units), args.repeat)
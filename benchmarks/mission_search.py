@@ -0,0 +1,223 @@
+"""
+Compare the mission search of /dcs/missions as it was (a query per mission, plus one for its modules) with
+MissionDao.search_missions (two queries in all) and MissionIndex.search_missions (in memory)
+
+    python -m benchmarks.mission_search [url] [--missions N ...] [--searches N] [--old-limit N]
+
+The run creates missions, modules and mission_module_count tables in the given database (by default a SQLite file in
+a temporary directory), fills them with synthetic missions and drops them again. Use a scratch database. Every
+search must find the same missions, otherwise the run fails (exit status 1). The index's first load is timed on its
+own; its searches are timed after it.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import (
+    create_engine, Column, DateTime, ForeignKey, Integer, MetaData, SmallInteger, String, Table, select,
+)
+
+from app.db_dao import MissionDao
+from app.mission_index import MissionIndex
+
+MODULES = ['F/A-18C', 'F-16', 'A-10C', 'AV-8B', 'M-2000', 'F-14', 'Huey', 'Ka-50', 'Mi-8', 'FC-3 or 4', 'AH-64D',
+           'F-15E', 'JF-17', 'Mi-24P', 'F-5', 'MiG-21', 'AJS37', 'Gazelle', 'L-39', 'C-101']
+
+
+def create_tables(engine):
+    meta = MetaData(bind=engine)
+    Table(
+        'missions', meta,
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('name', String(150), nullable=False),
+        Column('map', String(45), nullable=False),
+        Column('start_time', String(5)),
+        Column('playable_factions', SmallInteger, nullable=False),
+        Column('format', String(45), nullable=False),
+        Column('digest', String(32), nullable=False, unique=True),
+        Column('path', String(400), nullable=False),
+        Column('ed_upload_date', DateTime),
+        Column('ed_id', Integer),
+    )
+    Table(
+        'modules', meta,
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('name', String(45), nullable=False),
+    )
+    Table(
+        'mission_module_count', meta,
+        Column('mission_id', Integer, ForeignKey('missions.id'), nullable=False, index=True),
+        Column('module_id', Integer, ForeignKey('modules.id'), nullable=False, index=True),
+        Column('module_count', Integer, nullable=False),
+    )
+    meta.drop_all()
+    meta.create_all()
+    return meta
+
+
+def fill(meta, count, seed=1, module_range=(1, 6), slot_range=(1, 12)):
+    """
+    Insert count missions with a handful of modules each, the popular modules more likely than the rest
+    :param module_range:
+        TUPLE of the fewest and most modules a mission is given (fewer when the same module is picked twice)
+    :param slot_range:
+        TUPLE of the fewest and most slots a mission has of each of its modules
+    """
+    rand = random.Random(seed)
+    missions = meta.tables['missions']
+    modules = meta.tables['modules']
+    module_map = meta.tables['mission_module_count']
+    modules.insert().execute([{'id': n + 1, 'name': name} for n, name in enumerate(MODULES)])
+    weights = [1 / (n + 1) for n in range(len(MODULES))]
+    chunk = 10000
+    for start in range(0, count, chunk):
+        rows = []
+        counts = []
+        for m_id in range(start + 1, min(start + chunk, count) + 1):
+            rows.append({
+                'id': m_id,
+                'name': 'mission_{}.miz'.format(m_id),
+                'map': rand.choice(['Caucasus', 'Syria', 'PersianGulf', 'Nevada', 'MarianaIslands']),
+                'start_time': '12:00',
+                'playable_factions': 1,
+                'format': '19',
+                'digest': '{:032x}'.format(m_id),
+                'path': 'N/A - see ED site',
+                'ed_id': 3000000 + m_id,
+            })
+            picked = set(rand.choices(range(1, len(MODULES) + 1), weights, k=rand.randint(*module_range)))
+            counts += [{'mission_id': m_id, 'module_id': module, 'module_count': rand.randint(*slot_range)}
+                       for module in picked]
+        missions.insert().execute(rows)
+        module_map.insert().execute(counts)
+
+
+def search_per_mission(meta, pilot_mapping, desired_cap):
+    """
+    What list_missions did before MissionDao: a query for every mission's details and another for its modules
+    """
+    missions_table = meta.tables['missions']
+    modules_table = meta.tables['modules']
+    map_table = meta.tables['mission_module_count']
+    missions = [x.id for x in select([missions_table.c.id]).execute().fetchall()]
+    match_count = 0
+    matched_details = []
+    for mission in missions:
+        results = select([
+            missions_table.c.id,
+            missions_table.c.name.label('mission_name'),
+            missions_table.c.map,
+            missions_table.c.start_time,
+            missions_table.c.ed_id,
+            missions_table.c.ed_upload_date,
+        ]).where(missions_table.c.id == mission).execute().fetchall()
+        for result in results:
+            details = {
+                'terrain': result.map,
+                'time': result.start_time,
+                'factions': {'blue': {'aircraft': {}}, 'red': {'aircraft': {}}},
+                'total_slots': 0,
+                'id': result.id,
+                'name': result.mission_name,
+                'ed_id': result.ed_id,
+                'ed_date': result.ed_upload_date,
+            }
+            raw_planes = select([
+                modules_table.c.id,
+                modules_table.c.name,
+                map_table.c.module_count,
+            ]).select_from(
+                modules_table.join(map_table, modules_table.c.id == map_table.c.module_id)
+            ).where(map_table.c.mission_id == mission).execute().fetchall()
+            met_criteria = None
+            parsed_planes = {plane.id: plane.module_count for plane in raw_planes}
+            for module, desired_module_count in pilot_mapping.items():
+                if module in parsed_planes and parsed_planes[module] >= desired_module_count:
+                    if met_criteria is None:
+                        met_criteria = True
+                else:
+                    met_criteria = False
+            if met_criteria:
+                match_count += 1
+            for plane in raw_planes:
+                details['factions']['blue']['aircraft'][plane.name] = plane.module_count
+                details['total_slots'] += plane.module_count
+            if details['total_slots'] > desired_cap or not met_criteria:
+                continue
+            matched_details.append(details)
+    matched_details = sorted(matched_details, key=lambda k: k['total_slots'])
+    mission_count = len(select([missions_table.c.id]).execute().fetchall())
+    return {'mission_count': mission_count, 'match_count': match_count, 'missions': matched_details}
+
+
+def searches(count, seed=2):
+    """
+    :return:
+        LIST of (pilot_mapping, cap) like the /dcs/missions form sends
+    """
+    rand = random.Random(seed)
+    result = []
+    for _ in range(count):
+        picked = rand.sample(range(1, 6), rand.randint(1, 3))
+        pilot_mapping = {module: rand.randint(1, 4) for module in picked}
+        result.append((pilot_mapping, sum(pilot_mapping.values()) + rand.randint(0, 12)))
+    return result
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('url', nargs='?', help='SQLAlchemy URL of a scratch database')
+    arg_parser.add_argument('--missions', type=int, nargs='+', default=[10000, 100000], help='library sizes to try')
+    arg_parser.add_argument('--searches', type=int, default=5, help='searches per library size')
+    arg_parser.add_argument('--old-limit', type=int, default=10000,
+                            help='largest library to run the (slow) per-mission search on')
+    args = arg_parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='search-')
+    url = args.url or 'sqlite:///{}'.format(os.path.join(scratch, 'dcs.sqlite3'))
+    ok = True
+    try:
+        for size in args.missions:
+            meta = create_tables(create_engine(url))
+            fill(meta, size)
+            dao = MissionDao(meta)
+            index = MissionIndex(meta)
+            load_time, _ = timed(index.load)
+            old_total = new_total = index_total = 0
+            for pilot_mapping, cap in searches(args.searches):
+                new_time, new = timed(dao.search_missions, pilot_mapping, cap)
+                new_total += new_time
+                index_time, indexed = timed(index.search_missions, pilot_mapping, cap)
+                index_total += index_time
+                if indexed != new:
+                    print("  index results differ for {} / cap {}".format(pilot_mapping, cap))
+                    ok = False
+                if size <= args.old_limit:
+                    old_time, old = timed(search_per_mission, meta, pilot_mapping, cap)
+                    old_total += old_time
+                    # ties on total_slots may come back in another order
+                    same = (old['mission_count'], old['match_count']) == (new['mission_count'], new['match_count'])
+                    same &= sorted(old['missions'], key=lambda x: (x['total_slots'], x['id'])) == new['missions']
+                    if not same:
+                        print("  results differ for {} / cap {}".format(pilot_mapping, cap))
+                        ok = False
+            searched = float(args.searches)
+            old_text = '{:8.1f} ms'.format(old_total / searched * 1000) if size <= args.old_limit else '   skipped'
+            print("{:>7} missions   per mission {}   aggregated {:8.1f} ms   index {:8.2f} ms (load {:.2f}s)   "
+                  "(mean of {} searches)".format(size, old_text, new_total / searched * 1000,
+                                                 index_total / searched * 1000, load_time, args.searches))
+            meta.drop_all()
+    finally:
+        shutil.rmtree(scratch)
+    if not ok:
+        sys.exit(1)
@@ -0,0 +1,121 @@
+"""
+Compare MissionSearcher.solve as it was (backtracking over every module of every pilot) with the matching it does
+now, on rosters built to be hard for backtracking
+
+    python -m benchmarks.mission_solver [--pilots N ...] [--time-limit SECONDS]
+
+Rosters:
+    one short     every pilot owns the same modules, which have one slot fewer than there are pilots
+    last pilots   the first pilots own several modules with slots to spare, the last few own a single module with
+                  one slot too few; backtracking tries every seating of the first pilots before giving up
+Backtracking gives up after --time-limit seconds, and is skipped for the larger rosters of a kind once it has. Both
+solvers must agree on whether everyone can be seated, otherwise the run fails (exit status 1).
+"""
+import argparse
+import sys
+import time
+
+from misc.t_dcs import MissionSearcher
+
+
+class TimedOut(Exception):
+    pass
+
+
+class BacktrackingSearcher:
+    """
+    MissionSearcher.solve before the matching replaced it
+    """
+    def __init__(self, pilot_mapping, slots, deadline=None):
+        """
+        :param deadline:
+            time.perf_counter() value after which solve raises TimedOut, None to run until it's done
+        """
+        self.slots = slots
+        self.pilot_mapping = pilot_mapping
+        self.deadline = deadline
+
+    def solve(self, pilots):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise TimedOut()
+        try:
+            pilot = self.find_empty(pilots)
+        except IndexError:
+            return True
+        for module in self.pilot_mapping[pilot]:
+            if self.valid(pilots, module):
+                pilots[pilot] = module
+                # we've made an assignment; see if we've solved everything
+                if self.solve(pilots):
+                    return True
+                # did not work - back out the change
+                pilots[pilot] = None
+        return False
+
+    def find_empty(self, pilots):
+        return [x for x in pilots.keys() if not pilots[x]][0]
+
+    def valid(self, pilots, module):
+        assigned_count = 0
+        for slot in pilots.values():
+            if slot == module:
+                assigned_count += 1
+        if module not in self.slots or assigned_count + 1 > self.slots[module]:
+            return False
+        else:
+            return True
+
+
+def one_short(pilots):
+    modules = ['module_{}'.format(n) for n in range(4)]
+    slots = {module: 0 for module in modules}
+    for n in range(pilots - 1):
+        slots[modules[n % len(modules)]] += 1
+    return {'pilot_{}'.format(n): modules for n in range(pilots)}, slots
+
+
+def last_pilots(pilots, stuck=3):
+    modules = ['module_{}'.format(n) for n in range(3)]
+    pilot_mapping = {'pilot_{}'.format(n): modules for n in range(pilots - stuck)}
+    pilot_mapping.update({'pilot_{}'.format(n): ['Huey'] for n in range(pilots - stuck, pilots)})
+    slots = {module: pilots for module in modules}
+    slots['Huey'] = stuck - 1
+    return pilot_mapping, slots
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--pilots', type=int, nargs='+', default=[6, 8, 10, 12, 14, 40], help='roster sizes to try')
+    arg_parser.add_argument('--time-limit', type=float, default=1, help='seconds of backtracking before giving up on it')
+    args = arg_parser.parse_args()
+
+    ok = True
+    for name, roster in [('one short', one_short), ('last pilots', last_pilots)]:
+        slow = False
+        for pilots in args.pilots:
+            pilot_mapping, slots = roster(pilots)
+            searcher = MissionSearcher(pilot_mapping, slots)
+            new_time, seated = timed(searcher.solve, {pilot: None for pilot in pilot_mapping})
+            old_text = '    skipped'
+            if not slow:
+                old_searcher = BacktrackingSearcher(pilot_mapping, slots, time.perf_counter() + args.time_limit)
+                try:
+                    old_time, old = timed(old_searcher.solve, {pilot: None for pilot in pilot_mapping})
+                except TimedOut:
+                    old_text = '  timed out'
+                    slow = True
+                else:
+                    old_text = '{:9.3f}s'.format(old_time)
+                    if old != seated:
+                        print("  solvers disagree on {} with {} pilots".format(name, pilots))
+                        ok = False
+            print("{:<12} {:>3} pilots   backtracking {}   matching {:7.2f} ms   {} unseated".format(
+                name, pilots, old_text, new_time * 1000, len(searcher.unseated)))
+    if not ok:
+        sys.exit(1)
@@ -0,0 +1,149 @@
+"""
+Compare finding the missions a roster of pilots can fly one mission at a time (a MissionSearcher per mission) with
+MissionIndex.match_roster (vectorised pruning, then one MissionSearcher per distinct set of slots)
+
+    python -m benchmarks.roster_search [url] [--missions N] [--pilots N ...] [--modules MIN MAX] [--slots MIN MAX]
+                                       [--solve-limit N]
+
+The database is filled as in benchmarks/mission_search.py (by default a SQLite file in a temporary directory) and
+dropped again, but with larger missions by default (--modules, --slots), so a fair share of them seat rosters of 16
+and 40 pilots. Pilots own a random handful of modules, the popular ones more likely. Each roster size reports how
+many missions pass match_roster's pre-filter (see MissionIndex.roster_candidates) and how many of those fit. Both
+ways must find the same missions, otherwise the run fails (exit status 1). It also fails unless a roster which names
+modules as the ownership sheets do where the DB calls them something else (A-10C_2 for A-10C II, CE2 for Christen
+Eagle II) finds the missions with those modules. Rosters of up to --solve-limit pilots are also run through the
+backtracking solver MissionSearcher.solve used to be (see benchmarks/mission_solver.py), which gets slow for large
+rosters.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, select
+
+from app.mission_index import MissionIndex
+from benchmarks.mission_search import MODULES, create_tables, fill, timed
+from benchmarks.mission_solver import BacktrackingSearcher
+from misc.t_dcs import MissionSearcher
+
+
+def make_roster(pilots, seed=3):
+    """
+    :return:
+        DICT of pilot -> LIST of module names, as the ownership sheets give them
+    """
+    rand = random.Random(seed)
+    weights = [1 / (n + 1) for n in range(len(MODULES))]
+    return {
+        'pilot_{}'.format(n): sorted(set(rand.choices(MODULES, weights, k=rand.randint(1, 5)))) for n in range(pilots)
+    }
+
+
+def mission_slots(meta):
+    """
+    :return:
+        DICT of mission ID -> DICT of module name -> slots
+    """
+    modules = meta.tables['modules']
+    module_map = meta.tables['mission_module_count']
+    slots = {x.id: {} for x in select([meta.tables['missions'].c.id]).execute()}
+    rows = select([
+        module_map.c.mission_id,
+        modules.c.name,
+        module_map.c.module_count,
+    ]).select_from(
+        module_map.join(modules, modules.c.id == module_map.c.module_id)
+    ).execute()
+    for row in rows:
+        slots[row.mission_id][row.name] = max(slots[row.mission_id].get(row.name, 0), row.module_count)
+    return slots
+
+
+def renamed_modules(meta, index):
+    """
+    Add two missions with modules whose names differ between the ownership sheets and the DB, one of which seats a
+    roster of a pilot of each
+    :return:
+        BOOL whether match_roster finds just that mission
+    """
+    modules = meta.tables['modules']
+    missions = meta.tables['missions']
+    module_ids = [modules.insert().execute({'name': name}).inserted_primary_key[0]
+                  for name in ['A-10C II', 'Christen Eagle II']]
+    mission_ids = []
+    for mission_modules in [module_ids, module_ids[:1]]:
+        m_id = missions.insert().execute({
+            'name': 'renamed_{}.miz'.format(len(mission_ids)),
+            'map': 'Caucasus',
+            'start_time': '12:00',
+            'playable_factions': 1,
+            'format': '19',
+            'digest': 'renamed_{}'.format(len(mission_ids)),
+            'path': 'N/A - see ED site',
+        }).inserted_primary_key[0]
+        meta.tables['mission_module_count'].insert().execute([
+            {'mission_id': m_id, 'module_id': module, 'module_count': 2} for module in mission_modules
+        ])
+        mission_ids.append(m_id)
+    index.refresh()
+    mask = index.match_roster(index.matrix, {'pilot_a': ['A-10C_2'], 'pilot_b': ['CE2']})
+    found = index.matrix.ids[mask].tolist()
+    print("sheet names A-10C_2 and CE2 find missions {}, expected {}".format(found, mission_ids[:1]))
+    return found == mission_ids[:1]
+
+
+def per_mission(slots, roster, solve=False):
+    if solve:
+        return {m_id for m_id, mission in slots.items()
+                if BacktrackingSearcher(roster, mission).solve({pilot: None for pilot in roster})}
+    return {m_id for m_id, mission in slots.items() if MissionSearcher(roster, mission).fits()}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('url', nargs='?', help='SQLAlchemy URL of a scratch database')
+    arg_parser.add_argument('--missions', type=int, default=10000, help='library size')
+    arg_parser.add_argument('--pilots', type=int, nargs='+', default=[4, 8, 16, 40], help='roster sizes to try')
+    arg_parser.add_argument('--modules', type=int, nargs=2, default=[10, 60],
+                            help='fewest and most modules picked per mission (picking one twice adds it once)')
+    arg_parser.add_argument('--slots', type=int, nargs=2, default=[4, 24],
+                            help='fewest and most slots a mission has of each of its modules')
+    arg_parser.add_argument('--solve-limit', type=int, default=8,
+                            help='largest roster to run the backtracking solver on')
+    args = arg_parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='roster-')
+    url = args.url or 'sqlite:///{}'.format(os.path.join(scratch, 'dcs.sqlite3'))
+    ok = True
+    try:
+        meta = create_tables(create_engine(url))
+        fill(meta, args.missions, module_range=args.modules, slot_range=args.slots)
+        index = MissionIndex(meta)
+        index.load()
+        slots = mission_slots(meta)
+        for pilots in args.pilots:
+            roster = make_roster(pilots)
+            batch_time, mask = timed(index.match_roster, index.matrix, roster)
+            batched = set(index.matrix.ids[mask].tolist())
+            candidates = len(index.roster_candidates(index.matrix, roster)[0])
+            single_time, single = timed(per_mission, slots, roster)
+            solve_text = '   skipped'
+            if pilots <= args.solve_limit:
+                solve_time, solved = timed(per_mission, slots, roster, True)
+                solve_text = '{:8.1f} ms'.format(solve_time * 1000)
+                ok &= solved == single
+            if batched != single:
+                print("  results differ for {} pilots".format(pilots))
+                ok = False
+            print("{:>3} pilots  {:>6} pass the pre-filter  {:>6} missions fit   backtracking {}   "
+                  "fits per mission {:8.1f} ms   batched {:8.1f} ms".format(pilots, candidates, len(batched), solve_text,
+                                                                             single_time * 1000, batch_time * 1000))
+        ok &= renamed_modules(meta, index)
+        meta.drop_all()
+    finally:
+        shutil.rmtree(scratch)
+    if not ok:
+        sys.exit(1)
@@ -0,0 +1,218 @@
+"""
+Synthetic missions in the format the DCS mission editor writes
+
+    python -m benchmarks.synthetic out.miz [--units N] [--countries N] [--waypoints N] [--triggers N]
+                                           [--unitless red] ...
+"""
+import argparse
+import random
+import zipfile
+
+COALITIONS = ('blue', 'red')
+CATEGORIES = ('plane', 'helicopter', 'vehicle')
+AIRCRAFT = {
+    'plane': ['FA-18C_hornet', 'F-16C_50', 'A-10C_2', 'F-14B', 'AV8BNA'],
+    'helicopter': ['UH-1H', 'Ka-50', 'Mi-8MT', 'AH-64D_BLK_II'],
+    'vehicle': ['M-1 Abrams', 'T-72B', 'BTR-80', 'Ural-375'],
+}
+SKILLS = ['Client', 'Average', 'High', 'Excellent']
+
+
+class Writer:
+    """
+    Collects lua source with the mission editor's layout: tab indentation and `-- end of` comments
+    """
+    def __init__(self):
+        self.out = []
+        self.depth = 0
+
+    def open(self, key):
+        tabs = '\t' * self.depth
+        self.out.append('{tabs}[{key}] = \n{tabs}{{\n'.format(tabs=tabs, key=self.key(key)))
+        self.depth += 1
+
+    def close(self, key):
+        self.depth -= 1
+        self.out.append('{tabs}}}, -- end of [{key}]\n'.format(tabs='\t' * self.depth, key=self.key(key)))
+
+    def field(self, key, value):
+        self.out.append('{tabs}[{key}] = {value},\n'.format(tabs='\t' * self.depth, key=self.key(key),
+                                                           value=self.value(value)))
+
+    @staticmethod
+    def key(key):
+        return key if isinstance(key, int) else '"{}"'.format(key)
+
+    @staticmethod
+    def value(value):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        elif isinstance(value, str):
+            return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\\n'))
+        return repr(value)
+
+
+def generate_mission(units=2000, seed=1, coalitions=COALITIONS, countries=1, categories=('plane',),
+                     units_per_group=4, waypoints=4, triggers=0, unitless=()):
+    """
+    Build a mission file in the format the DCS mission editor writes
+    :param units:
+        number of units to place, split evenly over coalitions, countries and categories
+    :param seed:
+        random seed, so runs are comparable
+    :param coalitions:
+        names of the coalitions
+    :param countries:
+        countries per coalition
+    :param categories:
+        unit categories of each country (plane, helicopter, vehicle)
+    :param units_per_group:
+        units in each group
+    :param waypoints:
+        route points of each group
+    :param triggers:
+        number of trigger rules, each with a condition and an action written as lua code strings
+    :param unitless:
+        names of coalitions whose countries get no units at all, like the empty side of a single-sided mission
+    :return:
+        STR of lua source
+    """
+    rand = random.Random(seed)
+    w = Writer()
+    w.out.append('mission = \n{\n')
+    w.depth = 1
+    w.field('theatre', 'Caucasus')
+    w.field('start_time', 43200)
+    w.field('version', 19)
+
+    if triggers:
+        w.open('trig')
+        w.open('actions')
+        for t in range(1, triggers + 1):
+            w.field(t, 'a_out_text_delay(getValueDictByKey("DictKey_ActionText_{t}"), 10, false); '
+                       'mission.trig.func[{t}]=nil;'.format(t=t))
+        w.close('actions')
+        w.open('conditions')
+        for t in range(1, triggers + 1):
+            w.field(t, 'return(c_flag_is_true({t}) and c_time_after({time}) )'.format(
+                t=t, time=rand.randint(1, 7200)))
+        w.close('conditions')
+        w.close('trig')
+        w.open('trigrules')
+        for t in range(1, triggers + 1):
+            w.open(t)
+            w.field('comment', 'Trigger "{}" -- fires once'.format(t))
+            w.field('eventlist', '')
+            w.field('predicate', 'triggerOnce')
+            w.open('rules')
+            w.open(1)
+            w.field('flag', t)
+            w.field('predicate', 'c_flag_is_true')
+            w.close(1)
+            w.close('rules')
+            w.close(t)
+        w.close('trigrules')
+
+    w.open('coalition')
+    with_units = [x for x in coalitions if x not in unitless] or coalitions
+    groups = max(1, units // units_per_group // (len(with_units) * countries * len(categories)))
+    unit_id = 0
+    for coalition in coalitions:
+        w.open(coalition)
+        w.field('name', coalition)
+        w.open('country')
+        for c in range(1, countries + 1):
+            w.open(c)
+            w.field('id', c)
+            w.field('name', '{}-country-{}'.format(coalition, c))
+            for category in categories if coalition not in unitless else ():
+                w.open(category)
+                w.open('group')
+                for g in range(1, groups + 1):
+                    w.open(g)
+                    w.field('name', '{} {}-{}'.format(category, c, g))
+                    w.field('task', 'CAP')
+                    w.open('route')
+                    w.open('points')
+                    for p in range(1, waypoints + 1):
+                        w.open(p)
+                        w.field('alt', rand.randint(500, 9000))
+                        w.field('type', 'Turning Point')
+                        w.field('x', rand.uniform(-500000, 500000))
+                        w.field('y', rand.uniform(-500000, 500000))
+                        w.field('speed', 138.88888888889)
+                        w.field('ETA_locked', False)
+                        w.close(p)
+                    w.close('points')
+                    w.close('route')
+                    w.open('units')
+                    for u in range(1, units_per_group + 1):
+                        unit_id += 1
+                        w.open(u)
+                        w.field('type', rand.choice(AIRCRAFT[category]))
+                        w.field('skill', rand.choice(SKILLS))
+                        w.field('unitId', unit_id)
+                        w.field('x', rand.uniform(-500000, 500000))
+                        w.field('y', rand.uniform(-500000, 500000))
+                        w.field('heading', 0)
+                        w.field('name', 'Aerial-{}-{}'.format(g, u))
+                        if category != 'vehicle':
+                            w.open('payload')
+                            w.field('fuel', 4900)
+                            w.field('flare', 60)
+                            w.field('chaff', 60)
+                            w.open('pylons')
+                            for pylon in range(1, 5):
+                                w.open(pylon)
+                                w.field('CLSID', '{{{:08X}-0000-0000-0000-000000000000}}'.format(
+                                    rand.getrandbits(32)))
+                                w.close(pylon)
+                            w.close('pylons')
+                            w.close('payload')
+                        w.close(u)
+                    w.close('units')
+                    w.close(g)
+                w.close('group')
+                w.close(category)
+            w.close(c)
+        w.close('country')
+        w.close(coalition)
+    w.close('coalition')
+    w.out.append('} -- end of mission\n')
+    return ''.join(w.out)
+
+
+def write_miz(path, mission):
+    """
+    Pack a mission into a .miz, along with the dictionary every mission carries
+    :param path:
+        path or file-like object to write to
+    :param mission:
+        STR of lua source, see generate_mission
+    """
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as miz:
+        miz.writestr('mission', mission)
+        miz.writestr('l10n/DEFAULT/dictionary', 'dictionary = \n{\n} -- end of dictionary\n')
+        miz.writestr('options', 'options = \n{\n} -- end of options\n')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('path', help='.miz to write')
+    arg_parser.add_argument('--units', type=int, default=2000, help='total number of units')
+    arg_parser.add_argument('--seed', type=int, default=1, help='random seed')
+    arg_parser.add_argument('--countries', type=int, default=1, help='countries per coalition')
+    arg_parser.add_argument('--categories', nargs='+', default=['plane'], choices=CATEGORIES,
+                            help='unit categories of each country')
+    arg_parser.add_argument('--units-per-group', type=int, default=4, help='units in each group')
+    arg_parser.add_argument('--waypoints', type=int, default=4, help='route points of each group')
+    arg_parser.add_argument('--triggers', type=int, default=0, help='trigger rules')
+    arg_parser.add_argument('--unitless', nargs='*', default=[], choices=COALITIONS,
+                            help='coalitions whose countries get no units')
+    args = arg_parser.parse_args()
+
+    write_miz(args.path, generate_mission(
+        args.units, args.seed, countries=args.countries, categories=args.categories,
+        units_per_group=args.units_per_group, waypoints=args.waypoints, triggers=args.triggers,
+        unitless=args.unitless,
+    ))
@@ -0,0 +1,331 @@
+import asyncio
+import datetime
+import email.utils
+import hashlib
+import random
+import threading
+import time
+
+import aiohttp
+
+DEFAULT_CONNECTIONS = 32
+DEFAULT_CONNECTIONS_PER_HOST = 8
+# requests per second, spread over every host
+DEFAULT_RATE = 10.0
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF = 0.5
+DEFAULT_TIMEOUT = 60.0
+# most seconds a Retry-After header can make a retry wait
+DEFAULT_MAX_RETRY_AFTER = 120.0
+# statuses worth another try: rate limited, or the server having a bad moment
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# bytes read from the network at a time by fetch_file
+CHUNK_SIZE = 256 * 1024
+
+
+class RateLimiter:
+    """
+    Token bucket: on average `rate` acquisitions per second, with bursts of up to `burst`
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.updated = loop.time()
+                self.tokens = 0
+            else:
+                self.tokens -= 1
+
+
+class EDClient:
+    """
+    HTTP client for the ED website on top of aiohttp.
+
+    Every request goes through one pooled session, so connections are kept alive and reused. The pool is capped in
+    total and per host, requests are spaced out by a rate limiter, and timeouts, dropped connections and 429/5xx
+    replies are retried with exponential backoff; a Retry-After header on the reply makes the retry wait at least that
+    long (up to max_retry_after).
+
+    The session lives on an event loop in a background thread. Coroutines (fetch_text, fetch_bytes) can be awaited on
+    that loop, and synchronous code (such as the pipeline's worker threads) can use get_text / get_bytes:
+
+        with EDClient() as client:
+            page = client.get_text(url)
+    """
+    def __init__(self, connections=DEFAULT_CONNECTIONS, connections_per_host=DEFAULT_CONNECTIONS_PER_HOST,
+                 rate=DEFAULT_RATE, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT,
+                 max_retry_after=DEFAULT_MAX_RETRY_AFTER):
+        """
+        :param connections:
+            INT open connections allowed in total
+        :param connections_per_host:
+            INT open connections allowed to any one host
+        :param rate:
+            FLOAT requests per second, or 0 for no limit
+        :param retries:
+            INT attempts after the first one
+        :param backoff:
+            FLOAT seconds to wait before the first retry, doubled for every one after
+        :param timeout:
+            FLOAT seconds a request may take, body included
+        :param max_retry_after:
+            FLOAT most seconds to wait for a retry when the reply's Retry-After header asks for longer
+        """
+        self.connections = connections
+        self.connections_per_host = connections_per_host
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_retry_after = max_retry_after
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self.limiter = None
+
+    @classmethod
+    def from_config(cls, conf_obj):
+        """
+        Build the client from the [dcs] section of config.ini
+            http_connections, http_connections_per_host, http_rate, http_retries, http_backoff, http_timeout,
+            http_max_retry_after: see __init__
+        :param conf_obj:
+            ConfigParser which has read config.ini
+        :return:
+            EDClient
+        """
+        return cls(
+            conf_obj.getint('dcs', 'http_connections', fallback=DEFAULT_CONNECTIONS),
+            conf_obj.getint('dcs', 'http_connections_per_host', fallback=DEFAULT_CONNECTIONS_PER_HOST),
+            conf_obj.getfloat('dcs', 'http_rate', fallback=DEFAULT_RATE),
+            conf_obj.getint('dcs', 'http_retries', fallback=DEFAULT_RETRIES),
+            conf_obj.getfloat('dcs', 'http_backoff', fallback=DEFAULT_BACKOFF),
+            conf_obj.getfloat('dcs', 'http_timeout', fallback=DEFAULT_TIMEOUT),
+            conf_obj.getfloat('dcs', 'http_max_retry_after', fallback=DEFAULT_MAX_RETRY_AFTER),
+        )
+
+    def start(self):
+        """
+        Start the event loop thread and open the session
+        """
+        if self.loop is not None:
+            return self
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='ed-client', daemon=True)
+        self.thread.start()
+        self.call(self.open())
+        return self
+
+    async def open(self):
+        # the session and limiter belong to the loop they're created on
+        connector = aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.connections_per_host)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.limiter = RateLimiter(self.rate) if self.rate else None
+
+    def close(self):
+        if self.loop is None:
+            return
+        self.call(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        self.thread = None
+        self.session = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def call(self, coro):
+        """
+        Run a coroutine on the client's loop and wait for its result; for use outside of the loop
+        """
+        if self.loop is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def request(self, url, consume, headers=None):
+        """
+        GET a URL, retrying transient failures
+        :param url:
+        :param consume:
+            coroutine function which reads the body from the aiohttp reply; it's called again for every retry
+        :param headers:
+            DICT of extra request headers
+        :return:
+            whatever consume returns
+        """
+        attempt = 0
+        while True:
+            if self.limiter:
+                await self.limiter.acquire()
+            try:
+                async with self.session.get(url, headers=headers) as reply:
+                    if reply.status in RETRY_STATUSES and attempt < self.retries:
+                        raise RetryableStatus(reply.status, retry_after(reply.headers.get('Retry-After')))
+                    reply.raise_for_status()
+                    return await consume(reply)
+            except (RetryableStatus, asyncio.TimeoutError, aiohttp.ClientConnectionError,
+                    aiohttp.ClientPayloadError) as e:
+                if attempt >= self.retries:
+                    raise
+                # full jitter, so workers which failed together don't retry together
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                if getattr(e, 'retry_after', None) is not None:
+                    # the server said when to come back (throttled, most likely); retrying sooner only gets throttled
+                    delay = max(delay, min(e.retry_after, self.max_retry_after))
+                print("Retrying {} in {:.1f}s ({!r})".format(url, delay, e))
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def fetch(self, url, binary):
+        """
+        GET a URL
+        :param url:
+        :param binary:
+            BOOL return the body as bytes rather than text
+        :return:
+            STR or BYTES of the body
+        """
+        return await self.request(url, read_body if binary else read_text)
+
+    async def fetch_file(self, url, fp, digest='md5', etag=None, last_modified=None):
+        """
+        GET a URL into a file chunk by chunk, hashing the body as it arrives.
+        With etag / last_modified from an earlier download the request is conditional, and nothing is written when
+        the file hasn't changed.
+        :param url:
+        :param fp:
+            seekable binary file to write to; it's emptied first
+        :param digest:
+            STR hashlib algorithm
+        :param etag:
+            STR ETag of the earlier download
+        :param last_modified:
+            STR Last-Modified of the earlier download
+        :return:
+            STR hex digest of the body (None if the file hasn't changed), STR ETag, STR Last-Modified
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        async def consume(reply):
+            if reply.status == 304:
+                return None, reply.headers.get('ETag', etag), reply.headers.get('Last-Modified', last_modified)
+            # hashing and writing (which may spill the file to disk) run on the loop's executor, so they don't hold
+            # up the other downloads; the next chunk is read while the last one is stored
+            loop = asyncio.get_running_loop()
+            hasher = hashlib.new(digest)
+
+            def store(chunk):
+                hasher.update(chunk)
+                fp.write(chunk)
+
+            # a retry starts over
+            await loop.run_in_executor(None, restart, fp)
+            storing = None
+            try:
+                async for chunk in reply.content.iter_chunked(CHUNK_SIZE):
+                    if storing:
+                        await storing
+                    storing = loop.run_in_executor(None, store, chunk)
+            finally:
+                # even when the reply breaks off, so a retry doesn't start over under a write
+                if storing:
+                    await storing
+            return hasher.hexdigest(), reply.headers.get('ETag'), reply.headers.get('Last-Modified')
+        return await self.request(url, consume, headers)
+
+    async def fetch_text(self, url):
+        return await self.fetch(url, False)
+
+    async def fetch_bytes(self, url):
+        return await self.fetch(url, True)
+
+    async def fetch_all(self, urls, binary=False):
+        """
+        GET several URLs at once
+        :return:
+            LIST of bodies, in the order of urls
+        """
+        return await asyncio.gather(*(self.fetch(url, binary) for url in urls))
+
+    def get_text(self, url):
+        return self.call(self.fetch_text(url))
+
+    def get_bytes(self, url):
+        return self.call(self.fetch_bytes(url))
+
+    def get_texts(self, urls):
+        return self.call(self.fetch_all(urls))
+
+    def get_file(self, url, fp, digest='md5', etag=None, last_modified=None):
+        return self.call(self.fetch_file(url, fp, digest, etag, last_modified))
+
+
+def restart(fp):
+    fp.seek(0)
+    fp.truncate()
+
+
+async def read_body(reply):
+    return await reply.read()
+
+
+async def read_text(reply):
+    return await reply.text()
+
+
+def retry_after(header):
+    """
+    :param header:
+        STR value of a Retry-After header: seconds, or an HTTP date
+    :return:
+        FLOAT seconds to wait, None if there's no header or it can't be read
+    """
+    if not header:
+        return None
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    if when.tzinfo is None:
+        # HTTP dates are in GMT
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryableStatus(Exception):
+    """
+    Reply with a status worth retrying
+    """
+    def __init__(self, status, retry_after=None):
+        super().__init__("HTTP {}".format(status))
+        self.status = status
+        # FLOAT seconds the reply's Retry-After header asked for, None without one
+        self.retry_after = retry_after
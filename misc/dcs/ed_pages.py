@@ -0,0 +1,172 @@
+from html.parser import HTMLParser
+
+# elements which never have an end tag
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr',
+}
+
+
+class StopExtraction(Exception):
+    """
+    Raised by an extractor once it has everything it needs, to skip the rest of the page
+    """
+
+
+class Extractor(HTMLParser):
+    """
+    Pulls a handful of elements out of an ED page as it's tokenized, without building a tree of the page.
+    Subclasses pick the elements in start() and get their text in end().
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # text of the element being captured, None when not capturing
+        self.text = None
+        self.captured = None
+        self.depth = 0
+
+    def extract(self, page):
+        try:
+            self.feed(page)
+            self.close()
+        except StopExtraction:
+            pass
+        return self
+
+    def capture(self, tag, attrs):
+        """
+        Collect the text of the element which just started; end() is called with it at the element's end tag
+        """
+        self.text = []
+        self.captured = (tag, attrs)
+        self.depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self.text is not None:
+            if tag not in VOID_ELEMENTS:
+                self.depth += 1
+            return
+        attrs = dict(attrs)
+        self.start(tag, attrs, (attrs.get('class') or '').split())
+
+    def handle_endtag(self, tag):
+        if self.text is None:
+            return
+        if self.depth:
+            self.depth -= 1
+            return
+        text = ''.join(self.text)
+        tag, attrs = self.captured
+        self.text = None
+        self.captured = None
+        self.end(tag, attrs, text)
+
+    def handle_data(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+    def start(self, tag, attrs, classes):
+        pass
+
+    def end(self, tag, attrs, text):
+        pass
+
+
+class ListingExtractor(Extractor):
+    """
+    Mission IDs (the data-id of the download links) and page links of a listing page
+    """
+    def __init__(self, last_downloaded=None, pages=True):
+        """
+        :param last_downloaded:
+            INT; stop at the first mission which isn't newer than this
+        :param pages:
+            BOOL collect the page links; without them the rest of the page is skipped once last_downloaded is reached
+        """
+        super().__init__()
+        self.last_downloaded = last_downloaded
+        self.pages = pages
+        self.missions = []
+        self.hit_limit = False
+        self.page_links = []
+
+    def start(self, tag, attrs, classes):
+        if 'download' in classes and not self.hit_limit:
+            m_id = int(attrs['data-id'])
+            if self.last_downloaded is not None and m_id <= self.last_downloaded:
+                self.hit_limit = True
+                if not self.pages:
+                    raise StopExtraction()
+            else:
+                self.missions.append(m_id)
+        elif 'page-link' in classes and self.pages:
+            self.capture(tag, attrs)
+
+    def end(self, tag, attrs, text):
+        self.page_links.append(text)
+
+
+class DetailsExtractor(Extractor):
+    """
+    Upload date (text of the first `date` element) and download link of a mission's details page
+    """
+    def __init__(self):
+        super().__init__()
+        self.date = None
+        self.download = None
+
+    def start(self, tag, attrs, classes):
+        if self.date is None and 'date' in classes:
+            self.capture(tag, attrs)
+        elif self.download is None and ('btn' in classes or 'download' in classes):
+            self.capture(tag, attrs)
+
+    def end(self, tag, attrs, text):
+        classes = (attrs.get('class') or '').split()
+        if self.date is None and 'date' in classes:
+            self.date = text
+        elif self.download is None and text == 'Download':
+            self.download = attrs['href']
+        if self.date is not None and self.download is not None:
+            raise StopExtraction()
+
+
+def listing_missions(page, last_downloaded):
+    """
+    Mission IDs of a listing page which are newer than last_downloaded
+    :param page:
+        STR of the listing page
+    :param last_downloaded:
+        INT ID of the mission last downloaded
+    :return:
+        LIST of mission IDs, BOOL whether the page reached last_downloaded
+    """
+    extractor = ListingExtractor(last_downloaded, pages=False).extract(page)
+    return extractor.missions, extractor.hit_limit
+
+
+def listing_page_count(page):
+    """
+    Number of listing pages, as shown by the pager (its last link is "next")
+    :param page:
+        STR of a listing page
+    :return:
+        INT
+    """
+    page_links = ListingExtractor().extract(page).page_links
+    if len(page_links) < 2:
+        raise ValueError("Listing page has no pager")
+    return int(page_links[-2])
+
+
+def mission_details(page):
+    """
+    Upload date and download link of a mission
+    :param page:
+        STR of the mission's details page
+    :return:
+        STR text of the date element, STR download path
+    """
+    extractor = DetailsExtractor().extract(page)
+    if extractor.date is None or extractor.download is None:
+        raise ValueError("Details page has no {}".format('date' if extractor.date is None else 'download link'))
+    return extractor.date, extractor.download
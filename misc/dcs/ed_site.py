@@ -0,0 +1,134 @@
+from missions import DEFAULT_SPOOL_SIZE, MissionSpool
+import ed_pages
+
+# point this ([dcs] ed_base_url) at a local stand-in to test the scraper
+ED_BASE_URL = 'https://www.digitalcombatsimulator.com'
+LISTING_PATH = '/en/files/filter/type-is-multiplayer/localization-is-english/sort-is-date_desc/apply/?PAGEN_1={}&PER_PAGE={}'
+# listing pages find_missions fetches at once
+DEFAULT_DISCOVERY_WINDOW = 8
+
+
+def download_mission(client, url, spool_size=DEFAULT_SPOOL_SIZE, spool_dir=None, cache=None, known_digests=None):
+    """
+    Stream a mission into a spool, hashing it on the way
+    :param client:
+        EDClient
+    :param url:
+        Download URL
+    :param spool_size:
+        INT bytes held in memory before the download moves to disk
+    :param spool_dir:
+        directory for downloads which move to disk
+    :param cache:
+        MissionCache remembering the ETag / Last-Modified of earlier downloads
+    :param known_digests:
+        SET of digests in the DB; the download is conditional when the last one of this URL is among them
+    :return:
+        MissionSpool of the mission (close it when done) or None if it hasn't changed since the last download,
+        STR hex digest (MD5)
+    """
+    previous = cache.get_download(url) if cache else None
+    etag = last_modified = None
+    # "not modified" is only any use if we still have what was downloaded last time
+    if previous and known_digests is not None and previous['digest'] in known_digests:
+        etag, last_modified = previous['etag'], previous['last_modified']
+
+    spool = MissionSpool(spool_size, spool_dir)
+    try:
+        digest, etag, last_modified = client.get_file(url, spool, etag=etag, last_modified=last_modified)
+    except Exception:
+        spool.close()
+        raise
+    if digest is None:
+        spool.close()
+        return None, previous['digest']
+    if cache:
+        cache.put_download(url, digest, etag, last_modified)
+    return spool, digest
+
+
+def get_mission_metadata(client, mission_id, base_url=ED_BASE_URL):
+    """
+    Lookup metadata about the mission on the ED website
+    :param client:
+        EDClient
+    :param mission_id:
+    :param base_url:
+        ED site (or a stand-in for it)
+    :return:
+    """
+    # look up the details page
+    page = client.get_text('{}/en/files/{}/'.format(base_url, mission_id))
+    date, url = ed_pages.mission_details(page)
+    name = url.split('/')[-1]
+    # make a basic attempt at sanitization
+    name = name.replace('...', '.')
+    name = name.replace('..', '.')
+
+    data = {
+        'date': date.split('-')[-1][1:].rstrip(' '),
+        'id': mission_id,
+        'download_path': '{}/{}'.format(base_url, url),
+        'name': name,
+    }
+    return data
+
+
+def find_missions(client, last_downloaded, base_url=ED_BASE_URL, window=DEFAULT_DISCOVERY_WINDOW):
+    """
+    Given the last_downloaded ID, retrieve a list of IDs uploaded since
+    Listing pages are fetched `window` at a time; no further windows are scheduled once a page reaches last_downloaded.
+    :param client:
+        EDClient
+    :param last_downloaded:
+        INT representing the ID of the mission last downloaded
+    :param base_url:
+        ED site (or a stand-in for it)
+    :param window:
+        INT listing pages to fetch at once
+    :return:
+        A list of mission IDs to download
+    """
+    page_size = 100
+    # get the number of pages
+    page = client.get_text(base_url + LISTING_PATH.format(1, page_size))
+    num_pages = ed_pages.listing_page_count(page)
+    detected_missions = []
+    # uploads made while we're paging push missions onto the next page, where we'd see them twice
+    seen = set()
+
+    print("Found {} pages!".format(num_pages))
+
+    pages = [page]
+    x = 1
+    while True:
+        for page in pages:
+            new_missions, limit = extract_missions(page, last_downloaded)
+            for m_id in new_missions:
+                if m_id not in seen:
+                    seen.add(m_id)
+                    detected_missions.append(m_id)
+            if limit:
+                # the remaining pages of the window only hold older missions
+                break
+        if limit or x >= num_pages:
+            break
+        numbers = range(x + 1, min(x + window, num_pages) + 1)
+        print("Now fetching missions from pages {}-{}".format(numbers[0], numbers[-1]))
+        pages = client.get_texts([base_url + LISTING_PATH.format(n, page_size) for n in numbers])
+        x = numbers[-1]
+
+    print("Found {} new missions!".format(len(detected_missions)))
+    return detected_missions
+
+
+def extract_missions(mission_list_page, last_downloaded):
+    """
+    Given a search page text object, return the mission IDs on the page if they're newer than the last downloaded mission
+    :param mission_list_page:
+        STR of the page for a search for missions
+    :param last_downloaded:
+        ID of the mission last successfully downloaded
+    :return:
+    """
+    return ed_pages.listing_missions(mission_list_page, last_downloaded)
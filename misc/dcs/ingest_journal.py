@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'leetsaber')
+# seconds a run may hold a mission before another run may take it over (i.e. the first one is presumed dead)
+DEFAULT_LEASE = 6 * 60 * 60
+
+DISCOVERED = 'discovered'
+DOWNLOADED = 'downloaded'
+PARSED = 'parsed'
+PERSISTED = 'persisted'
+FAILED = 'failed'
+# states a mission can be picked up from; a mission isn't kept between stages, so these all start over
+PENDING = (DISCOVERED, DOWNLOADED, PARSED)
+
+
+class IngestJournal:
+    """
+    Durable record of every ED mission we know of and how far its ingestion got, stored in SQLite:
+    discovered -> downloaded -> parsed -> persisted, or failed with the reason.
+
+    Runs claim the missions they work on, so several runs (or a run restarted after a crash) never work on the same
+    mission at once, and whatever an interrupted run didn't finish is picked up by the next one.
+    """
+    def __init__(self, journal_dir=None, lease=DEFAULT_LEASE):
+        """
+        :param journal_dir:
+            directory holding the journal database, created if missing
+        :param lease:
+            INT seconds a claim is good for
+        """
+        self.journal_dir = journal_dir or DEFAULT_JOURNAL_DIR
+        self.lease = lease
+        # identifies this run's claims
+        self.run_id = uuid.uuid4().hex
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.path = os.path.join(self.journal_dir, 'ingest.sqlite3')
+        # the connection is shared between the pipeline's threads, so every use goes through the lock
+        self.lock = threading.Lock()
+        # isolation_level=None: transactions are opened explicitly, so claims can take the write lock up front
+        self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS missions ('
+                'mission_id INTEGER PRIMARY KEY, state TEXT NOT NULL, reason TEXT, attempts INTEGER NOT NULL DEFAULT 0,'
+                ' claimed_by TEXT, claimed_at REAL, updated_at REAL NOT NULL)'
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS missions_state ON missions (state)')
+
+    @classmethod
+    def from_config(cls, conf_obj):
+        """
+        Build the journal from the [dcs] section of config.ini
+            journal_dir: directory for the journal database (defaults to cache_dir)
+            journal_lease: seconds a run may hold a mission
+        :param conf_obj:
+            ConfigParser which has read config.ini
+        :return:
+            IngestJournal
+        """
+        return cls(
+            conf_obj.get('dcs', 'journal_dir', fallback=conf_obj.get('dcs', 'cache_dir', fallback=None)),
+            conf_obj.getint('dcs', 'journal_lease', fallback=DEFAULT_LEASE),
+        )
+
+    def transaction(self, immediate=False):
+        return _Transaction(self.conn, immediate)
+
+    def last_discovered(self):
+        """
+        :return:
+            INT ID of the newest mission discovered, None if the journal is empty
+        """
+        with self.lock:
+            return self.conn.execute('SELECT MAX(mission_id) FROM missions').fetchone()[0]
+
+    def discover(self, mission_ids):
+        """
+        Record newly found missions; ones already in the journal keep their state
+        :param mission_ids:
+            LIST of INT
+        :return:
+            N/A
+        """
+        now = time.time()
+        with self.lock, self.transaction():
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO missions (mission_id, state, updated_at) VALUES (?, ?, ?)',
+                [(mission_id, DISCOVERED, now) for mission_id in mission_ids],
+            )
+
+    def claim(self, limit=None):
+        """
+        Take the pending missions no other live run holds
+        :param limit:
+            INT most missions to take, None for all
+        :return:
+            LIST of mission IDs, newest first
+        """
+        now = time.time()
+        with self.lock, self.transaction(immediate=True):
+            rows = self.conn.execute(
+                'SELECT mission_id FROM missions WHERE state IN ({}) AND (claimed_by IS NULL OR claimed_at < ?)'
+                ' ORDER BY mission_id DESC LIMIT ?'.format(','.join('?' * len(PENDING))),
+                PENDING + (now - self.lease, -1 if limit is None else limit),
+            ).fetchall()
+            mission_ids = [row[0] for row in rows]
+            self.conn.executemany(
+                'UPDATE missions SET claimed_by = ?, claimed_at = ? WHERE mission_id = ?',
+                [(self.run_id, now, mission_id) for mission_id in mission_ids],
+            )
+        return mission_ids
+
+    def mark(self, mission_ids, state, reason=None):
+        """
+        Record how far missions got; persisted and failed missions are released
+        :param mission_ids:
+            INT or LIST of INT
+        :param state:
+            STR one of DOWNLOADED, PARSED, PERSISTED, FAILED
+        :param reason:
+            STR why the missions failed (or a note on how they were persisted)
+        :return:
+            N/A
+        """
+        if isinstance(mission_ids, int):
+            mission_ids = [mission_ids]
+        now = time.time()
+        release = state in (PERSISTED, FAILED)
+        with self.lock, self.transaction():
+            self.conn.executemany(
+                'UPDATE missions SET state = ?, reason = ?, updated_at = ?, attempts = attempts + ?,'
+                ' claimed_by = CASE WHEN ? THEN NULL ELSE claimed_by END WHERE mission_id = ?',
+                [(state, reason, now, int(state == FAILED), release, mission_id) for mission_id in mission_ids],
+            )
+
+    def retry_failed(self, max_attempts=None):
+        """
+        Put failed missions back in line
+        :param max_attempts:
+            INT; missions which failed this many times stay failed
+        :return:
+            INT number of missions queued again
+        """
+        with self.lock, self.transaction():
+            return self.conn.execute(
+                'UPDATE missions SET state = ?, reason = NULL WHERE state = ? AND (? IS NULL OR attempts < ?)',
+                (DISCOVERED, FAILED, max_attempts, max_attempts),
+            ).rowcount
+
+    def release(self):
+        """
+        Give up this run's remaining claims, e.g. when it's stopping early
+        """
+        with self.lock, self.transaction():
+            self.conn.execute(
+                'UPDATE missions SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ?', (self.run_id,),
+            )
+
+    def counts(self):
+        """
+        :return:
+            DICT of state -> number of missions
+        """
+        with self.lock:
+            return dict(self.conn.execute('SELECT state, COUNT(*) FROM missions GROUP BY state').fetchall())
+
+    def failures(self):
+        """
+        :return:
+            LIST of (mission ID, reason, attempts) of the failed missions
+        """
+        with self.lock:
+            return self.conn.execute(
+                'SELECT mission_id, reason, attempts FROM missions WHERE state = ? ORDER BY mission_id', (FAILED,),
+            ).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class _Transaction:
+    """
+    BEGIN ... COMMIT / ROLLBACK around a block; BEGIN IMMEDIATE takes the write lock at once, so two runs claiming
+    missions at the same time can't both see them as free
+    """
+    def __init__(self, conn, immediate):
+        self.conn = conn
+        self.immediate = immediate
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE' if self.immediate else 'BEGIN')
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
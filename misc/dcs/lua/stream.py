@@ -0,0 +1,405 @@
+import io
+import re
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from .tokenizer import (
+    TOKEN, SKIP, SKIP_OPEN, SKIP_CLOSE, PathFilter, TokenParser, UNESCAPE_BYTES, ESCAPED,
+    DEFAULT_ENCODING, DEFAULT_FALLBACK_ENCODING,
+    KEY_STR, KEY_INT, FIELD_OPEN, FIELD_STR, FIELD_INT, FIELD_FLOAT, FIELD_TRUE, FIELD_FALSE,
+    CLOSE_COMMA, CLOSE, OPEN, STRING, INT, FLOAT, TRUE, FALSE, NAMED, NAME, COMMA, LPAREN, RPAREN,
+    LBRACKET, RBRACKET, EQUALS, EOF, ERROR,
+)
+
+CHUNK_SIZE = 1 << 16
+# keep at least this much unread text in the buffer, so tokens are rarely cut off at the end of a chunk
+MARGIN = 1 << 12
+
+# bytes which weren't valid in the stream's encoding, see StreamParser.string
+ESCAPED_BYTES = re.compile('[\udc80-\udcff]')
+
+# what to do with a value, see StreamParser.classify
+SELECT, DESCEND = 1, 2
+
+Path = Tuple[Union[str, int], ...]
+
+
+def iterparse(stream, paths: Optional[Iterable[Union[str, tuple]]] = None,
+              chunk_size: int = CHUNK_SIZE,
+              skip: Optional[Iterable[Union[str, tuple]]] = None, compact: bool = False,
+              records: Optional[Iterable[Union[str, tuple]]] = None, encoding: str = DEFAULT_ENCODING,
+              fallback_encoding: str = DEFAULT_FALLBACK_ENCODING) -> Iterator[Tuple[Path, Any]]:
+    """
+    Parse a lua file from a stream, yielding only the requested values
+    :param stream:
+        file-like object opened in text or binary mode, e.g. a member of the .miz opened with ZipFile.open
+    :param paths:
+        keys of the values to yield, either dotted strings or tuples, `*` matching any key:
+            'mission.theatre'
+            'mission.coalition.*.country.*.plane.group.*.units'
+        Tables which are not on the way to a requested value are skipped without being converted.
+        By default every variable is yielded whole.
+    :param chunk_size:
+        number of characters read from the stream at a time
+    :param skip:
+        tables to leave out, even inside of requested values, see misc.lua.parse.loads
+    :param compact:
+        convert requested tables to their compact representation, see misc.lua.parse.loads
+    :param records:
+        see misc.lua.parse.loads
+    :param encoding:
+        encoding of a binary stream
+    :param fallback_encoding:
+        encoding for string literals which aren't valid in encoding, see misc.lua.parse.loads
+    :return:
+        generator of (path, value), path being the tuple of keys leading to the value
+    """
+    return StreamParser(stream, paths, chunk_size, skip, compact, records, encoding, fallback_encoding).events()
+
+
+def load(stream, paths: Optional[Iterable[Union[str, tuple]]] = None,
+         chunk_size: int = CHUNK_SIZE,
+         skip: Optional[Iterable[Union[str, tuple]]] = None, compact: bool = False,
+         records: Optional[Iterable[Union[str, tuple]]] = None, encoding: str = DEFAULT_ENCODING,
+         fallback_encoding: str = DEFAULT_FALLBACK_ENCODING) -> Dict[str, Any]:
+    """
+    Parse the requested values of a lua file from a stream into nested dicts, leaving out everything else
+    :param stream:
+        see iterparse
+    :param paths:
+        see iterparse
+    :param chunk_size:
+        see iterparse
+    :param skip:
+        see iterparse
+    :param compact:
+        see iterparse, the tables leading to the requested values stay dicts
+    :param records:
+        see iterparse
+    :param encoding:
+        see iterparse
+    :param fallback_encoding:
+        see iterparse
+    :return:
+        dict of variable name -> value, like loads
+    """
+    tree = {}
+    for path, value in iterparse(stream, paths, chunk_size, skip, compact, records, encoding, fallback_encoding):
+        node = tree
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = value
+    return tree
+
+
+class StreamParser:
+    """
+    Walks the TOKEN stream of a lua file read chunk by chunk, keeping only a small window of the file in memory.
+    Requested tables are located with the SKIP scan and then converted by TokenParser.
+    """
+    def __init__(self, stream, paths=None, chunk_size: int = CHUNK_SIZE, skip=None, compact: bool = False,
+                 records=None, encoding: str = DEFAULT_ENCODING, fallback_encoding: str = DEFAULT_FALLBACK_ENCODING):
+        self.encoding = encoding
+        self.fallback_encoding = fallback_encoding
+        if isinstance(stream.read(0), bytes):
+            # invalid bytes are kept as lone surrogates, so the strings containing them can be decoded again with
+            # the fallback encoding instead of failing the whole file
+            stream = io.TextIOWrapper(stream, encoding=encoding, errors='surrogateescape')
+        self.stream = stream
+        self.chunk_size = chunk_size
+        if paths is None:
+            self.selectors = None
+        else:
+            self.selectors = [
+                tuple(str(key) for key in (path.split('.') if isinstance(path, str) else path))
+                for path in paths
+            ]
+        self.skip_patterns = list(skip) if skip else None
+        self.skip_filter: Optional[PathFilter] = PathFilter(self.skip_patterns) if skip else None
+        self.compact = compact
+        self.record_patterns = list(records) if records else None
+
+        self.buffer: str = ''
+        self.pos: int = 0
+        # number of characters dropped from the front of the buffer
+        self.offset: int = 0
+        # position which must stay in the buffer when it is refilled
+        self.mark: Optional[int] = None
+        self.eof: bool = False
+
+    def classify(self, path: Path) -> Optional[int]:
+        """
+        Decide what to do with the value at path
+        :return:
+            SELECT if it was requested, DESCEND if a requested value is inside of it, otherwise None
+        """
+        if self.selectors is None:
+            return SELECT
+        action = None
+        depth = len(path)
+        for selector in self.selectors:
+            if len(selector) < depth:
+                continue
+            for wanted, key in zip(selector, path):
+                if wanted != '*' and wanted != str(key):
+                    break
+            else:
+                if len(selector) == depth:
+                    return SELECT
+                action = DESCEND
+        return action
+
+    def classify_table(self, path: Path) -> Optional[int]:
+        """
+        Like classify, but tables matched by the skip patterns are always skipped
+        """
+        if self.skip_filter is not None and self.skip_filter.matches(path):
+            return None
+        return self.classify(path)
+
+    def fill(self) -> bool:
+        """
+        Read the next chunk, dropping everything in front of the current position (or the mark)
+        :return:
+            False if the stream is exhausted
+        """
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        keep = self.pos if self.mark is None else self.mark
+        self.buffer = self.buffer[keep:] + chunk
+        self.offset += keep
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark -= keep
+        return True
+
+    def token(self):
+        """
+        Match the next token, reading more of the stream whenever the token could continue past the buffer
+        """
+        while True:
+            while not self.eof and len(self.buffer) - self.pos < MARGIN:
+                self.fill()
+            m = TOKEN.match(self.buffer, self.pos)
+            if not self.eof and (m.end() >= len(self.buffer) or m.lastindex in (EOF, ERROR)):
+                self.fill()
+                continue
+            self.pos = m.end()
+            return m
+
+    def skip(self):
+        """
+        Jump over a table body without converting it, up to and including the closing brace
+        """
+        depth = 1
+        while True:
+            for m in SKIP.finditer(self.buffer, self.pos):
+                kind = m.lastindex
+                if kind == SKIP_OPEN:
+                    depth += 1
+                elif kind == SKIP_CLOSE:
+                    depth -= 1
+                    if depth == 0:
+                        self.pos = m.end()
+                        return
+                else:
+                    # end of the buffer, or a string cut off by it
+                    break
+            if self.eof:
+                raise self.eob_exception()
+            self.pos = m.start()
+            self.fill()
+
+    def capture(self, path: Path, start: int) -> Dict[Union[int, str], Any]:
+        """
+        Convert the table at path whose opening brace is at start; the current position is right after it
+        """
+        self.mark = start
+        self.skip()
+        text = self.buffer[self.mark:self.pos]
+        self.mark = None
+        if ESCAPED_BYTES.search(text):
+            text = text.encode(self.encoding, 'surrogateescape')
+        parser = TokenParser(text, skip=self.skip_patterns, compact=self.compact, records=self.record_patterns,
+                             encoding=self.encoding, fallback_encoding=self.fallback_encoding)
+        d = parser.table(parser.tokens(1), path)[0]
+        if parser.compact:
+            return parser.compact_table(d, path)
+        return d
+
+    def events(self) -> Iterator[Tuple[Path, Any]]:
+        m = self.token()
+        while True:
+            kind = m.lastindex
+            if kind == EOF:
+                return
+            elif kind == NAMED:
+                names = [m.group(NAMED)]
+            elif kind == NAME and m.group(NAME) == 'local':
+                names = []
+                while True:
+                    m = self.token()
+                    if m.lastindex == NAMED:
+                        names.append(m.group(NAMED))
+                        break
+                    elif m.lastindex != NAME:
+                        raise self.unexpected(m)
+                    names.append(m.group(NAME))
+                    m = self.token()
+                    if m.lastindex != COMMA:
+                        raise self.unexpected(m)
+            elif kind == NAME and m.group(NAME) == 'return':
+                return
+            else:
+                raise self.unexpected(m)
+
+            i = 0
+            while True:
+                # values without a name to assign them to are skipped
+                path = (names[i],) if i < len(names) else None
+                i += 1
+                if not (yield from self.value(path, self.token())):
+                    m = self.token()
+                    if m.lastindex != COMMA:
+                        break
+
+    def value(self, path: Path, m):
+        """
+        Walk the value starting with the token m
+        :return:
+            True if a trailing comma was consumed along with it
+        """
+        kind = m.lastindex
+        if kind == OPEN:
+            action = None if path is None else self.classify_table(path)
+            if action == SELECT:
+                yield path, self.capture(path, m.start(OPEN))
+            elif action == DESCEND:
+                return (yield from self.table(path))
+            else:
+                self.skip()
+            return False
+
+        value = self.scalar(m)
+        if path is not None and self.classify(path) == SELECT:
+            yield path, value
+        return False
+
+    def table(self, path: Path):
+        """
+        Walk a table body which contains requested values
+        :return:
+            True if the closing brace was followed by a comma
+        """
+        inc_key = 1
+        while True:
+            m = self.token()
+            kind = m.lastindex
+            if kind <= FIELD_FALSE:
+                key = m.group(KEY_STR)
+                if key is None:
+                    key = int(m.group(KEY_INT))
+                else:
+                    key = self.string(key)
+                child = path + (key,)
+
+                if kind != FIELD_OPEN:
+                    if self.classify(child) == SELECT:
+                        yield child, self.scalar(m)
+                    continue
+
+                action = self.classify_table(child)
+                if action == DESCEND:
+                    if (yield from self.table(child)):
+                        continue
+                else:
+                    if action == SELECT:
+                        yield child, self.capture(child, m.start(FIELD_OPEN))
+                    else:
+                        self.skip()
+                m = self.token()
+                if m.lastindex != COMMA:
+                    return self.close(m)
+                continue
+            elif kind == CLOSE_COMMA:
+                return True
+            elif kind == CLOSE:
+                return False
+
+            if kind == LBRACKET:
+                m = self.token()
+                if m.lastindex not in (STRING, INT, FLOAT):
+                    raise self.unexpected(m)
+                key = self.scalar(m)
+                if self.token().lastindex != RBRACKET or self.token().lastindex != EQUALS:
+                    raise self.unexpected(m)
+                m = self.token()
+            elif kind == NAMED:
+                key = m.group(NAMED)
+                m = self.token()
+            else:
+                key = inc_key
+                inc_key += 1
+
+            if not (yield from self.value(path + (key,), m)):
+                m = self.token()
+                if m.lastindex != COMMA:
+                    return self.close(m)
+
+    def scalar(self, m) -> Any:
+        kind = m.lastindex
+        if kind == FIELD_STR or kind == STRING:
+            return self.string(m.group(kind))
+        elif kind == FIELD_INT or kind == INT:
+            return int(m.group(kind))
+        elif kind == FIELD_FLOAT or kind == FLOAT:
+            return TokenParser.number(m.group(kind))
+        elif kind == FIELD_TRUE or kind == TRUE:
+            return True
+        elif kind == FIELD_FALSE or kind == FALSE:
+            return False
+        elif kind == NAME and m.group(NAME) == '_':
+            if self.token().lastindex != LPAREN:
+                raise self.unexpected(m)
+            m = self.token()
+            if m.lastindex != STRING:
+                raise self.unexpected(m)
+            s = self.string(m.group(STRING))
+            if self.token().lastindex != RPAREN:
+                raise self.unexpected(m)
+            return s
+        raise self.unexpected(m)
+
+    def string(self, s: str) -> str:
+        """
+        Convert the contents of a string literal, decoding any bytes which weren't valid in the stream's encoding with
+        the fallback encoding
+        """
+        if ESCAPED_BYTES.search(s):
+            s = s.encode(self.encoding, 'surrogateescape')
+            if b'\\' in s:
+                s = UNESCAPE_BYTES.sub(ESCAPED, s)
+            return s.decode(self.fallback_encoding, 'replace')
+        return TokenParser.string(s)
+
+    def close(self, m) -> bool:
+        if m.lastindex == CLOSE_COMMA:
+            return True
+        elif m.lastindex == CLOSE:
+            return False
+        raise self.unexpected(m)
+
+    def error(self, pos: int, text: str) -> SyntaxError:
+        se = SyntaxError()
+        se.offset = self.offset + pos
+        se.text = text
+        return se
+
+    def eob_exception(self) -> SyntaxError:
+        return self.error(len(self.buffer), "Unexpected end of buffer")
+
+    def unexpected(self, m) -> SyntaxError:
+        if m.lastindex == EOF:
+            return self.eob_exception()
+        return self.error(m.start(m.lastindex), "Unexpected token '{token}'".format(token=m.group(m.lastindex)))
@@ -0,0 +1,213 @@
+import json
+import os
+import sqlite3
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'leetsaber')
+DEFAULT_MAX_ENTRIES = 50000
+# bump whenever MissionParser.parse_mission changes what it extracts, so stale entries are not served
+CACHE_VERSION = 1
+
+
+class MissionCache:
+    """
+    Persistent map of mission digest -> parse_mission output (map, time, format, factions), stored in SQLite.
+    Once the cache holds more than max_entries missions the least recently used ones are evicted.
+    It also remembers the ETag / Last-Modified of downloads, so unchanged files can be requested conditionally, and
+    the size / mtime / digest of local missions, so unchanged files needn't be hashed again.
+    """
+    def __init__(self, cache_dir=None, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        :param cache_dir:
+            directory holding the cache database, created if missing
+        :param max_entries:
+            INT number of missions to keep
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.path = os.path.join(self.cache_dir, 'missions.sqlite3')
+        # the connection is shared between threads, so every use goes through the lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS missions ('
+                'digest TEXT PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL, last_used INTEGER NOT NULL)'
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS missions_last_used ON missions (last_used)')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS downloads ('
+                'url TEXT PRIMARY KEY, digest TEXT NOT NULL, etag TEXT, last_modified TEXT)'
+            )
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime INTEGER NOT NULL, digest TEXT NOT NULL)'
+            )
+            row = self.conn.execute('SELECT MAX(last_used), COUNT(*) FROM missions').fetchone()
+        # recency is a counter rather than a timestamp, so entries used within the same clock tick stay ordered
+        self.clock = row[0] or 0
+        # missions in the cache, kept up to date by put so it needn't count them on every store
+        self.count = row[1]
+
+    @classmethod
+    def from_config(cls, conf_obj):
+        """
+        Build the cache from the [dcs] section of config.ini
+            cache_dir: directory for the cache database
+            cache_size: number of missions to keep
+        :param conf_obj:
+            ConfigParser which has read config.ini
+        :return:
+            MissionCache
+        """
+        return cls(
+            conf_obj.get('dcs', 'cache_dir', fallback=None),
+            conf_obj.getint('dcs', 'cache_size', fallback=DEFAULT_MAX_ENTRIES),
+        )
+
+    def get(self, digest):
+        """
+        Look up the parsed metadata of a mission
+        :param digest:
+            STR hex digest of the mission file
+        :return:
+            DICT as returned by parse_mission, or None if the mission isn't cached
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                'SELECT data FROM missions WHERE digest = ? AND version = ?', (digest, CACHE_VERSION)
+            ).fetchone()
+            if row is None:
+                return None
+            self.clock += 1
+            self.conn.execute('UPDATE missions SET last_used = ? WHERE digest = ?', (self.clock, digest))
+        return json.loads(row[0])
+
+    def put(self, digest, data):
+        """
+        Store the parsed metadata of a mission, evicting the least recently used missions if the cache is full
+        The placeholder parse_mission returns for a mission it couldn't read isn't stored, so the mission is parsed
+        again next time rather than staying unreadable until CACHE_VERSION changes
+        :param digest:
+            STR hex digest of the mission file
+        :param data:
+            DICT as returned by parse_mission
+        :return:
+            N/A
+        """
+        if data.get('time') == 'unknown':
+            return
+        encoded = json.dumps(data)
+        with self.lock, self.conn:
+            self.clock += 1
+            updated = self.conn.execute(
+                'UPDATE missions SET version = ?, data = ?, last_used = ? WHERE digest = ?',
+                (CACHE_VERSION, encoded, self.clock, digest),
+            ).rowcount
+            count = self.count
+            if not updated:
+                self.conn.execute(
+                    'INSERT INTO missions (digest, version, data, last_used) VALUES (?, ?, ?, ?)',
+                    (digest, CACHE_VERSION, encoded, self.clock),
+                )
+                count += 1
+            if count > self.max_entries:
+                count -= self.conn.execute(
+                    'DELETE FROM missions WHERE digest IN '
+                    '(SELECT digest FROM missions ORDER BY last_used LIMIT ?)',
+                    (count - self.max_entries,),
+                ).rowcount
+            # only once the statements went through; a failure rolls them back
+            self.count = count
+
+    def parse_mission(self, parser, mission, digest):
+        """
+        Return the cached metadata of a mission, parsing (and caching) it on a miss
+        :param parser:
+            MissionParser
+        :param mission:
+            whatever parser.parse_mission accepts (a path or a file-like object)
+        :param digest:
+            STR hex digest of the mission file
+        :return:
+            DICT as returned by parse_mission
+        """
+        data = self.get(digest)
+        if data is None:
+            data = parser.parse_mission(mission)
+            self.put(digest, data)
+        return data
+
+    def get_download(self, url):
+        """
+        Look up what we got the last time a URL was downloaded
+        :param url:
+        :return:
+            DICT of digest, etag and last_modified (either may be None), or None if the URL wasn't downloaded before
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT digest, etag, last_modified FROM downloads WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'digest': row[0], 'etag': row[1], 'last_modified': row[2]}
+
+    def put_download(self, url, digest, etag=None, last_modified=None):
+        """
+        Remember a download
+        :param url:
+        :param digest:
+            STR hex digest of the file
+        :param etag:
+            STR ETag header of the reply
+        :param last_modified:
+            STR Last-Modified header of the reply
+        :return:
+            N/A
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO downloads (url, digest, etag, last_modified) VALUES (?, ?, ?, ?)',
+                (url, digest, etag, last_modified),
+            )
+
+    def get_files(self):
+        """
+        Manifest of the local missions hashed before
+        :return:
+            DICT of path -> (INT size, INT mtime in ns, STR hex digest) as they were when the file was hashed
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT path, size, mtime, digest FROM files').fetchall()
+        return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+    def put_files(self, entries):
+        """
+        Remember local missions which were hashed
+        :param entries:
+            LIST of (path, INT size, INT mtime in ns, STR hex digest)
+        :return:
+            N/A
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO files (path, size, mtime, digest) VALUES (?, ?, ?, ?)', entries,
+            )
+
+    def forget_files(self, paths):
+        """
+        Drop local missions which are gone from the manifest
+        :param paths:
+            LIST of paths
+        :return:
+            N/A
+        """
+        with self.lock, self.conn:
+            self.conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in paths])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
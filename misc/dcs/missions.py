@@ -0,0 +1,704 @@
+import datetime
+import io
+import os
+import tempfile
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import create_engine, MetaData, select, Table
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+# buffers larger than this many bytes are spooled to disk rather than memory, [dcs] spool_size
+DEFAULT_SPOOL_SIZE = 16 * 1024 * 1024
+# missions written per transaction, [dcs] batch_size
+DEFAULT_BATCH_SIZE = 50
+
+# the parts of the mission file get_file_metadata reads; everything else is skipped while parsing
+METADATA_PATHS = [
+    'mission.theatre',
+    'mission.start_time',
+    'mission.version',
+    'mission.coalition.*.name',
+    'mission.coalition.*.country.*.helicopter.group.*.units',
+    'mission.coalition.*.country.*.vehicle.group.*.units',
+    'mission.coalition.*.country.*.plane.group.*.units',
+]
+# tables inside of the selected units which get_file_metadata doesn't read
+METADATA_SKIP = [
+    'units.*.payload',
+    'units.*.Radio',
+    'units.*.datalinks',
+    'units.*.AddPropAircraft',
+    'units.*.callsign',
+]
+
+
+class MissionParser:
+    def __init__(self, save_dir=None, last_download_id=None):
+        pass
+
+    def __loaddict__(self, fname, mizfile, reserved_files, paths=None, skip=None):
+        reserved_files.append(fname)
+        with mizfile.open(fname) as mfile:
+            import lua
+            if paths:
+                # stream the file, only converting the tables we need
+                return lua.load(mfile, paths, skip=skip)
+            # parsed as bytes, only the string literals get decoded
+            return lua.loads(mfile.read())
+
+    def __load_assets__(self, file_contents):
+        import zipfile
+        with zipfile.ZipFile(file_contents) as miz:
+            reserved_files = []
+            try:
+                mission_dict = self.__loaddict__('mission', miz, reserved_files, METADATA_PATHS, METADATA_SKIP)
+            except SyntaxError:
+                return {}
+        return mission_dict
+
+    def get_file_metadata(self, file_contents):
+        # load assets
+        try:
+            mission_dict = self.__load_assets__(file_contents)
+        except Exception:
+            print(f"Bad mission: {file_contents}")
+            return None
+
+        if not mission_dict:
+            print(f"Bad mission: {file_contents}")
+            return None
+
+        units = {}
+        for col_name in ["blue", "red"]:
+            if col_name in mission_dict['mission'].get("coalition", {}):
+                units[col_name] = {
+                    'aircraft': {},
+                    'slot_count': 0,
+                }
+                # only coalitions with units have a country table once the rest of the mission is skipped
+                for x, country in mission_dict['mission']["coalition"][col_name].get('country', {}).items():
+                    for category_name, category_data in country.items():
+                        if category_name not in ['helicopter', 'vehicle', 'plane']:
+                            continue
+                        for x, group in category_data.get('group', {}).items():
+                            for x, unit in group['units'].items():
+                                try:
+                                    skill_level = unit['skill']
+                                except KeyError:
+                                    skill_level = 'Average'
+                                if skill_level == 'Client':
+                                    if unit['type'] not in units[col_name]['aircraft']:
+                                        units[col_name]['aircraft'][unit['type']] = 0
+                                    units[col_name]['aircraft'][unit['type']] += 1
+                                    units[col_name]['slot_count'] += 1
+
+        start_time_day = int(mission_dict['mission']["start_time"] % 86400)
+        hour = int(start_time_day / 3600)
+        minutes = int(start_time_day / 60) - hour * 60
+
+        data = {
+            'map': mission_dict['mission']['theatre'],
+            'time': "{:02d}:{:02d}".format(hour, minutes),
+            'format': mission_dict['mission']['version'],
+            'factions': units,
+        }
+
+        return data
+
+    def parse_mission(self, mission_name):
+        raw_data = {
+            'factions': {
+                'blue': {
+                    'slot_count': 0,
+                    'aircraft': {},
+                },
+                'red': {
+                    'slot_count': 0,
+                    'aircraft': {},
+                },
+            },
+            'map': 'unknown',
+            'time': 'unknown',
+            'format': 'unknown',
+        }
+
+        try:
+            data = self.get_file_metadata(mission_name)
+            if not data:
+                return raw_data
+        except UnicodeDecodeError:
+            print(f"Unable to parse {mission_name}: unicode error")
+            return raw_data
+        return data
+
+
+def get_unit(unit, pretty_to_dcs):
+    """
+    Given a unit, get the mapping
+    pydcs calls units one thing, while the spread sheets we're parsing for module ownership call them another
+    As such, we need to be able to pivot between the two
+    :param unit:
+    :param pretty_to_dcs:
+    :return:
+    """
+    pretty_dcs = {
+        'FC-3 or 4': [
+            # "FC3" refers to many modules
+            'A-10A',
+            'F-15C',
+            'J-11A',
+            'MiG-29K',
+            'MiG-29S',
+            'MiG-29G',
+            'MiG-29A',
+            'Su-25',
+            'Su-25T',
+            'Su-27',
+            'Su-33',
+        ],
+        'A-10C': [
+            'A-10C',
+        ],
+        'A-10C_2': [
+            'A-10C II',
+        ],
+        'AJS37': [
+            'AJS37',
+        ],
+        'AV-8B': [
+            'AV8BNA',
+        ],
+        'Bf-109': [
+            'Bf-109K-4',
+        ],
+        'CE2': [
+            'Christen Eagle II',
+        ],
+        'C-101': [
+            'C-101CC',
+            'C-101EB',
+        ],
+        'F-5': [
+            'F-5E-3',
+            'F-5E',
+        ],
+        'F-14B': [
+            'F-14B',
+        ],
+        'F-14A': [
+            'F-14A',
+        ],
+        'F-16': [
+            'F-16C bl.52d',
+        ],
+        'F/A-18C': [
+            'FA-18C_hornet',
+        ],
+        'F-86': [
+            'F-86F Sabre',
+        ],
+        'FW-190': [
+            'FW-190D9',
+        ],
+        'Gazelle': [
+            'SA342M',
+        ],
+        'Huey': [
+            'UH-1H',
+        ],
+        'Ka-50': [
+            'Ka-50',
+        ],
+        'L-39': [
+            'L-39ZA',
+            'L-39C',
+        ],
+        'M-2000': [
+            'M-2000C',
+        ],
+        'Mi-8': [
+            'Mi-8MT',
+        ],
+        'MiG-15': [
+            'MiG-15bis',
+        ],
+        'MiG-19': [
+            'MiG-19P',
+        ],
+        'MiG-21': [
+            'MiG-21Bis',
+        ],
+        'P-51': [
+            'TF-51D',
+            'P-51D-30-NA',
+            'P-51D',
+        ],
+        'Spitfire': [
+            'SpitfireLFMkIX',
+        ],
+        'Yak-52': [
+            'Yak-52',
+        ],
+        'Hawk': [
+            'Hawk',
+        ],
+        'JF-17': [
+            'JF-17',
+        ],
+        'Mig-23': [
+            'MiG-23MLD',
+        ],
+        'Mi-24P': [
+            'Mi-24P',
+        ],
+        'AH-64D': [
+            'AH-64D_BLK_II',
+        ],
+        'P-47': [
+            'P-47D-30',
+            'P-47D-40',
+            'P-47D-30bl1',
+        ],
+        'Mosquito': [
+            'MosquitoFBMkVI',
+        ],
+        'A-4E': [
+            'A-4E-C',
+        ],
+        'C-130': [
+            'Hercules',
+            'C-130FR',
+            'AC_130',
+        ],
+        'F-22': [
+            'F-22A',
+        ],
+        'UH-60': [
+            'UH-60L',
+        ],
+        'F-15E': [
+            'F-15E',
+        ],
+    }
+    dcs_pretty = {
+        'A-10A': 'FC-3 or 4',  # all FC3 modules map to FC3
+        'F-15C': 'FC-3 or 4',
+        'J-11A': 'FC-3 or 4',
+        'MiG-29K': 'FC-3 or 4',
+        'MiG-29S': 'FC-3 or 4',
+        'MiG-29G': 'FC-3 or 4',
+        'MiG-29A': 'FC-3 or 4',
+        'Su-25': 'FC-3 or 4',
+        'Su-25T': 'FC-3 or 4',
+        'Su-27': 'FC-3 or 4',
+        'Su-33': 'FC-3 or 4',
+        'A-10C': 'A-10C',
+        'AJS37': 'AJS37',
+        'AV8BNA': 'AV-8B',
+        'Bf-109K-4': 'Bf-109',
+        'CE2': 'Christen Eagle II',
+        'Christen Eagle II': 'Christen Eagle II',
+        'C-101CC': 'C-101',
+        'C-101EB': 'C-101',
+        'F-5E-3': 'F-5',
+        'F-5E': 'F-5',
+        'F-14B': 'F-14B',
+        'F-14A-135-GR': 'F-14A',
+        'F-16C bl.52d': 'F-16',
+        'FA-18C_hornet': 'F/A-18C',
+        'F/A-18C': 'F/A-18C',
+        'F-86F Sabre': 'F-86',
+        'FW-190D9': 'FW-190',
+        'FW-190A8': 'FW-190',
+        'SA342M': 'Gazelle',
+        'SA342Minigun': 'Gazelle',
+        'SA342Mistral': 'Gazelle',
+        'SA342L': 'Gazelle',
+        'UH-1H': 'Huey',
+        'Ka-50': 'Ka-50',
+        'L-39ZA': 'L-39',
+        'L-39C': 'L-39',
+        'M-2000C': 'M-2000',
+        'Mi-8MT': 'Mi-8',
+        'MiG-15bis': 'MiG-15',
+        'MiG-19P': 'MiG-19',
+        'MiG-21Bis': 'MiG-21',
+        'TF-51D': 'P-51',
+        'P-51D-30-NA': 'P-51',
+        'P-51D': 'P-51',
+        'SpitfireLFMkIX': 'Spitfire',
+        'SpitfireLFMkIXCW': 'Spitfire',
+        'Yak-52': 'Yak-52',
+        'Hawk': 'Hawk',
+        'T-45': 'Hawk',
+        'JF-17': 'JF-17',
+        'MiG-23MLD': 'Mig-23',
+        'F-16C_50': 'F-16',
+        'A-10C_2': 'A-10C II',
+        'A-10C II': 'A-10C II',
+        'P-47D-30': 'P-47',
+        'P-47D-40': 'P-47',
+        'P-47D-30bl1': 'P-47',
+        'I-16': 'I-16',
+        'Mirage 2000-5': 'M-2000',
+        'MQ9_PREDATOR': 'CA',
+        'Mi-24P': 'Mi-24P',
+        'AH-64D_BLK_II': 'AH-64D',
+        'MosquitoFBMkVI': 'Mosquito',
+        # mod aircraft
+        'A-4E-C': 'A-4E',
+        'Hercules': 'C-130',
+        'C-130FR': 'C-130',
+        'AC_130': 'C-130',
+        'F-22A': 'F-22',
+        'UH-60L': 'UH-60',
+        'F-15E': 'F-15E',
+    }
+    if pretty_to_dcs:
+        return pretty_dcs[unit]
+    else:
+        return dcs_pretty[unit]
+
+
+class MissionSpool:
+    """
+    Buffer for a downloaded mission: held in memory up to max_size bytes, moved to a temporary file beyond that.
+    Unlike tempfile.SpooledTemporaryFile the file on disk has a name, so a parse process can open it by path.
+    """
+    def __init__(self, max_size=DEFAULT_SPOOL_SIZE, spool_dir=None):
+        """
+        :param max_size:
+            INT bytes to hold in memory
+        :param spool_dir:
+            directory for the temporary file, defaults to the system's
+        """
+        self.max_size = max_size
+        self.spool_dir = spool_dir
+        self.file = io.BytesIO()
+        self.name = None
+
+    def write(self, data):
+        if self.name is None and self.file.tell() + len(data) > self.max_size:
+            self.rollover()
+        return self.file.write(data)
+
+    def rollover(self):
+        disk = tempfile.NamedTemporaryFile(prefix='mission-', suffix='.miz', dir=self.spool_dir, delete=False)
+        disk.write(self.file.getbuffer())
+        self.file = disk
+        self.name = disk.name
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def truncate(self, size=None):
+        return self.file.truncate(size)
+
+    def handle(self):
+        """
+        :return:
+            the seekable file holding the mission, rewound
+        """
+        self.file.flush()
+        self.file.seek(0)
+        return self.file
+
+    def source(self):
+        """
+        :return:
+            path of the file on disk, or BYTES when the mission is held in memory
+        """
+        if self.name is not None:
+            self.file.flush()
+            return self.name
+        return self.file.getvalue()
+
+    def close(self):
+        self.file.close()
+        if self.name is not None:
+            os.unlink(self.name)
+            self.name = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def mission_row(mission_data):
+    """
+    Columns of the missions table for a mission
+    :param mission_data:
+        DICT from build_mission_data
+    :return:
+        DICT
+    """
+    upload_date = mission_data['ed_upload_date']
+    if upload_date:
+        upload_date = datetime.datetime.strptime(upload_date, '%m/%d/%Y %H:%M:%S')
+    return {
+        'name': mission_data['name'],
+        'map': mission_data['map'],
+        'start_time': mission_data['start_time'],
+        'playable_factions': mission_data['playable_factions'],
+        'format': mission_data['format'],
+        'digest': mission_data['digest'],
+        'path': mission_data['path'],
+        'ed_upload_date': upload_date,
+        'ed_id': mission_data['ed_id'],
+    }
+
+
+def insert_or_update_mission(db_obj, known_modules, mission_data):
+    # try to insert the mission
+    try:
+        m_id = db_obj['missions'].insert(mission_row(mission_data)).execute().inserted_primary_key[0]
+    except IntegrityError:
+        db_obj['missions'].update(
+            db_obj['missions'].c.digest == mission_data['digest'],
+            mission_row(mission_data),
+        ).execute()
+        m_id = db_obj['missions'].select(
+            db_obj['missions'].c.id
+        ).where(
+            db_obj['missions'].c.digest == mission_data['digest']
+        ).execute().fetchone().id
+
+    mission_data['id'] = m_id
+
+    add_modules(db_obj, known_modules, mission_data)
+
+
+def module_counts(known_modules, mission_data):
+    """
+    Rows of the mission_module_count table for a mission
+    :param known_modules:
+        DICT of module name -> ID
+    :param mission_data:
+        DICT from build_mission_data, with the mission's 'id'
+    :return:
+        LIST of DICTs
+    """
+    module_list = {}
+    data = []
+    for faction in mission_data['factions'].values():
+        for aircraft, a_data in faction['aircraft'].items():
+            decoded_aircraft = get_unit(aircraft, False)
+            if decoded_aircraft not in module_list:
+                module_list[decoded_aircraft] = 0
+            module_list[decoded_aircraft] += a_data
+
+    for aircraft, count in module_list.items():
+        data.append({
+            'mission_id': mission_data['id'],
+            'module_id': known_modules[aircraft],
+            'module_count': count,
+        })
+    return data
+
+
+def add_modules(db_obj, known_modules, mission_data):
+    """
+    For a given mission, add all of the modules to the DB
+    :param module_table:
+    :param mission_data:
+    :return:
+        N/A
+    """
+    data = module_counts(known_modules, mission_data)
+    if data:
+        db_obj['map'].insert(data).execute()
+
+
+class MissionWriter:
+    """
+    Stores missions in batches. Each batch is one transaction:
+        * a single INSERT ... ON DUPLICATE KEY UPDATE (keyed on digest) into missions
+        * one SELECT for the IDs of the batch's missions
+        * the batch's old mission_module_count rows replaced by one executemany
+    """
+    def __init__(self, db_obj, known_modules, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param db_obj:
+            DICT of tables, see get_db_obj
+        :param known_modules:
+            DICT of module name -> ID
+        :param batch_size:
+            INT missions per transaction
+        """
+        self.db_obj = db_obj
+        self.known_modules = known_modules
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+
+    def add(self, mission_data):
+        """
+        Queue a mission, writing the batch once it's full
+        :param mission_data:
+            DICT from build_mission_data
+        :return:
+            LIST of the missions written, empty if the batch isn't full yet
+        """
+        self.pending.append(mission_data)
+        if len(self.pending) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Write the queued missions
+        :return:
+            LIST of the missions written
+        """
+        if not self.pending:
+            return []
+        batch, self.pending = self.pending, []
+        self.write(batch)
+        return batch
+
+    def write(self, batch):
+        """
+        Write missions in one transaction; each gets its 'id' set
+        :param batch:
+            LIST of DICTs from build_mission_data
+        :return:
+            N/A
+        """
+        if not batch:
+            return
+        # the same file twice in a batch is the same row; the later upload wins, as it would one at a time
+        batch = list({mission_data['digest']: mission_data for mission_data in batch}.values())
+        missions = self.db_obj['missions']
+        module_map = self.db_obj['map']
+        rows = [mission_row(mission_data) for mission_data in batch]
+        upsert = mysql_insert(missions)
+        upsert = upsert.on_duplicate_key_update({
+            column: upsert.inserted[column] for column in rows[0] if column != 'digest'
+        })
+
+        with missions.metadata.bind.begin() as conn:
+            conn.execute(upsert, rows)
+            ids = {
+                x.digest: x.id for x in conn.execute(
+                    select([missions.c.id, missions.c.digest]).where(
+                        missions.c.digest.in_([row['digest'] for row in rows])
+                    )
+                )
+            }
+            counts = []
+            for mission_data in batch:
+                mission_data['id'] = ids[mission_data['digest']]
+                counts += module_counts(self.known_modules, mission_data)
+            # re-uploads replace their counts rather than adding to them
+            conn.execute(module_map.delete().where(module_map.c.mission_id.in_(list(ids.values()))))
+            if counts:
+                conn.execute(module_map.insert(), counts)
+
+
+def get_known_digests(db_obj):
+    """
+    Digests of every mission in the DB, so missions we already have are neither parsed nor written again
+    :param db_obj:
+        DICT of tables, see get_db_obj
+    :return:
+        SET of STR hex digests
+    """
+    results = select([
+        db_obj['missions'].c.digest,
+    ]).execute().fetchall()
+    return {x.digest for x in results}
+
+
+def build_mission_data(metadata, parsed, digest):
+    """
+    Massage a mission's metadata and the parsed mission into the DB format
+    :param metadata:
+        DICT of the mission's 'name', and optionally its 'path' and its ED upload 'date' and 'id'
+        (see get_mission_metadata)
+    :param parsed:
+        DICT from MissionParser.parse_mission
+    :param digest:
+        STR hex digest of the mission file
+    :return:
+        DICT for insert_or_update_mission / MissionWriter
+    """
+    playable_factions = 0
+    if parsed['factions']['blue']['slot_count'] > 0:
+        playable_factions += 1
+    if parsed['factions']['red']['slot_count'] > 0:
+        playable_factions += 1
+    if parsed['time'] == 'unknown':
+        # we sometimes fail to parse the time, but we expect the time to be 5 characters reeee
+        parsed['time'] = 'unkwn'
+
+    mission_data = {
+        'ed_upload_date': metadata.get('date'),
+        'ed_id': metadata.get('id'),
+        'name': metadata['name'],
+        'map': parsed['map'],
+        'start_time': parsed['time'],
+        'playable_factions': playable_factions,
+        'format': parsed['format'],
+        'digest': digest,
+        'path': metadata.get('path', 'N/A - see ED site'),
+        'factions': parsed['factions'],
+    }
+    return mission_data
+
+
+def parse_mission_source(source):
+    """
+    Parse a downloaded mission; this is what runs in the pipeline's parse processes
+    :param source:
+        BYTES of the .miz, or its path (see MissionSpool.source)
+    :return:
+        DICT as returned by MissionParser.parse_mission
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return MissionParser().parse_mission(source)
+
+
+def get_db_obj(conf_obj):
+    """
+    Reflect the DCS tables
+    :param conf_obj:
+        ConfigParser which has read config.ini; the [dcs] user, pass, host and port are used
+    :return:
+        DICT of table name -> Table
+    """
+    engine = create_engine(
+        'mysql+pymysql://{user}:{password}@{host}:{port}/{db}'.format(
+            user=conf_obj.get('dcs', 'user'),
+            password=conf_obj.get('dcs', 'pass'),
+            host=conf_obj.get('dcs', 'host'),
+            port=conf_obj.get('dcs', 'port'),
+            db='dcs',
+        )
+    )
+
+    dcs_meta = MetaData(bind=engine)
+
+    return {
+        'missions': Table('missions', dcs_meta, autoload_with=engine),
+        'modules': Table('modules', dcs_meta, autoload_with=engine),
+        'map': Table('mission_module_count', dcs_meta, autoload_with=engine),
+    }
+
+
+def get_known_modules(db_obj):
+    """
+    :param db_obj:
+        DICT of tables, see get_db_obj
+    :return:
+        DICT of module name -> ID
+    """
+    results = select([
+        db_obj['modules'].c.id,
+        db_obj['modules'].c.name,
+    ]).execute().fetchall()
+    return {x.name: x.id for x in results}
@@ -0,0 +1,297 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from missions import (
+    DEFAULT_BATCH_SIZE, MissionParser, MissionWriter, build_mission_data, get_known_digests, insert_or_update_mission,
+    parse_mission_source,
+)
+from ingest_journal import PARSED, PERSISTED, FAILED
+
+# concurrency of the shared stages, overridden by [dcs] parse_workers, queue_size
+DEFAULT_PARSE_WORKERS = os.cpu_count() or 1
+DEFAULT_QUEUE_SIZE = 16
+# seconds a part-filled batch may wait for more missions
+FLUSH_INTERVAL = 5
+
+# marks the end of a pipeline queue
+_DONE = object()
+
+
+class MissionPipeline:
+    """
+    Staged ingestion of missions: the source's stages (e.g. fetch metadata -> download) -> parse -> persist (in
+    batches, see MissionWriter).
+
+    A source (see sources.py) supplies the stages which get a mission's file; parsing and persisting are the same
+    for every source. Each stage runs on its own threads, and the lua parsing on a process pool. Stages are joined by
+    bounded queues, so a slow stage holds the ones before it back rather than piling files up in memory. Persisting
+    happens on the calling thread, so the DB connection is never shared.
+    A mission which fails in any stage is reported and left out; the others carry on.
+    Missions whose file is already in the DB (by digest) are dropped by the source, before they're parsed.
+    """
+    def __init__(self, db_obj, known_modules, source, cache=None, parse_workers=DEFAULT_PARSE_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE, journal=None):
+        """
+        :param db_obj:
+            DICT of tables, see get_db_obj
+        :param known_modules:
+            DICT of module name -> ID
+        :param source:
+            where the missions come from, e.g. sources.EDSource
+        :param cache:
+            MissionCache, or None to parse every mission
+        :param parse_workers:
+            INT processes parsing missions; 0 parses on the pipeline's threads instead
+        :param queue_size:
+            INT missions each stage may have waiting for the next one
+        :param batch_size:
+            INT missions stored per transaction
+        :param journal:
+            IngestJournal to record each mission's progress in, or None (the journal tracks ED missions only)
+        """
+        self.db_obj = db_obj
+        self.known_modules = known_modules
+        self.source = source
+        self.cache = cache
+        self.parse_workers = max(0, parse_workers)
+        self.queue_size = max(1, queue_size)
+        self.batch_size = max(1, batch_size)
+        self.writer = MissionWriter(db_obj, known_modules, batch_size)
+        self.journal = journal
+        self.executor = None
+        self.known_digests = set()
+        self.failed = []
+        self.unchanged = []
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, conf_obj, db_obj, known_modules, source, cache=None, journal=None):
+        """
+        Build the pipeline from the [dcs] section of config.ini
+            parse_workers, queue_size: see __init__
+            batch_size: missions stored per transaction
+        :param conf_obj:
+            ConfigParser which has read config.ini
+        :return:
+            MissionPipeline
+        """
+        return cls(
+            db_obj,
+            known_modules,
+            source,
+            cache,
+            parse_workers=conf_obj.getint('dcs', 'parse_workers', fallback=DEFAULT_PARSE_WORKERS),
+            queue_size=conf_obj.getint('dcs', 'queue_size', fallback=DEFAULT_QUEUE_SIZE),
+            batch_size=conf_obj.getint('dcs', 'batch_size', fallback=DEFAULT_BATCH_SIZE),
+            journal=journal,
+        )
+
+    def run(self, mission_ids):
+        """
+        Ingest the given missions
+        :param mission_ids:
+            LIST of the source's mission IDs (see the source's discover)
+        :return:
+            LIST of the mission IDs which were stored, in the order they finished
+        """
+        self.failed = []
+        self.unchanged = []
+        self.stats = {'missions': len(mission_ids), 'bytes': 0, 'stages': {}}
+        self.known_digests = get_known_digests(self.db_obj)
+        started = time.perf_counter()
+        pending = queue.Queue()
+        for mission_id in mission_ids:
+            pending.put({'id': mission_id})
+        pending.put(_DONE)
+
+        if self.parse_workers:
+            self.executor = ProcessPoolExecutor(self.parse_workers)
+        threads = []
+        inbox = pending
+        for func, workers, state in self.source.stages(self.known_digests, self.executor):
+            outbox = queue.Queue(maxsize=self.queue_size)
+            threads += self.start(func, workers, inbox, outbox, state)
+            inbox = outbox
+        parsed = queue.Queue(maxsize=self.queue_size)
+        # one thread per process keeps every parse process busy
+        threads += self.start(self.parse, max(1, self.parse_workers), inbox, parsed, PARSED)
+        try:
+            stored = self.persist(parsed)
+        finally:
+            for thread in threads:
+                thread.join()
+            if self.executor:
+                self.executor.shutdown()
+                self.executor = None
+        self.stats['stored'] = len(stored)
+        self.stats['elapsed'] = time.perf_counter() - started
+        return stored
+
+    def start(self, func, workers, inbox, outbox, state=None):
+        """
+        Start the threads of one stage
+        :param state:
+            STR journal state of the missions which made it through the stage
+        :return:
+            LIST of threads
+        """
+        remaining = [workers]
+        threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self.work, args=(func, inbox, outbox, remaining, state), daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def work(self, func, inbox, outbox, remaining, state):
+        """
+        Feed missions from inbox through func into outbox until the inbox is done;
+        the last thread of the stage to finish tells the next stage it's done too
+        """
+        while True:
+            job = inbox.get()
+            if job is _DONE:
+                # leave it for the other threads of this stage
+                inbox.put(_DONE)
+                with self.lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(_DONE)
+                return
+            started = time.perf_counter()
+            try:
+                func(job)
+            except Exception as e:
+                self.fail(job, e)
+                continue
+            finally:
+                self.count_time(func.__name__, time.perf_counter() - started)
+            if job.get('unchanged'):
+                with self.lock:
+                    self.unchanged.append(job['id'])
+                if self.journal:
+                    self.journal.mark(job['id'], PERSISTED, 'unchanged')
+                continue
+            if state and self.journal:
+                self.journal.mark(job['id'], state)
+            outbox.put(job)
+
+    def count_time(self, stage, elapsed):
+        with self.lock:
+            self.stats['stages'][stage] = self.stats['stages'].get(stage, 0) + elapsed
+
+    def fail(self, job, error):
+        print("Failed to process mission {}: {!r}".format(job['id'], error))
+        with self.lock:
+            self.failed.append(job['id'])
+        if self.journal:
+            self.journal.mark(job['id'], FAILED, '{}: {}'.format(type(error).__name__, error))
+
+    def parse(self, job):
+        """
+        Parse the mission the source got, from its spool or from its path on disk
+        """
+        spool = job.pop('spool', None)
+        try:
+            parsed = self.cache.get(job['digest']) if self.cache else None
+            if parsed is None:
+                if self.executor:
+                    # large missions are handed over by path rather than copied to the process
+                    parsed = self.executor.submit(
+                        parse_mission_source, spool.source() if spool else job['path'],
+                    ).result()
+                else:
+                    parsed = MissionParser().parse_mission(spool.handle() if spool else job['path'])
+                if self.cache:
+                    self.cache.put(job['digest'], parsed)
+        finally:
+            # the download isn't needed past this point
+            if spool:
+                spool.close()
+        job['parsed'] = parsed
+        with self.lock:
+            self.stats['bytes'] += job.get('size', 0)
+
+    def persist(self, inbox):
+        """
+        Store missions until the inbox is done
+        :return:
+            LIST of the mission IDs stored
+        """
+        stored = []
+        batch = []
+        while True:
+            try:
+                job = inbox.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                # don't sit on a part-filled batch while the stages before us are busy
+                self.store(batch, stored)
+                batch = []
+                continue
+            if job is _DONE:
+                self.store(batch, stored)
+                return stored
+            try:
+                batch.append((job, build_mission_data(job['metadata'], job['parsed'], job['digest'])))
+            except Exception as e:
+                self.fail(job, e)
+                continue
+            if len(batch) >= self.batch_size:
+                self.store(batch, stored)
+                batch = []
+
+    def store(self, batch, stored):
+        """
+        Write a batch of (job, mission data); if the batch fails its missions are written one at a time, so only the
+        ones at fault are lost
+        """
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            self.writer.write([mission_data for _, mission_data in batch])
+            done = [job for job, _ in batch]
+        except Exception as e:
+            print("Failed to store a batch of {} missions ({!r}), storing them one at a time".format(len(batch), e))
+            done = []
+            for job, mission_data in batch:
+                try:
+                    insert_or_update_mission(self.db_obj, self.known_modules, mission_data)
+                except Exception as e:
+                    self.fail(job, e)
+                    continue
+                done.append(job)
+        self.count_time('store', time.perf_counter() - started)
+        for job in done:
+            # the same file twice in one run only needs storing once
+            self.known_digests.add(job['digest'])
+            stored.append(job['id'])
+        if self.journal and done:
+            self.journal.mark([job['id'] for job in done], PERSISTED)
+        print("Stored {} missions ({} done)".format(len(done), len(stored)))
+
+    def report(self):
+        """
+        Throughput of the last run
+        :return:
+            STR of a few lines
+        """
+        elapsed = self.stats.get('elapsed') or 0
+        stored = self.stats.get('stored', 0)
+        megabytes = self.stats.get('bytes', 0) / 2 ** 20
+        lines = [
+            "{} missions in {:.1f}s: {} stored ({:.1f}/s), {} unchanged, {} failed".format(
+                self.stats.get('missions', 0), elapsed, stored, stored / elapsed if elapsed else 0,
+                len(self.unchanged), len(self.failed),
+            ),
+            "{:.1f} MB parsed ({:.2f} MB/s)".format(megabytes, megabytes / elapsed if elapsed else 0),
+        ]
+        # busy time is summed over the threads of a stage, so it can exceed the run's time
+        for stage, busy in sorted(self.stats.get('stages', {}).items(), key=lambda x: -x[1]):
+            lines.append("  {:<10} {:8.1f}s busy".format(stage, busy))
+        return '\n'.join(lines)
@@ -0,0 +1,360 @@
+"""
+Where MissionPipeline gets missions from. A source has
+
+    discover(...): the IDs of the missions to ingest
+    stages(known_digests, executor): LIST of (function, threads, journal state) run on every mission before it's
+        parsed; executor is the pipeline's process pool (None when parsing on threads), for CPU-bound stage work
+
+A stage function gets the mission's job (a DICT holding its 'id') and fills it in. Once the last stage is done the job
+holds the mission's 'digest', its 'metadata' for build_mission_data and its 'size' in bytes, and either a 'spool'
+(MissionSpool) or the 'path' of the file to parse. A stage sets 'unchanged' instead when the mission's digest is in
+known_digests, and the mission goes no further.
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+
+from missions import DEFAULT_SPOOL_SIZE, MissionSpool
+from ingest_journal import DOWNLOADED
+from ed_site import ED_BASE_URL, DEFAULT_DISCOVERY_WINDOW, download_mission, find_missions, get_mission_metadata
+
+# threads per source stage, overridden by [dcs] fetch_workers, download_workers, hash_workers
+DEFAULT_FETCH_WORKERS = 8
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_HASH_WORKERS = 4
+# files at least this many bytes are hashed on the process pool; for smaller ones handing the work over costs more
+# than the hash (which runs without the GIL on the stage's thread anyway)
+POOL_HASH_SIZE = 1024 * 1024
+# hashed files recorded in the manifest per write
+MANIFEST_BATCH_SIZE = 500
+
+
+class EDSource:
+    """
+    Missions uploaded to the ED website: mission IDs from the listing pages, metadata from each mission's details page,
+    and the file streamed into a spool
+    """
+    def __init__(self, client, cache=None, fetch_workers=DEFAULT_FETCH_WORKERS,
+                 download_workers=DEFAULT_DOWNLOAD_WORKERS, base_url=ED_BASE_URL, spool_size=DEFAULT_SPOOL_SIZE,
+                 spool_dir=None, window=DEFAULT_DISCOVERY_WINDOW):
+        """
+        :param client:
+            EDClient; its connection limits cap how many of the fetch and download threads are on the network at once
+        :param cache:
+            MissionCache remembering earlier downloads, so unchanged files aren't downloaded again
+        :param fetch_workers:
+            INT threads looking up mission metadata
+        :param download_workers:
+            INT threads downloading missions
+        :param base_url:
+            ED site (or a stand-in for it)
+        :param spool_size:
+            INT bytes of a download held in memory before it moves to disk
+        :param spool_dir:
+            directory for downloads which move to disk, defaults to the system's temporary directory
+        :param window:
+            INT listing pages to fetch at once
+        """
+        self.client = client
+        self.cache = cache
+        self.fetch_workers = max(1, fetch_workers)
+        self.download_workers = max(1, download_workers)
+        self.base_url = base_url
+        self.spool_size = spool_size
+        self.spool_dir = spool_dir
+        self.window = window
+        self.known_digests = set()
+
+    @classmethod
+    def from_config(cls, conf_obj, client, cache=None):
+        """
+        Build the source from the [dcs] section of config.ini
+            fetch_workers, download_workers: see __init__
+            ed_base_url: ED site to scrape
+            spool_size, spool_dir: where downloads are buffered
+        :param conf_obj:
+            ConfigParser which has read config.ini
+        :return:
+            EDSource
+        """
+        return cls(
+            client,
+            cache,
+            fetch_workers=conf_obj.getint('dcs', 'fetch_workers', fallback=DEFAULT_FETCH_WORKERS),
+            download_workers=conf_obj.getint('dcs', 'download_workers', fallback=DEFAULT_DOWNLOAD_WORKERS),
+            base_url=conf_obj.get('dcs', 'ed_base_url', fallback=ED_BASE_URL),
+            spool_size=conf_obj.getint('dcs', 'spool_size', fallback=DEFAULT_SPOOL_SIZE),
+            spool_dir=conf_obj.get('dcs', 'spool_dir', fallback=None),
+        )
+
+    def discover(self, last_downloaded):
+        """
+        :param last_downloaded:
+            INT ID of the newest mission seen before
+        :return:
+            LIST of the IDs of the missions uploaded since
+        """
+        return find_missions(self.client, last_downloaded, self.base_url, self.window)
+
+    def stages(self, known_digests, executor=None):
+        self.known_digests = known_digests
+        return [
+            (self.fetch, self.fetch_workers, None),
+            (self.download, self.download_workers, DOWNLOADED),
+        ]
+
+    def fetch(self, job):
+        job['metadata'] = get_mission_metadata(self.client, job['id'], self.base_url)
+
+    def download(self, job):
+        spool, job['digest'] = download_mission(
+            self.client, job['metadata']['download_path'], self.spool_size, self.spool_dir, self.cache,
+            self.known_digests,
+        )
+        if spool is None or job['digest'] in self.known_digests:
+            if spool:
+                spool.close()
+            job['unchanged'] = True
+        else:
+            job['spool'] = spool
+            job['size'] = spool.tell()
+
+
+class LocalSource:
+    """
+    Missions in a folder on disk (the [dcs] mission_path), searched recursively for .miz files.
+    The files are hashed where they are and parsed by path, so nothing is copied.
+
+    With a MissionCache the source keeps a manifest of every file's size, mtime and digest, and on a rescan only
+    files whose size or mtime changed are hashed again; the rest reuse the digest from the manifest. Large files which
+    are hashed go to the pipeline's process pool, like the parsing.
+    """
+    def __init__(self, mission_path, hash_workers=DEFAULT_HASH_WORKERS, cache=None, rehash=False):
+        """
+        :param mission_path:
+            directory to search
+        :param hash_workers:
+            INT threads handing files to be hashed
+        :param cache:
+            MissionCache holding the manifest, or None to hash every file
+        :param rehash:
+            BOOL ignore the manifest (it's still updated), e.g. when files may have changed without their mtime
+        """
+        self.mission_path = mission_path
+        self.hash_workers = max(1, hash_workers)
+        self.cache = cache
+        self.rehash = rehash
+        self.scanned = {}
+        self.manifest = {}
+        self.updates = []
+        self.hashed = 0
+        self.executor = None
+        self.known_digests = set()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, conf_obj, mission_path=None, cache=None, rehash=False):
+        """
+        Build the source from the [dcs] section of config.ini
+            mission_path: directory to search, unless one is given
+            hash_workers: see __init__
+        :param conf_obj:
+            ConfigParser which has read config.ini
+        :return:
+            LocalSource
+        """
+        return cls(
+            mission_path or conf_obj.get('dcs', 'mission_path'),
+            conf_obj.getint('dcs', 'hash_workers', fallback=DEFAULT_HASH_WORKERS),
+            cache,
+            rehash,
+        )
+
+    def discover(self):
+        """
+        Walk the folder, noting each mission's size and mtime; manifest entries of missions which are gone are dropped
+        :return:
+            LIST of STR paths of the missions
+        """
+        self.scanned = dict(scan_missions(self.mission_path))
+        self.manifest = self.cache.get_files() if self.cache else {}
+        root = os.path.join(os.path.abspath(self.mission_path), '')
+        gone = [path for path in self.manifest if path.startswith(root) and path not in self.scanned]
+        if gone:
+            self.cache.forget_files(gone)
+        return sorted(self.scanned)
+
+    def stages(self, known_digests, executor=None):
+        self.known_digests = known_digests
+        self.executor = executor
+        self.hashed = 0
+        return [
+            (self.hash, self.hash_workers, None),
+        ]
+
+    def hash(self, job):
+        path = job['id']
+        size, mtime = self.scanned[path]
+        entry = self.manifest.get(path)
+        if entry and not self.rehash and entry[:2] == (size, mtime):
+            digest = entry[2]
+        else:
+            if self.executor and size >= POOL_HASH_SIZE:
+                digest = self.executor.submit(mission_hash, path).result()[0]
+            else:
+                digest = mission_hash(path)[0]
+            # the stat from the scan is recorded, so a file which changed since then is hashed again next time
+            self.record((path, size, mtime, digest))
+        job['digest'] = digest
+        if digest in self.known_digests:
+            job['unchanged'] = True
+            return
+        job['path'] = path
+        job['size'] = size
+        job['metadata'] = {
+            'name': os.path.basename(path),
+            'path': path,
+        }
+
+    def record(self, entry):
+        with self.lock:
+            self.hashed += 1
+            self.updates.append(entry)
+            if len(self.updates) < MANIFEST_BATCH_SIZE:
+                return
+            updates, self.updates = self.updates, []
+        if self.cache:
+            self.cache.put_files(updates)
+
+    def save_manifest(self):
+        """
+        Write the manifest entries which are still pending; call once the pipeline is done
+        """
+        with self.lock:
+            updates, self.updates = self.updates, []
+        if self.cache and updates:
+            self.cache.put_files(updates)
+
+
+class GDriveSource:
+    """
+    Missions in a Google Drive folder and the folders below it. Drive reports each file's MD5, so files already in the
+    DB are recognised before they're downloaded; the rest are streamed into a spool.
+    """
+    def __init__(self, gdrive, folder_id=None, download_workers=DEFAULT_DOWNLOAD_WORKERS,
+                 spool_size=DEFAULT_SPOOL_SIZE, spool_dir=None):
+        """
+        :param gdrive:
+            GDrive
+        :param folder_id:
+            STR Drive ID of the folder to search, defaults to the GDrive's base folder
+        :param download_workers:
+            INT threads downloading missions
+        :param spool_size:
+            INT bytes of a download held in memory before it moves to disk
+        :param spool_dir:
+            directory for downloads which move to disk, defaults to the system's temporary directory
+        """
+        self.gdrive = gdrive
+        self.folder_id = folder_id or gdrive.base_folder_id
+        self.download_workers = max(1, download_workers)
+        self.spool_size = spool_size
+        self.spool_dir = spool_dir
+        self.files = {}
+        self.known_digests = set()
+
+    @classmethod
+    def from_config(cls, conf_obj, gdrive, folder_id=None):
+        """
+        Build the source from the [dcs] section of config.ini
+            download_workers: see __init__
+            spool_size, spool_dir: where downloads are buffered
+        :param conf_obj:
+            ConfigParser which has read config.ini
+        :return:
+            GDriveSource
+        """
+        return cls(
+            gdrive,
+            folder_id,
+            download_workers=conf_obj.getint('dcs', 'download_workers', fallback=DEFAULT_DOWNLOAD_WORKERS),
+            spool_size=conf_obj.getint('dcs', 'spool_size', fallback=DEFAULT_SPOOL_SIZE),
+            spool_dir=conf_obj.get('dcs', 'spool_dir', fallback=None),
+        )
+
+    def discover(self):
+        """
+        :return:
+            LIST of STR Drive IDs of the missions
+        """
+        self.files = {item['id']: item for item in self.gdrive.list_missions(self.folder_id)}
+        return list(self.files)
+
+    def stages(self, known_digests, executor=None):
+        self.known_digests = known_digests
+        return [
+            (self.download, self.download_workers, None),
+        ]
+
+    def download(self, job):
+        item = self.files[job['id']]
+        if item.get('md5Checksum') in self.known_digests:
+            job['digest'] = item['md5Checksum']
+            job['unchanged'] = True
+            return
+        spool = MissionSpool(self.spool_size, self.spool_dir)
+        try:
+            job['digest'] = self.gdrive.download_file(job['id'], spool)
+        except Exception:
+            spool.close()
+            raise
+        if job['digest'] in self.known_digests:
+            spool.close()
+            job['unchanged'] = True
+            return
+        job['spool'] = spool
+        job['size'] = spool.tell()
+        job['metadata'] = {
+            'name': item['title'],
+            'path': item.get('alternateLink') or 'gdrive:{}'.format(job['id']),
+        }
+
+
+def scan_missions(mission_path):
+    """
+    Find the missions below a folder
+    :param mission_path:
+        directory to search
+    :return:
+        generator of (STR absolute path, (INT size, INT mtime in ns)) of every .miz file
+    """
+    # scandir hands back the directory entries with their type, so only the missions need a stat
+    pending = [os.path.abspath(mission_path)]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                elif entry.name.endswith('.miz') and entry.is_file():
+                    stat = entry.stat()
+                    yield entry.path, (stat.st_size, stat.st_mtime_ns)
+
+
+def mission_hash(mission_path):
+    """
+    Calculate the hex digest of a given file. The file is mapped into memory rather than read, so it isn't copied
+    through a buffer, and the hashing runs without the GIL
+    :param mission_path:
+        path to mission file
+    :return:
+        STR of hex digest (MD5 for speed), INT size in bytes
+    """
+    with open(mission_path, 'rb') as mission_file:
+        size = os.fstat(mission_file.fileno()).st_size
+        if not size:
+            # empty files can't be mapped
+            return hashlib.md5().hexdigest(), 0
+        with mmap.mmap(mission_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.md5(mapped).hexdigest(), size
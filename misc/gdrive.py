@@ -2,6 +2,18 @@ import requests
 import json
 import configparser
 import csv
+import hashlib
+import threading
+import time
+
+# bytes of a file read from the network at a time by download_file
+CHUNK_SIZE = 256 * 1024
+# files listed per request by list_missions (the most Drive allows)
+PAGE_SIZE = 1000
+# cells of the module ownership sheets which mean the pilot doesn't have the module
+NOT_OWNED = ['', '-', '0', 'n', 'no', 'false']
+# seconds the ownership sheets are used before they're downloaded again
+DEFAULT_PILOTS_REFRESH = 60
 
 
 class GDrive:
@@ -18,7 +30,7 @@ class GDrive:
         self.st_module_id = '1KMzOyT4HdDm5u42O1pDuBdLMxBaGQMt-z_pEl1tGEG8'
         self.leetsaber_module_id = '1Pl0rFF3s1vzfxAg0r0gFZ7Rl8mKCrdFiKM2c8vl9lQE'
 
-    def _make_request_(self, method, endpoint, data=None, query_params=None):
+    def _make_request_(self, method, endpoint, data=None, query_params=None, stream=False):
         headers = {
             ''
         }
@@ -27,7 +39,8 @@ class GDrive:
             url += '&' + query_params
         if method == 'GET':
             reply = requests.get(
-                url
+                url,
+                stream=stream,
             )
             try:
                 reply.raise_for_status()
@@ -45,7 +58,7 @@ class GDrive:
                     print(reply.json())
                     self.access_token = reply.json()['access_token']
                     print(self.access_token)
-                    reply = self._make_request_(method, endpoint, data, query_params)
+                    reply = self._make_request_(method, endpoint, data, query_params, stream)
                 else:
                     print(reply.text, reply.status_code)
                     raise e
@@ -117,6 +130,50 @@ class GDrive:
             all_items += self.get_folders(folder['id'])
         return all_items
 
+    def list_missions(self, folder_id):
+        """
+        Find the missions in a folder and the folders below it
+        :param folder_id:
+            STR Drive ID of the folder
+        :return:
+            LIST of DICTs of the Drive file resources (id, title, md5Checksum, fileSize, alternateLink)
+        """
+        folders = [folder_id] + list(set(self.get_folders(folder_id)))
+        missions = []
+        for folder in folders:
+            page_token = None
+            while True:
+                query_params = (
+                    "q='{}'+in+parents+and+trashed+=+false+and+title+contains+'.miz'&maxResults={}"
+                    "&fields=nextPageToken,items(id,title,md5Checksum,fileSize,alternateLink)"
+                ).format(folder, PAGE_SIZE)
+                if page_token:
+                    query_params += '&pageToken={}'.format(page_token)
+                reply = self._make_request_('GET', 'files', query_params=query_params).json()
+                missions += [x for x in reply['items'] if x['title'].lower().endswith('.miz')]
+                page_token = reply.get('nextPageToken')
+                if not page_token:
+                    break
+        return missions
+
+    def download_file(self, file_id, fp):
+        """
+        Stream a file's contents into fp, hashing them as they arrive
+        :param file_id:
+            STR Drive ID of the file
+        :param fp:
+            binary file to write to
+        :return:
+            STR hex digest (MD5) of the file
+        """
+        m = hashlib.md5()
+        reply = self._make_request_('GET', 'files/{}'.format(file_id), query_params='alt=media', stream=True)
+        with reply:
+            for chunk in reply.iter_content(CHUNK_SIZE):
+                m.update(chunk)
+                fp.write(chunk)
+        return m.hexdigest()
+
     def list_files(self):
         folders = list(set(self.get_folders(self.base_folder_id)))
         print(len(folders))
@@ -135,3 +192,44 @@ class GDrive:
                 ))
             except Exception:
                 pass
+
+
+def owned_modules(pilot_modules):
+    """
+    :param pilot_modules:
+        DICT of module -> cell of the ownership sheet, one pilot's entry of what get_pilots returns
+    :return:
+        LIST of the modules the pilot owns
+    """
+    return [module for module, cell in pilot_modules.items() if cell.strip().lower() not in NOT_OWNED]
+
+
+class PilotCache:
+    """
+    The pilots and modules of the ownership sheets (see GDrive.get_pilots), downloaded again once older than
+    refresh_interval rather than on every request
+    """
+    def __init__(self, gdrive, refresh_interval=DEFAULT_PILOTS_REFRESH):
+        """
+        :param gdrive:
+            GDrive to read the ownership sheets with
+        :param refresh_interval:
+            INT seconds the sheets are used before they're downloaded again
+        """
+        self.gdrive = gdrive
+        self.refresh_interval = refresh_interval
+        self.pilots = None
+        self.refreshed = 0
+        self.lock = threading.Lock()
+
+    def get_pilots(self):
+        """
+        :return:
+            the pilots and modules as GDrive.get_pilots returns them
+        """
+        with self.lock:
+            # requests waiting on a download use its result rather than downloading the sheets again
+            if self.pilots is None or time.monotonic() - self.refreshed > self.refresh_interval:
+                self.pilots = self.gdrive.get_pilots()
+                self.refreshed = time.monotonic()
+            return self.pilots
@@ -0,0 +1,150 @@
+"""
+Ingest missions into the DCS database from a folder on disk, the ED website or Google Drive
+
+    python -m misc.ingest --source local|ed|gdrive [--workers N] [--parse-workers N] [--batch M]
+
+Every source feeds the same pipeline (see misc/dcs/pipeline.py): its own stages get each mission's file, then the
+missions are parsed on a process pool and stored in batches. Missions already in the DB (by digest) are skipped.
+The options override the [dcs] settings of config.ini; throughput is reported at the end.
+"""
+import argparse
+import configparser
+import os
+import sys
+
+# the ingestion modules import each other (and lua) as siblings
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dcs'))
+
+from misc.gdrive import GDrive
+from missions import get_db_obj, get_known_modules
+from mission_cache import MissionCache
+from ed_client import EDClient
+from ingest_journal import IngestJournal
+from pipeline import MissionPipeline
+from sources import EDSource, GDriveSource, LocalSource
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'config.ini')
+
+
+def get_config(args):
+    """
+    Read config.ini, with the command line's settings on top
+    :param args:
+        argparse.Namespace
+    :return:
+        ConfigParser
+    """
+    conf_obj = configparser.ConfigParser()
+    conf_obj.read(CONFIG_PATH)
+    if not conf_obj.has_section('dcs'):
+        conf_obj.add_section('dcs')
+    overrides = {
+        'fetch_workers': args.workers,
+        'download_workers': args.workers,
+        'hash_workers': args.workers,
+        'parse_workers': args.parse_workers,
+        'queue_size': args.queue_size,
+        'batch_size': args.batch,
+    }
+    for key, value in overrides.items():
+        if value is not None:
+            conf_obj.set('dcs', key, str(value))
+    return conf_obj
+
+
+def get_gdrive(conf_obj):
+    return GDrive(
+        conf_obj.get('google-drive', 'client_id'),
+        conf_obj.get('google-drive', 'client_secret'),
+        conf_obj.get('google-drive', 'refresh_token'),
+        conf_obj.get('google-drive', 'access_token'),
+    )
+
+
+def ingest_local(conf_obj, db_obj, known_modules, mission_cache, args):
+    source = LocalSource.from_config(conf_obj, args.path, mission_cache, args.rehash)
+    pipeline = MissionPipeline.from_config(conf_obj, db_obj, known_modules, source, mission_cache)
+    missions = source.discover()
+    print("Found {} missions in {}".format(len(missions), source.mission_path))
+    try:
+        pipeline.run(missions)
+    finally:
+        source.save_manifest()
+    print("Hashed {} missions, the rest were unchanged since the last scan".format(source.hashed))
+    return pipeline
+
+
+def ingest_gdrive(conf_obj, db_obj, known_modules, mission_cache, args):
+    source = GDriveSource.from_config(conf_obj, get_gdrive(conf_obj), args.folder)
+    pipeline = MissionPipeline.from_config(conf_obj, db_obj, known_modules, source, mission_cache)
+    missions = source.discover()
+    print("Found {} missions in Google Drive".format(len(missions)))
+    pipeline.run(missions)
+    return pipeline
+
+
+def ingest_ed(conf_obj, db_obj, known_modules, mission_cache, args):
+    """
+    New missions from the ED website, plus whatever earlier runs didn't finish (see IngestJournal)
+    """
+    journal = IngestJournal.from_config(conf_obj)
+    if args.retry_failed:
+        print("Retrying {} failed missions".format(journal.retry_failed(args.max_attempts)))
+    # the newest mission we know of: the journal's, or for a journal which is still empty, the last_downloaded
+    # which older versions kept in config.ini
+    last_mission = journal.last_discovered()
+    if last_mission is None:
+        last_mission = conf_obj.getint('dcs', 'last_downloaded', fallback=0)
+    try:
+        with EDClient.from_config(conf_obj) as ed_client:
+            source = EDSource.from_config(conf_obj, ed_client, mission_cache)
+            pipeline = MissionPipeline.from_config(conf_obj, db_obj, known_modules, source, mission_cache, journal)
+            journal.discover(source.discover(last_mission))
+            pipeline.run(journal.claim())
+    finally:
+        # anything claimed but not finished goes to the next run
+        journal.release()
+    print("Journal: {}".format(journal.counts()))
+    journal.close()
+    return pipeline
+
+
+SOURCES = {
+    'local': ingest_local,
+    'ed': ingest_ed,
+    'gdrive': ingest_gdrive,
+}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--source', required=True, choices=sorted(SOURCES), help='where to ingest missions from')
+    arg_parser.add_argument('--workers', type=int, help='threads per source stage (hashing, fetching, downloading)')
+    arg_parser.add_argument('--parse-workers', type=int, help='processes parsing missions, 0 to parse on threads')
+    arg_parser.add_argument('--batch', type=int, help='missions stored per transaction')
+    arg_parser.add_argument('--queue-size', type=int, help='missions each stage may have waiting for the next')
+    arg_parser.add_argument('--path', help='local: directory to search, defaults to [dcs] mission_path')
+    arg_parser.add_argument('--rehash', action='store_true', help='local: hash every mission, even ones whose size '
+                                                                  'and mtime are unchanged since the last scan')
+    arg_parser.add_argument('--folder', help='gdrive: ID of the folder to search, defaults to the missions folder')
+    arg_parser.add_argument('--retry-failed', action='store_true', help='ed: retry the missions which failed before')
+    arg_parser.add_argument('--max-attempts', type=int, help='ed: with --retry-failed, give up on missions which '
+                                                             'failed this many times')
+    args = arg_parser.parse_args(argv)
+
+    conf_obj = get_config(args)
+    db_obj = get_db_obj(conf_obj)
+    # read the modules once and pass them around
+    known_modules = get_known_modules(db_obj)
+    mission_cache = MissionCache.from_config(conf_obj)
+    try:
+        pipeline = SOURCES[args.source](conf_obj, db_obj, known_modules, mission_cache, args)
+    finally:
+        mission_cache.close()
+    if pipeline.failed:
+        print("Failed to process {} missions: {}".format(len(pipeline.failed), sorted(pipeline.failed)))
+    print(pipeline.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,7 @@
 # lua table serialization
 
 from misc.lua.parse import loads
-from misc.lua.serialize import dumps
+from misc.lua.serialize import dumps, dump
+from misc.lua.stream import iterparse, load
+from misc.lua.compact import Record
+from misc.lua.lazy import LazyDocument
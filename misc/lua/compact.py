@@ -0,0 +1,110 @@
+import keyword
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, Union
+
+# record classes by their keys, shared between parses so every unit of a given shape uses the same class
+RECORD_TYPES: Dict[Tuple[str, ...], Type['Record']] = {}
+
+
+class Record:
+    """
+    Fixed shape table stored in __slots__ instead of a dict. Supports the read-only parts of the dict interface,
+    so code written against loads() output (`unit['type']`, `unit.get('skill')`, `unit.items()`) keeps working.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__slots__
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.__slots__
+
+    def values(self) -> List[Any]:
+        return [getattr(self, key) for key in self.__slots__]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Record):
+            return self.items() == other.items()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return '{name}({fields})'.format(
+            name=type(self).__name__,
+            fields=', '.join('{key}={value!r}'.format(key=key, value=value) for key, value in self.items()),
+        )
+
+
+# names a slot would shadow: a table with any of these keys stays a dict
+RECORD_ATTRIBUTES = frozenset(dir(Record))
+
+
+def record_type(keys: Tuple[str, ...]) -> Optional[Type[Record]]:
+    """
+    Record class for tables with exactly these keys
+    :return:
+        class, or None if the keys can't be used as slot names or would hide Record's methods (get, items, ...)
+    """
+    cls = RECORD_TYPES.get(keys)
+    if cls is None:
+        for key in keys:
+            if not isinstance(key, str) or not key.isidentifier() or keyword.iskeyword(key) or key.startswith('__'):
+                return None
+            if key in RECORD_ATTRIBUTES:
+                return None
+        cls = RECORD_TYPES[keys] = type('Record', (Record,), {'__slots__': keys})
+    return cls
+
+
+def compact_table(d: Dict[Union[int, str], Any], record: bool = False) -> Union[Dict, List, Record]:
+    """
+    Convert a table to its compact representation
+    :param d:
+        converted table
+    :param record:
+        True to turn tables keyed by names into records
+    :return:
+        list for tables keyed 1..n, a Record if requested and possible, otherwise d itself
+    """
+    n = len(d)
+    if not n:
+        return d
+    if 1 in d and n in d:
+        # keys are unique, so n int keys all in 1..n means the table is dense
+        for key in d:
+            if type(key) is not int or key < 1 or key > n:
+                break
+        else:
+            return [d[i] for i in range(1, n + 1)]
+    if record:
+        cls = record_type(tuple(d))
+        if cls is not None:
+            r = cls.__new__(cls)
+            for key, value in d.items():
+                setattr(r, key, value)
+            return r
+    return d
@@ -0,0 +1,161 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Union
+
+from .tokenizer import (
+    SKIP, SKIP_BYTES, SKIP_OPEN, SKIP_CLOSE, TokenParser, DEFAULT_ENCODING, DEFAULT_FALLBACK_ENCODING,
+)
+
+
+class LazyDocument(Mapping):
+    """
+    Read-only view of a lua file whose tables are only converted when they are used.
+
+    One SKIP scan over the buffer records where every table starts and ends. Indexing a table then converts just its
+    own entries: scalars become python values, nested tables become LazyTables which jump straight to their end.
+
+        doc = LazyDocument(mission_str)
+        doc['mission']['coalition']['blue']['name']
+
+    touches three levels of the mission, however large the rest of it is.
+    """
+    def __init__(self, buffer: Union[str, bytes, memoryview], _globals: Optional[dict] = None,
+                 encoding: str = DEFAULT_ENCODING, fallback_encoding: str = DEFAULT_FALLBACK_ENCODING):
+        """
+        :param buffer:
+            lua source, e.g. the `mission` file inside a .miz, as a str or bytes-like (bytes, memoryview, mmap)
+        :param _globals:
+            variables which are already defined
+        :param encoding:
+            see misc.lua.parse.loads
+        :param fallback_encoding:
+            see misc.lua.parse.loads
+        """
+        self.buffer: Union[str, bytes, memoryview] = buffer
+        self.encoding: str = encoding
+        self.fallback_encoding: str = fallback_encoding
+        # position of each opening brace -> position after its closing brace
+        self.ends: Dict[int, int] = self.index()
+        self.variables: Dict[str, Any] = self.parser(_globals).parse()
+
+    def index(self) -> Dict[int, int]:
+        """
+        Match up every pair of braces in the buffer, skipping over strings and comments
+        """
+        ends = {}
+        opened = []
+        scan = SKIP if isinstance(self.buffer, str) else SKIP_BYTES
+        for m in scan.finditer(self.buffer):
+            kind = m.lastindex
+            if kind == SKIP_OPEN:
+                opened.append(m.end() - 1)
+            elif kind == SKIP_CLOSE:
+                if not opened:
+                    raise self.parser().error(m.end() - 1, "Unexpected token '}'")
+                ends[opened.pop()] = m.end()
+            else:
+                # a string without its closing quote, or the end of the buffer
+                if kind is not None or opened:
+                    raise self.parser().eob_exception(len(self.buffer))
+                break
+        return ends
+
+    def parser(self, _globals: Optional[dict] = None) -> 'LazyParser':
+        return LazyParser(self, _globals)
+
+    def __getitem__(self, name: str) -> Any:
+        return self.variables[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.variables)
+
+    def __len__(self) -> int:
+        return len(self.variables)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the whole document, like misc.lua.parse.loads
+        """
+        return {name: value.to_dict() if isinstance(value, LazyTable) else value
+                for name, value in self.variables.items()}
+
+
+class LazyTable(Mapping):
+    """
+    Table of a LazyDocument, converted one level at a time on first use
+    """
+    __slots__ = ('document', 'start', 'path', '_entries')
+
+    def __init__(self, document: LazyDocument, start: int, path: tuple):
+        """
+        :param document:
+            LazyDocument the table belongs to
+        :param start:
+            position of the opening brace
+        :param path:
+            keys leading to the table
+        """
+        self.document = document
+        self.start = start
+        self.path = path
+        self._entries: Optional[Dict[Union[int, str], Any]] = None
+
+    @property
+    def end(self) -> int:
+        """
+        Position after the closing brace
+        """
+        return self.document.ends[self.start]
+
+    @property
+    def entries(self) -> Dict[Union[int, str], Any]:
+        if self._entries is None:
+            parser = self.document.parser()
+            self._entries = parser.table(parser.tokens(self.start + 1), self.path)[0]
+        return self._entries
+
+    def __getitem__(self, key: Union[int, str]) -> Any:
+        return self.entries[key]
+
+    def __iter__(self) -> Iterator[Union[int, str]]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def source(self) -> str:
+        """
+        Lua source of the table, braces included
+        """
+        return self.document.buffer[self.start:self.end]
+
+    def to_dict(self) -> Dict[Union[int, str], Any]:
+        """
+        Convert the whole table, nested tables included
+        """
+        document = self.document
+        parser = TokenParser(document.buffer, encoding=document.encoding, fallback_encoding=document.fallback_encoding)
+        return parser.table(parser.tokens(self.start + 1), self.path)[0]
+
+    def __repr__(self) -> str:
+        return 'LazyTable({path}, {start}:{end})'.format(path='.'.join(map(str, self.path)), start=self.start,
+                                                          end=self.end)
+
+
+class LazyParser(TokenParser):
+    """
+    TokenParser which leaves every nested table to a LazyTable, jumping over it with the brace index
+    """
+    def __init__(self, document: LazyDocument, _globals: Optional[dict] = None):
+        super().__init__(document.buffer, _globals, skip=['*'], encoding=document.encoding,
+                         fallback_encoding=document.fallback_encoding)
+        self.document = document
+
+    def skip_table(self, pos: int) -> None:
+        end = self.document.ends.get(pos - 1)
+        if end is None:
+            raise self.eob_exception(len(self.buffer))
+        self.resume = end
+
+    def skipped(self, pos: int, path: tuple) -> LazyTable:
+        self.skip_table(pos)
+        return LazyTable(self.document, pos - 1, path)
@@ -1,7 +1,47 @@
-from typing import Dict, Any, Optional, List, Union
-
-
-def loads(tablestr, _globals: Optional[Dict[str, Any]] = None):
+from typing import Dict, Any, Iterable, Optional, List, Union
+from .tokenizer import TokenParser, DEFAULT_ENCODING, DEFAULT_FALLBACK_ENCODING
+
+ENGINES = ('tokenizer', 'legacy')
+
+
+def loads(tablestr, _globals: Optional[Dict[str, Any]] = None, engine: str = 'tokenizer',
+          skip: Optional[Iterable[Union[str, tuple]]] = None, compact: bool = False,
+          records: Optional[Iterable[Union[str, tuple]]] = None, encoding: str = DEFAULT_ENCODING,
+          fallback_encoding: str = DEFAULT_FALLBACK_ENCODING):
+    """
+    Parse a lua table string (e.g. the `mission` file inside a .miz) into python objects
+    :param tablestr:
+        lua source to parse, either a str or bytes-like (bytes, memoryview, mmap). Bytes are parsed without decoding
+        the whole buffer first; only string literals are decoded
+    :param _globals:
+        variables which are already defined
+    :param engine:
+        'tokenizer' scans the buffer with compiled regular expressions (fast)
+        'legacy' walks the buffer one character at a time
+    :param skip:
+        key paths of tables to leave out of the result, either dotted strings or tuples, `*` matching any key.
+        A pattern matches the end of a table's path, so 'route.points' drops the waypoints of every group.
+        Skipped tables are jumped over with a brace matching scan instead of being converted (tokenizer engine only).
+    :param compact:
+        True to return tables keyed 1..n (arrays) as lists instead of dicts (tokenizer engine only)
+    :param records:
+        key paths of tables to return as slotted misc.lua.compact.Record objects instead of dicts, e.g. 'units.*'.
+        Records are read like dicts but take a fraction of the memory. Implies compact (tokenizer engine only).
+    :param encoding:
+        encoding of a bytes-like tablestr
+    :param fallback_encoding:
+        encoding for string literals which aren't valid in encoding, undecodable bytes are replaced
+    :return:
+        dict of variable name -> value
+    """
+    if engine == 'tokenizer':
+        return TokenParser(tablestr, _globals, skip, compact, records, encoding, fallback_encoding).parse()
+    elif engine != 'legacy':
+        raise ValueError("Unknown engine '{engine}', expected one of {engines}".format(engine=engine, engines=ENGINES))
+    elif skip or compact or records:
+        raise ValueError("The legacy engine does not support skip, compact or records")
+    elif not isinstance(tablestr, str):
+        tablestr = bytes(tablestr).decode(encoding)
 
     class Parser:
         def __init__(self, buffer: str, _globals: dict = None):
@@ -1,44 +1,124 @@
-def dumps(value, varname=None, indent=None):
-    nl = "\n" if indent else ""
-    s = varname + '=' + nl if varname else ''
-    indentcount = 0 if indent is None else indent
-
-    if isinstance(value, dict):
-        e = []
-        for key in sorted(value.keys(), key=str):
-            child = value[key]
-            KNL = "\n" if indent and isinstance(child, (dict, list)) else ""
-            selem = '\t' * indentcount
-            skey = key if isinstance(key, int) else '"{key}"'.format(key=key)
-            selem += '[{key}]={nl}'.format(key=skey, nl=KNL)
-            selem += dumps(value[key], indent=indent + 1 if indent else None)
-            e.append(selem)
-        s += '\t' * (indent - 1) if nl else ""
-        s += "{"
-        if e:
-            s += nl + ",{nl}".format(nl=nl).join(e)
-        s += nl + '\t' * (indentcount - 1) + "}"
-    elif isinstance(value, list):
-        e = []
-        i = 1
-        for v in value:
-            selem = '\t' * indentcount + "[{i}]=".format(i=i)
-            selem += dumps(v, indent=indent + 1 if indent else None)
-            e.append(selem)
-            i += 1
-        s += '\t' * (indent - 1) if nl else ""
-        s += "{"
-        if e:
-            s += nl + ",{nl}".format(nl=nl).join(e)
-        s += nl + '\t' * (indentcount - 1) + "}"
-    elif isinstance(value, str):
-        v = value.replace('\\', '\\\\')
-        v = v.replace('"', '\\"')
-        v = v.replace('\n', '\\\n')
-        s += '"{val}"'.format(val=v)
-    elif isinstance(value, bool):
-        s += "true" if value else "false"
+import io
+
+from .compact import Record
+
+# number of pieces collected before they are handed to fp.write
+BUFFER_PARTS = 4096
+# returned by an exhausted _entries generator
+_END = object()
+
+
+def dumps(value, varname=None, indent=None, sort_keys=True):
+    """
+    Serialize value to a lua table string, see dump
+    """
+    fp = io.StringIO()
+    dump(value, fp, varname, indent, sort_keys)
+    return fp.getvalue()
+
+
+def dump(value, fp, varname=None, indent=None, sort_keys=True):
+    """
+    Serialize value as lua, writing it to fp piece by piece instead of building the whole string
+    :param value:
+        dict, list, misc.lua.compact.Record, str, bool or number
+    :param fp:
+        file-like object opened in text or binary (utf-8) mode, e.g. a member of a .miz opened with ZipFile.open(..., 'w')
+    :param varname:
+        assign the value to this variable (`varname=value`)
+    :param indent:
+        indentation level to start at, None for a single line
+    :param sort_keys:
+        False to write dict keys in insertion order, which is faster and keeps the order loads() read them in
+    :return:
+        N/A
+    """
+    if isinstance(fp, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(fp, 'mode', ''):
+        text = io.TextIOWrapper(fp, encoding='utf-8', newline='')
+        try:
+            _dump(value, text.write, varname, indent, sort_keys)
+        finally:
+            text.flush()
+            # leave fp open for the caller
+            text.detach()
     else:
-        s += str(value)
+        _dump(value, fp.write, varname, indent, sort_keys)
 
-    return s
+
+def _dump(value, write, varname, indent, sort_keys):
+    out = []
+    nl = "\n" if indent else ""
+    if varname:
+        out.append(varname + '=' + nl)
+
+    # tables being written, each one a generator which writes the scalar entries itself and yields the nested tables
+    stack = []
+    child = value
+    level = indent
+    while True:
+        if isinstance(child, (dict, list, Record)):
+            out.append('\t' * (level - 1) + '{' if level else '{')
+            stack.append((_entries(child, level, nl, sort_keys, out), level))
+        else:
+            out.append(_scalar(child))
+
+        # pop finished tables until there is a nested table to write
+        while stack:
+            entries, level = stack[-1]
+            child = next(entries, _END)
+            if child is not _END:
+                break
+            stack.pop()
+            out.append(nl + '\t' * ((level or 0) - 1) + '}')
+        else:
+            break
+        level = level + 1 if level else None
+
+        if len(out) >= BUFFER_PARTS:
+            write(''.join(out))
+            out.clear()
+    write(''.join(out))
+
+
+def _entries(value, level, nl, sort_keys, out):
+    """
+    Write the entries of a table to out, yielding each nested table after its `[key]=` prefix was written
+    """
+    tabs = '\t' * (level or 0)
+    first = nl + tabs + '['
+    sep = ',' + nl + tabs + '['
+    prefix = first
+    if isinstance(value, list):
+        for i, child in enumerate(value, 1):
+            if isinstance(child, (dict, list, Record)):
+                out.append(prefix + str(i) + ']=')
+                yield child
+            else:
+                out.append(prefix + str(i) + ']=' + _scalar(child))
+            prefix = sep
+        return
+
+    keys = value.keys()
+    if sort_keys:
+        keys = sorted(keys, key=str)
+    for key in keys:
+        child = value[key]
+        skey = str(key) if isinstance(key, int) else _scalar(str(key))
+        if isinstance(child, (dict, list, Record)):
+            out.append(prefix + skey + ']=' + nl)
+            yield child
+        else:
+            out.append(prefix + skey + ']=' + _scalar(child))
+        prefix = sep
+
+
+def _scalar(value):
+    if isinstance(value, str):
+        if '\\' in value or '"' in value or '\n' in value:
+            value = value.replace('\\', '\\\\')
+            value = value.replace('"', '\\"')
+            value = value.replace('\n', '\\\n')
+        return '"' + value + '"'
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
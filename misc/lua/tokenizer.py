@@ -0,0 +1,503 @@
+import re
+from operator import itemgetter
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .compact import compact_table
+
+# whitespace and `--` line comments
+WHITESPACE = r'\s*(?:--[^\n]*\s*)*'
+STRING_LITERAL = r'"([^"\\]*(?:\\.[^"\\]*)*)"'
+INT_LITERAL = r'(-?\d+)(?![.\deE])'
+FLOAT_LITERAL = r'(-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+
+# Every match eats the whitespace in front of it and then one of:
+#   * a whole `[key] = value,` table field, which is what nearly all of a mission file consists of
+#   * the start of a `[key] = {` field
+#   * a closing brace, with its trailing comma
+#   * a single token, for everything else (positional values, `name = value`, statements, `_("...")`)
+# The end of buffer and unexpected characters have their own groups, so the expression matches at every position
+# and `finditer` yields one contiguous stream of tokens.
+TOKEN = re.compile(WHITESPACE + r'''(?:
+    \[\s*(?:''' + STRING_LITERAL + r'|(-?\d+))\s*\]\s*=' + WHITESPACE + r'''(?:
+        (\{)
+        |(?:''' + STRING_LITERAL + '|' + INT_LITERAL + '|' + FLOAT_LITERAL + r'''|(true)(?!\w)|(false)(?!\w))
+        ''' + WHITESPACE + r'''(?:,|(?=\}))
+    )
+    |(\})''' + WHITESPACE + r''',
+    |(\})
+    |(\{)
+    |''' + STRING_LITERAL + '|' + INT_LITERAL + '|' + FLOAT_LITERAL + r'''|(true)(?!\w)|(false)(?!\w)
+    |([A-Za-z_]\w*)''' + WHITESPACE + r'''=(?!=)
+    |([A-Za-z_]\w*)
+    |(=)
+    |([,;])
+    |(\()
+    |(\))
+    |(\[)
+    |(\])
+    |(\Z)
+    |(.)
+)''', re.VERBOSE | re.DOTALL)
+UNESCAPE = re.compile(r'\\(.)', re.DOTALL)
+# replacement for UNESCAPE.sub; much faster than the equivalent r'\1' template
+ESCAPED = itemgetter(1)
+
+# Brace matching scan used to jump over tables without converting them. Each match runs up to and including the next
+# brace, stepping over strings and comments whole so braces inside them are ignored. A quote without its closing quote
+# and the end of the buffer also end a match (e.g. when scanning a partial buffer).
+SKIP = re.compile(r'[^{}"-]*(?:(?:"[^"\\]*(?:\\.[^"\\]*)*"|--[^\n]*|-)[^{}"-]*)*(?:(\{)|(\})|(")|\Z)', re.DOTALL)
+SKIP_OPEN, SKIP_CLOSE, SKIP_QUOTE = range(1, 4)
+
+# the same expressions for bytes-like buffers (bytes, memoryview, mmap); the lua syntax is all ASCII, so the structure
+# is scanned bytewise and only string literals are decoded
+TOKEN_BYTES = re.compile(TOKEN.pattern.encode('ascii'), re.VERBOSE | re.DOTALL)
+SKIP_BYTES = re.compile(SKIP.pattern.encode('ascii'), re.DOTALL)
+UNESCAPE_BYTES = re.compile(rb'\\(.)', re.DOTALL)
+
+DEFAULT_ENCODING = 'utf-8'
+# for string literals which aren't valid in the encoding, e.g. missions saved by tools using the windows code page
+DEFAULT_FALLBACK_ENCODING = 'cp1252'
+
+# token kinds, as reported by `match.lastindex`
+(
+    KEY_STR, KEY_INT,
+    FIELD_OPEN, FIELD_STR, FIELD_INT, FIELD_FLOAT, FIELD_TRUE, FIELD_FALSE,
+    CLOSE_COMMA, CLOSE, OPEN,
+    STRING, INT, FLOAT, TRUE, FALSE,
+    NAMED, NAME, EQUALS, COMMA, LPAREN, RPAREN, LBRACKET, RBRACKET,
+    EOF, ERROR,
+) = range(1, 27)
+
+
+# placeholder for values left out by a PathFilter
+SKIPPED = object()
+
+
+class PathFilter:
+    """
+    Key path patterns matched against the end of a path, so 'route.points' matches
+    ('mission', 'coalition', 'blue', 'country', 1, 'plane', 'group', 1, 'route', 'points'). `*` matches any key.
+    """
+    def __init__(self, patterns: Iterable[Union[str, tuple]]):
+        # patterns are looked up by their last key
+        self.by_key: Dict[str, List[Tuple[str, ...]]] = {}
+        self.wildcard: List[Tuple[str, ...]] = []
+        for pattern in patterns:
+            keys = tuple(str(key) for key in (pattern.split('.') if isinstance(pattern, str) else pattern))
+            if keys[-1] == '*':
+                self.wildcard.append(keys)
+            else:
+                self.by_key.setdefault(keys[-1], []).append(keys)
+
+    def matches(self, path: tuple) -> bool:
+        patterns = self.by_key.get(str(path[-1]))
+        if patterns is None and not self.wildcard:
+            return False
+        for pattern in (patterns or []) + self.wildcard:
+            if len(pattern) > len(path):
+                continue
+            for wanted, key in zip(pattern, path[-len(pattern):]):
+                if wanted != '*' and wanted != str(key):
+                    break
+            else:
+                return True
+        return False
+
+
+class TokenParser:
+    """
+    Lua table parser which scans the buffer with the compiled TOKEN expression.
+    Strings, numbers and names are sliced out of the buffer instead of being built character by character.
+    The buffer is either a str or bytes-like (bytes, memoryview, mmap); only the string literals of a bytes-like buffer
+    are decoded, with encoding or, failing that, fallback_encoding.
+    """
+    def __init__(self, buffer: Union[str, bytes, memoryview], _globals: Optional[dict] = None,
+                 skip: Optional[Iterable[Union[str, tuple]]] = None, compact: bool = False,
+                 records: Optional[Iterable[Union[str, tuple]]] = None, encoding: str = DEFAULT_ENCODING,
+                 fallback_encoding: str = DEFAULT_FALLBACK_ENCODING):
+        self.buffer: Union[str, bytes, memoryview] = buffer
+        self.binary: bool = not isinstance(buffer, str)
+        if self.binary:
+            self.token_re = TOKEN_BYTES
+            self.skip_re = SKIP_BYTES
+        else:
+            self.token_re = TOKEN
+            self.skip_re = SKIP
+        self.encoding: str = encoding
+        self.fallback_encoding: str = fallback_encoding
+        # decoded table keys of a bytes-like buffer
+        self.keys: Dict[bytes, str] = {}
+        if _globals:
+            self.variables = _globals.copy()
+        else:
+            self.variables = {}
+        self.skip: Optional[PathFilter] = PathFilter(skip) if skip else None
+        # where the token stream continues after a skipped table
+        self.resume: Optional[int] = None
+        self.compact: bool = compact or bool(records)
+        self.records: Optional[PathFilter] = PathFilter(records) if records else None
+
+    def tokens(self, pos: int = 0) -> Iterator:
+        """
+        Token iterator starting at pos
+        """
+        if self.skip is None:
+            return self.token_re.finditer(self.buffer, pos)
+        return self._resumable_tokens(pos)
+
+    def _resumable_tokens(self, pos: int) -> Iterator:
+        # restarts the scan when a table was skipped, so every level of table() sees the jump
+        buf = self.buffer
+        while True:
+            for m in self.token_re.finditer(buf, pos):
+                yield m
+                if self.resume is not None:
+                    pos, self.resume = self.resume, None
+                    break
+            else:
+                return
+
+    def skip_table(self, pos: int) -> None:
+        """
+        Jump over a table body with the SKIP scan, up to and including the closing brace
+        :param pos:
+            position directly after the opening brace
+        """
+        depth = 1
+        for m in self.skip_re.finditer(self.buffer, pos):
+            kind = m.lastindex
+            if kind == SKIP_OPEN:
+                depth += 1
+            elif kind == SKIP_CLOSE:
+                depth -= 1
+                if depth == 0:
+                    self.resume = m.end()
+                    return
+            else:
+                break
+        raise self.eob_exception(len(self.buffer))
+
+    def skipped(self, pos: int, path: tuple) -> Any:
+        """
+        Jump over a table matched by the skip filter
+        :param pos:
+            position directly after the opening brace
+        :param path:
+            keys leading to the table
+        :return:
+            value to use in place of the table, SKIPPED to leave it out
+        """
+        self.skip_table(pos)
+        return SKIPPED
+
+    def parse(self) -> Dict[str, Any]:
+        """
+        Parse every statement in the buffer, assigning the values to variables
+        :return:
+            dict of variable name -> value
+        """
+        it = self.tokens()
+        m = next(it)
+        while True:
+            kind = m.lastindex
+            if kind == EOF:
+                break
+            elif kind == NAMED:
+                names = [self.name(m.group(NAMED))]
+            elif kind == NAME and self.name(m.group(NAME)) == 'local':
+                names = []
+                while True:
+                    m = next(it)
+                    if m.lastindex == NAMED:
+                        names.append(self.name(m.group(NAMED)))
+                        break
+                    elif m.lastindex != NAME:
+                        raise self.unexpected(m)
+                    names.append(self.name(m.group(NAME)))
+                    m = next(it)
+                    if m.lastindex != COMMA:
+                        raise self.unexpected(m)
+            elif kind == NAME and self.name(m.group(NAME)) == 'return':
+                break
+            else:
+                raise self.unexpected(m)
+
+            values = []
+            while True:
+                path = (names[len(values)],) if len(values) < len(names) else ()
+                value, comma = self.value(it, next(it), path)
+                values.append(value)
+                if not comma:
+                    m = next(it)
+                    if m.lastindex != COMMA:
+                        break
+
+            for name, value in zip(names, values):
+                if value is not SKIPPED:
+                    self.variables[name] = value
+
+        return self.variables
+
+    def value(self, it, m, path: tuple = ()) -> Tuple[Any, bool]:
+        """
+        Convert the value starting with the token `m`
+        :param it:
+            token iterator
+        :param m:
+            first token of the value
+        :param path:
+            keys leading to the value
+        :return:
+            value (SKIPPED for a table left out by the skip filter), True if a trailing comma was consumed along with it
+        """
+        kind = m.lastindex
+        if kind == OPEN:
+            if self.skip is not None and path and self.skip.matches(path):
+                return self.skipped(m.end(), path), False
+            if self.compact:
+                d, comma = self.table(it, path)
+                return self.compact_table(d, path), comma
+            return self.table(it, path)
+        elif kind == STRING:
+            return self.literal(m.group(STRING)), False
+        elif kind == INT:
+            return int(m.group(INT)), False
+        elif kind == FLOAT:
+            return self.number(m.group(FLOAT)), False
+        elif kind == TRUE:
+            return True, False
+        elif kind == FALSE:
+            return False, False
+        elif kind == NAME:
+            name = self.name(m.group(NAME))
+            if name == '_':
+                return self.str_function(it), False
+            elif name in self.variables:
+                return self.variables[name], False
+            raise self.error(m.start(NAME), "Unknown variable '{name}'".format(name=name))
+        raise self.unexpected(m)
+
+    def table(self, it, path: tuple = ()) -> Tuple[Dict[Union[int, str], Any], bool]:
+        """
+        Convert a table body, up to and including the closing brace.
+        Nested tables are converted in the same loop, keeping the enclosing tables on a stack, so the nesting depth is
+        not limited by the recursion limit.
+        :param it:
+            token iterator, positioned after the opening brace
+        :param path:
+            keys leading to the table
+        :return:
+            dict, True if the closing brace was followed by a comma
+        """
+        skip = self.skip
+        compact = self.compact
+        binary = self.binary
+        keys = self.keys
+        # paths are only needed to match the filters; building them costs O(depth) per table
+        track = skip is not None or self.records is not None
+        # (table, path, next positional key, key in the table) of every enclosing table
+        stack = []
+        d = {}
+        inc_key = 1
+        # the last value was read without a trailing comma, so a comma or a closing brace has to follow
+        separator = False
+        for m in it:
+            kind = m.lastindex
+            if separator:
+                separator = False
+                if kind == COMMA:
+                    continue
+                elif kind != CLOSE_COMMA and kind != CLOSE:
+                    raise self.unexpected(m)
+
+            if kind <= FIELD_FALSE:
+                # `[key] = value` - the overwhelmingly common case
+                key = m.group(KEY_STR)
+                if key is None:
+                    key = int(m.group(KEY_INT))
+                elif binary:
+                    # the same few keys make up most of a mission, so decode each one once
+                    raw = key
+                    key = keys.get(raw)
+                    if key is None:
+                        key = keys[raw] = self.decode(raw)
+                elif '\\' in key:
+                    key = UNESCAPE.sub(ESCAPED, key)
+
+                if kind == FIELD_STR:
+                    s = m.group(FIELD_STR)
+                    if binary:
+                        d[key] = self.decode(s)
+                    else:
+                        d[key] = UNESCAPE.sub(ESCAPED, s) if '\\' in s else s
+                elif kind == FIELD_INT:
+                    d[key] = int(m.group(FIELD_INT))
+                elif kind == FIELD_FLOAT:
+                    d[key] = self.number(m.group(FIELD_FLOAT))
+                elif kind == FIELD_OPEN:
+                    child = path + (key,) if track else path
+                    if skip is not None and skip.matches(child):
+                        value = self.skipped(m.end(), child)
+                        if value is not SKIPPED:
+                            d[key] = value
+                        separator = True
+                    else:
+                        stack.append((d, path, inc_key, key))
+                        d = {}
+                        path = child
+                        inc_key = 1
+                else:
+                    d[key] = kind == FIELD_TRUE
+                continue
+            elif kind == CLOSE_COMMA or kind == CLOSE:
+                if not stack:
+                    return d, kind == CLOSE_COMMA
+                value = self.compact_table(d, path) if compact else d
+                d, path, inc_key, key = stack.pop()
+                d[key] = value
+                separator = kind == CLOSE
+                continue
+
+            # everything else is converted token by token
+            if kind == LBRACKET:
+                m = next(it)
+                kind = m.lastindex
+                if kind == STRING:
+                    key = self.literal(m.group(STRING))
+                elif kind == INT:
+                    key = int(m.group(INT))
+                elif kind == FLOAT:
+                    key = self.number(m.group(FLOAT))
+                else:
+                    raise self.unexpected(m)
+                if next(it).lastindex != RBRACKET:
+                    raise self.error(m.end(), "Expected character ']'")
+                if next(it).lastindex != EQUALS:
+                    raise self.error(m.end(), "Expected character '='")
+                m = next(it)
+            elif kind == NAMED:
+                key = self.name(m.group(NAMED))
+                m = next(it)
+            else:
+                key = inc_key
+                inc_key += 1
+
+            if m.lastindex == OPEN:
+                child = path + (key,) if track else path
+                if skip is not None and skip.matches(child):
+                    value = self.skipped(m.end(), child)
+                    if value is not SKIPPED:
+                        d[key] = value
+                    separator = True
+                else:
+                    stack.append((d, path, inc_key, key))
+                    d = {}
+                    path = child
+                    inc_key = 1
+                continue
+
+            # tables were handled above, so the path is of no use to value()
+            d[key], comma = self.value(it, m)
+            separator = not comma
+        raise self.eob_exception(len(self.buffer))
+
+    def compact_table(self, d: Dict[Union[int, str], Any], path: tuple) -> Any:
+        """
+        Compact representation of the table at path, see misc.lua.compact
+        """
+        return compact_table(d, self.records is not None and bool(path) and self.records.matches(path))
+
+    def close(self, m) -> bool:
+        """
+        Require the token `m` to close the current table
+        :return:
+            True if the closing brace was followed by a comma
+        """
+        if m.lastindex == CLOSE_COMMA:
+            return True
+        elif m.lastindex == CLOSE:
+            return False
+        raise self.unexpected(m)
+
+    def str_function(self, it) -> str:
+        """
+        Convert a localized string, `_("...")`
+        :param it:
+            token iterator, positioned after the `_`
+        :return:
+            str
+        """
+        m = next(it)
+        if m.lastindex != LPAREN:
+            raise self.unexpected(m)
+        m = next(it)
+        if m.lastindex != STRING:
+            raise self.unexpected(m)
+        s = self.literal(m.group(STRING))
+        m = next(it)
+        if m.lastindex != RPAREN:
+            raise self.unexpected(m)
+        return s
+
+    @staticmethod
+    def string(s: str) -> str:
+        if '\\' in s:
+            return UNESCAPE.sub(ESCAPED, s)
+        return s
+
+    def decode(self, s: bytes) -> str:
+        """
+        Unescape and decode a string literal of a bytes-like buffer
+        """
+        if b'\\' in s:
+            s = UNESCAPE_BYTES.sub(ESCAPED, s)
+        try:
+            return s.decode(self.encoding)
+        except UnicodeDecodeError:
+            return s.decode(self.fallback_encoding, 'replace')
+
+    def literal(self, s: Union[str, bytes]) -> str:
+        """
+        Convert the contents of a string literal
+        """
+        if self.binary:
+            return self.decode(s)
+        return self.string(s)
+
+    def name(self, s: Union[str, bytes]) -> str:
+        """
+        Convert a name (always ASCII)
+        """
+        if self.binary:
+            return s.decode('ascii')
+        return s
+
+    @staticmethod
+    def number(n: str) -> Union[int, float]:
+        num = float(n)
+        if num.is_integer():
+            return int(num)
+        return num
+
+    def lineno(self, pos: int) -> int:
+        if self.binary:
+            return bytes(self.buffer[:pos]).count(b'\n') + 1
+        return self.buffer.count('\n', 0, pos) + 1
+
+    def error(self, pos: int, text: str) -> SyntaxError:
+        se = SyntaxError()
+        se.lineno = self.lineno(pos)
+        se.offset = pos
+        se.text = text
+        return se
+
+    def eob_exception(self, pos: int) -> SyntaxError:
+        return self.error(pos, "Unexpected end of buffer")
+
+    def unexpected(self, m) -> SyntaxError:
+        if m.lastindex == EOF:
+            return self.eob_exception(m.end())
+        token = m.group(m.lastindex)
+        if self.binary:
+            token = token.decode(self.encoding, 'replace')
+        return self.error(m.start(m.lastindex), "Unexpected token '{token}'".format(token=token))
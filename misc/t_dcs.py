@@ -1,5 +1,4 @@
 from bs4 import BeautifulSoup as bs
-import requests
 from flask import render_template
 from PIL import Image, ImageDraw, ImageFont
 import os
@@ -1046,189 +1045,6 @@ class X56Throttle:
             return self.position_mapping[control]
 
 
-class MissionParser:
-    def __init__(self, save_dir=None, last_download_id=None):
-        self.download_base = 'https://www.digitalcombatsimulator.com'
-        if save_dir:
-            self.save_dir = save_dir
-        else:
-            self.save_dir = 'C:\\users\\tim\\downloads\\missions\\ed'
-        if last_download_id:
-            self.last_download_id = last_download_id
-        else:
-            self.last_download_id = '3307006'
-
-    def find_missions(self):
-        # get the number of pages
-        reply = requests.get(
-            'https://www.digitalcombatsimulator.com/en/files/filter/type-is-multiplayer/localization-is-english/sort-is-date_desc/apply/?PAGEN_1={}&PER_PAGE=100'.format(
-                1,
-            )
-        )
-        reply.raise_for_status()
-        soup = bs(reply.text, 'html.parser')
-        entries = bs.findAll(soup, attrs={'class': 'page-link'})[-2]
-        num_pages = int(entries.text)
-        #num_pages = 1
-        last_downloaded_id = None
-        page_size = 100
-
-        print("Found {} pages!".format(num_pages))
-
-        for x in range(1, num_pages + 1):
-            print("Now downloading missions from page {}".format(x))
-            reply = requests.get(
-                'https://www.digitalcombatsimulator.com/en/files/filter/type-is-multiplayer/localization-is-english/sort-is-date_desc/apply/?PAGEN_1={}&PER_PAGE={}'.format(
-                    x,
-                    page_size,
-                )
-            )
-
-            reply.raise_for_status()
-            try:
-                last_downloaded_id = self.download_missions(reply.text)
-            except MemoryError:
-                pass
-            except Exception as e:
-                print("Exception:", e)
-                break
-
-        print("Done downloading all missions!")
-        return last_downloaded_id
-
-    def download_missions(self, results):
-        soup = bs(results, 'html.parser')
-        entries = bs.findAll(soup, attrs={'class': 'download'})
-        last_downloaded_mission = None
-        for entry in entries:
-            print("Downloading mission with ID", entry.attrs['data-id'])
-            url = entry.attrs['href']
-            file_name = url.split('/')[-1]
-            # make a basic attempt at sanitization
-            file_name = file_name.replace('...', '.')
-            file_name = file_name.replace('..', '.')
-            if entry.attrs['data-id'] == self.last_download_id:
-                raise Exception("Found previously downloaded mission - quitting")
-            reply = requests.get(
-                '{}/{}'.format(
-                    self.download_base,
-                    entry.attrs['href']
-                )
-            )
-            reply.raise_for_status()
-            open(
-                os.path.join(
-                    self.save_dir,
-                    file_name
-                ),
-                'wb'
-            ).write(
-                reply.content
-            )
-            last_downloaded_mission = entry.attrs['data-id']
-        return last_downloaded_mission
-
-    @staticmethod
-    def list_missions(path=None):
-        return Path(path).glob('**/*.miz')
-
-    def populate_modules(self):
-        pass
-
-    def __loaddict__(self, fname, mizfile, reserved_files):
-        reserved_files.append(fname)
-        with mizfile.open(fname) as mfile:
-            data = mfile.read()
-            data = data.decode()
-            import lua
-            return lua.loads(data)
-
-    def __load_assets__(self, filename: str):
-        import zipfile
-        with zipfile.ZipFile(filename, 'r') as miz:
-            reserved_files = []
-            try:
-                mission_dict = self.__loaddict__('mission', miz, reserved_files)
-            except SyntaxError:
-                return {}
-        return mission_dict
-
-    def get_file_metadata(self, filename: str):
-        # load assets
-        mission_dict = self.__load_assets__(filename)
-
-        if not mission_dict:
-            print(f"Bad mission: {filename}")
-            return None
-
-        units = {}
-        for col_name in ["blue", "red"]:
-            if col_name in mission_dict['mission']["coalition"]:
-                units[col_name] = {
-                    'aircraft': {},
-                    'slot_count': 0,
-                }
-                for x, country in mission_dict['mission']["coalition"][col_name]['country'].items():
-                    for category_name, category_data in country.items():
-                        if category_name not in ['helicopter', 'vehicle', 'plane']:
-                            continue
-                        for x, group in category_data['group'].items():
-                            for x, unit in group['units'].items():
-                                try:
-                                    skill_level = unit['skill']
-                                except KeyError:
-                                    skill_level = 'Average'
-                                if skill_level == 'Client':
-                                    if unit['type'] not in units[col_name]['aircraft']:
-                                        units[col_name]['aircraft'][unit['type']] = 0
-                                    units[col_name]['aircraft'][unit['type']] += 1
-                                    units[col_name]['slot_count'] += 1
-
-        start_time_day = int(mission_dict['mission']["start_time"] % 86400)
-        hour = int(start_time_day / 3600)
-        minutes = int(start_time_day / 60) - hour * 60
-
-        data = {
-            'map': mission_dict['mission']['theatre'],
-            'time': "{:02d}:{:02d}".format(hour, minutes),
-            'format': mission_dict['mission']['version'],
-            'factions': units,
-        }
-
-        return data
-
-    def parse_mission(self, mission_name):
-        raw_data = {
-            'factions': {
-                'blue': {
-                    'slot_count': 0,
-                    'aircraft': {},
-                },
-                'red': {
-                    'slot_count': 0,
-                    'aircraft': {},
-                },
-            },
-            'map': 'unknown',
-            'time': 'unknown',
-            'meets_filter': False,
-            'format': 'unknown',
-        }
-        skip = []
-        if str(mission_name) in skip:
-            return raw_data
-
-        try:
-            data = self.get_file_metadata(str(mission_name))
-            if not data:
-                return raw_data
-        except UnicodeDecodeError:
-            print(f"Unable to parse {mission_name}: unicode error")
-            return raw_data
-        data['meets_filter'] = False
-        return data
-
-
 class MissionSearcher:
     def __init__(self, pilot_mapping, slots):
         """
@@ -1250,68 +1066,208 @@ class MissionSearcher:
         self.state = {x: None for x in pilot_mapping.keys()}
         self.pilot_mapping = pilot_mapping
 
+    def fits(self):
+        """
+        Determine if every pilot can be given a slot, without finding out who gets which one
+        Pilots who own the same modules are interchangeable, so they are grouped and the groups are seated as a max flow
+        (groups -> modules -> slots): greedily at first, then along augmenting paths which move already seated groups
+        to other modules they own. Cheaper than solve, which has to seat each pilot
+        """
+        groups = {}
+        for modules in self.pilot_mapping.values():
+            group = frozenset(x for x in modules if self.slots.get(x, 0) > 0)
+            if not group:
+                # a pilot with none of the mission's modules
+                return False
+            groups[group] = groups.get(group, 0) + 1
+        if sum(groups.values()) > sum(self.slots.values()):
+            return False
+
+        free = dict(self.slots)
+        # module -> {group: pilots of the group seated in it}
+        seated = {x: {} for x in self.slots}
+        waiting = {}
+        # the groups with the fewest modules have the fewest options; seat them first
+        for group in sorted(groups, key=len):
+            need = groups[group]
+            for module in group:
+                count = min(need, free[module])
+                if count:
+                    seated[module][group] = seated[module].get(group, 0) + count
+                    free[module] -= count
+                    need -= count
+            if need:
+                waiting[group] = need
+
+        for group, need in waiting.items():
+            while need:
+                moved = self.augment(group, need, free, seated)
+                if not moved:
+                    # no way to make room for the group's remaining pilots
+                    return False
+                need -= moved
+        return True
+
+    @staticmethod
+    def augment(start, need, free, seated):
+        """
+        Find a chain of moves which seats more pilots of the start group (breadth first: start -> a module it owns,
+        whose pilots move to another module they own, and so on until a module with a free slot) and apply it
+        :return:
+            INT pilots of the start group seated, 0 if there is no such chain
+        """
+        parents = {start: None}
+        queue = [start]
+        for group in queue:
+            for module in group:
+                if module in parents:
+                    continue
+                parents[module] = group
+                if free[module]:
+                    return MissionSearcher.apply_path(module, need, free, seated, parents)
+                for other in seated[module]:
+                    if other not in parents:
+                        parents[other] = module
+                        queue.append(other)
+        return 0
+
+    @staticmethod
+    def apply_path(end, need, free, seated, parents):
+        # walk back from the free slot: each group on the path takes a seat in the module after it, leaving one in
+        # the module it came from
+        path = []
+        module = end
+        while module is not None:
+            group = parents[module]
+            path.append((group, module))
+            module = parents[group]
+        count = min([need, free[end]] + [seated[parents[group]][group] for group, _ in path[:-1]])
+        free[end] -= count
+        for group, module in path:
+            seated[module][group] = seated[module].get(group, 0) + count
+            left = parents[group]
+            if left is not None:
+                seated[left][group] -= count
+                if not seated[left][group]:
+                    del seated[left][group]
+        return count
+
     def solve(self, pilots):
         """
+        Seat as many pilots as possible, filling in pilots; the ones who couldn't be seated are left as None and listed
+        in self.unseated
         pilots
         {
             "pokej6": "A-10C",
             "wrycu": None,
             ...
         }
+        Pilots who already have a module keep it
+        Returns True if every pilot was seated
         """
-        try:
-            pilot = self.find_empty(pilots)
-        except IndexError:
-            return True
-        for module in self.pilot_mapping[pilot]:
-            if self.valid(pilots, module):
-                pilots[pilot] = module
-                # we've made an assignment; see if we've solved everything
-                if self.solve(pilots):
-                    return True
-                # did not work - back out the change
-                pilots[pilot] = None
-        return False
+        assignment, self.unseated = self.assign(pilots)
+        pilots.update(assignment)
+        self.state = dict(pilots)
+        return not self.unseated
 
-    def find_empty(self, pilots):
+    def assign(self, pilots):
         """
-        Find a pilot associated with None
-        Raises an exception if all pilots are assigned
+        Maximum assignment of pilots to slots, as a matching between pilots and modules where each module takes as many
+        pilots as it has slots (Hopcroft-Karp): each phase finds, breadth first, the shortest chains of moves which
+        seat a waiting pilot, then applies as many of them as it can, depth first. Polynomial in the number of pilots
+        and modules, however the roster is made up
+        :param pilots:
+            DICT of pilot -> module they already have, or None
+        :return:
+            (DICT of pilot -> module, None if not seated; LIST of the pilots who could not be seated)
         """
-        return [x for x in pilots.keys() if not pilots[x]][0]
+        free = dict(self.slots)
+        for module in pilots.values():
+            if module:
+                free[module] = free.get(module, 0) - 1
+        # module -> the pilots seated in it here (pilots who came with a module are not moved)
+        seated = {x: [] for x in free}
+        assignment = {}
+        options = {}
+        for pilot, module in pilots.items():
+            if not module:
+                assignment[pilot] = None
+                options[pilot] = [x for x in dict.fromkeys(self.pilot_mapping[pilot]) if self.slots.get(x, 0) > 0]
+
+        # the pilots with the fewest modules have the fewest options; seat them greedily first
+        for pilot in sorted(options, key=lambda x: len(options[x])):
+            for module in options[pilot]:
+                if free[module] > 0:
+                    self.seat(pilot, module, assignment, free, seated)
+                    break
+
+        while True:
+            waiting = [x for x in options if assignment[x] is None]
+            layers = self.layers(waiting, options, free, seated)
+            if layers is None:
+                break
+            for pilot in waiting:
+                self.move(pilot, layers, options, assignment, free, seated)
+        return assignment, [x for x in options if assignment[x] is None]
 
-    def valid(self, pilots, module):
+    @staticmethod
+    def layers(waiting, options, free, seated):
         """
-        Given an existing mapping of pilots to modules, determine if a new nominated mapping results in an invalid state
+        Breadth first search from the waiting pilots: a pilot's layer is the number of seated pilots who'd have to
+        move before they could be seated. The search stops at the first layer with a module with a free slot
+        :return:
+            DICT of pilot -> layer, None if no more pilots can be seated
         """
-        assigned_count = 0
-        for slot in pilots.values():
-            if slot == module:
-                assigned_count += 1
-        if module not in self.slots or assigned_count + 1 > self.slots[module]:
-            return False
-        else:
-            return True
+        layer = {x: 0 for x in waiting}
+        queue = list(waiting)
+        last = None
+        for pilot in queue:
+            if last is not None and layer[pilot] >= last:
+                break
+            for module in options[pilot]:
+                if free[module] > 0:
+                    last = layer[pilot]
+                elif last is None:
+                    for other in seated[module]:
+                        if other not in layer:
+                            layer[other] = layer[pilot] + 1
+                            queue.append(other)
+        return layer if last is not None else None
+
+    def move(self, pilot, layers, options, assignment, free, seated):
+        """
+        Depth first along the layers: seat the pilot in a module with a free slot, or in one whose pilot can move on
+        :return:
+            BOOL whether the pilot was seated
+        """
+        for module in options[pilot]:
+            if free[module] > 0:
+                self.seat(pilot, module, assignment, free, seated)
+                return True
+        for module in options[pilot]:
+            for other in list(seated[module]):
+                if layers.get(other) == layers[pilot] + 1 and self.move(other, layers, options, assignment, free, seated):
+                    # other moved out of the module, leaving a slot
+                    self.seat(pilot, module, assignment, free, seated)
+                    return True
+        # a dead end for the rest of the phase
+        layers[pilot] = None
+        return False
+
+    @staticmethod
+    def seat(pilot, module, assignment, free, seated):
+        previous = assignment[pilot]
+        if previous is not None:
+            seated[previous].remove(pilot)
+            free[previous] += 1
+        assignment[pilot] = module
+        seated[module].append(pilot)
+        free[module] -= 1
 
 
 if __name__ == '__main__':
-    from configparser import ConfigParser
-    config_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, 'config.ini')
-    config = ConfigParser()
-    config.read(config_dir)
-
-    last_downloaded = config.get('dcs', 'last_downloaded')
-    if last_downloaded != 0:
-        m_parse = MissionParser(
-            config.get('dcs', 'mission_path'),
-            last_downloaded,
-        )
-    else:
-        m_parse = MissionParser(
-            config.get('dcs', 'mission_path'),
-        )
-    last_downloaded = m_parse.find_missions()
-    if last_downloaded:
-        config.set('dcs', 'last_downloaded', str(last_downloaded))
-        with open(config_dir, 'w') as f:
-            config.write(f)
+    # missions from the ED website are ingested straight into the DB now, see misc/ingest.py
+    import sys
+    sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir))
+    from misc.ingest import main
+    main(['--source', 'ed'] + sys.argv[1:])